@@ -25,8 +25,14 @@ with DAG(
     
     def sync_artifact_to_s3_bucket(**kwargs):
         bucket_name = os.getenv("BUCKET_NAME")
-        os.system(f"aws s3 sync /app/artifact s3://{bucket_name}/artifacts")
+        # run directories are trees of content addressed objects, objects never change so
+        # only those new since the last sync are uploaded. BlobStore.checkout restores a run
+        os.system(f"aws s3 sync /app/blob_store s3://{bucket_name}/blob_store")
         os.system(f"aws s3 sync /app/saved_models s3://{bucket_name}/saved_models")
+        os.system(f"aws s3 sync /app/feature_store s3://{bucket_name}/feature_store")
+
+    def prune_local_runs(**kwargs):
+        os.system("cd /app && python prune.py")
 
     training_pipeline  = PythonOperator(
             task_id="train_pipeline",
@@ -40,4 +46,10 @@ with DAG(
 
     )
 
-    training_pipeline >> sync_data_to_s3
\ No newline at end of file
+    prune_runs = PythonOperator(
+            task_id="prune_runs",
+            python_callable=prune_local_runs
+
+    )
+
+    training_pipeline >> sync_data_to_s3 >> prune_runs
\ No newline at end of file
@@ -0,0 +1,86 @@
+"""
+Column by column scipy.stats.ks_2samp against the vectorized drift engine on APS
+sized data (60000 base rows, 48000 current rows, 170 sensor columns), and the
+approximate statistic of the quantile sketches used by the "sketch" drift mode.
+--calibration-rows also sketches two samples of that many rows drawn from the same
+distribution : about 5% of the columns should get a p-value below 0.05
+
+python -m benchmark.drift --base-rows 60000 --current-rows 48000
+python -m benchmark.drift --calibration-rows 1000000 --calibration-columns 20
+"""
+import argparse
+import time
+
+import numpy as np
+
+from sensor import drift
+from sensor.config import TARGET_COLUMN
+from benchmark.synthetic_data import generate_sensor_dataframe
+
+
+def calibrate_sketches(n_rows:int,n_columns:int,capacity:int,batch_size:int,seed:int=0)->np.ndarray:
+    """
+    Sketch p-values of two same distribution samples, one per column
+    """
+    random_state=np.random.default_rng(seed)
+    columns=[f"sensor_{column:03d}" for column in range(n_columns)]
+    sketches=[]
+    for sketch_seed in range(2):
+        sketch=drift.QuantileSketch(columns=columns,capacity=capacity,seed=sketch_seed)
+        for row in range(0,n_rows,batch_size):
+            sketch.update(random_state.lognormal(size=(min(batch_size,n_rows-row),n_columns)))
+        sketches.append(sketch)
+    return drift.ks_2samp_sketches(sketches[0],sketches[1],columns)[1]
+
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser()
+    parser.add_argument("--base-rows",type=int,default=60000)
+    parser.add_argument("--current-rows",type=int,default=48000)
+    parser.add_argument("--n-jobs",type=int,default=None)
+    parser.add_argument("--sketch-capacity",type=int,default=2048)
+    parser.add_argument("--batch-size",type=int,default=50000)
+    parser.add_argument("--calibration-rows",type=int,default=0)
+    parser.add_argument("--calibration-columns",type=int,default=20)
+    parser.add_argument("--calibration-repeat",type=int,default=5)
+    args=parser.parse_args()
+
+    from scipy.stats import ks_2samp
+    base=generate_sensor_dataframe(n_rows=args.base_rows,seed=1).drop(TARGET_COLUMN,axis=1).to_numpy()
+    current=generate_sensor_dataframe(n_rows=args.current_rows,seed=2).drop(TARGET_COLUMN,axis=1).to_numpy()
+
+    start=time.perf_counter()
+    loop_results=[]
+    for column in range(base.shape[1]):
+        base_column,current_column=base[:,column],current[:,column]
+        loop_results.append(ks_2samp(base_column[~np.isnan(base_column)],current_column[~np.isnan(current_column)]))
+    loop_time=time.perf_counter()-start
+
+    start=time.perf_counter()
+    statistics,pvalues=drift.ks_2samp_columns(base,current,n_jobs=args.n_jobs)
+    engine_time=time.perf_counter()-start
+
+    columns=[f"sensor_{column:03d}" for column in range(base.shape[1])]
+    start=time.perf_counter()
+    base_sketch=drift.QuantileSketch(columns=columns,capacity=args.sketch_capacity)
+    for row in range(0,base.shape[0],args.batch_size):
+        base_sketch.update(base[row:row+args.batch_size])
+    current_sketch=drift.QuantileSketch(columns=columns,capacity=args.sketch_capacity)
+    for row in range(0,current.shape[0],args.batch_size):
+        current_sketch.update(current[row:row+args.batch_size])
+    sketch_statistics,_=drift.ks_2samp_sketches(base_sketch,current_sketch,columns)
+    sketch_time=time.perf_counter()-start
+
+    print(f"base {base.shape} current {current.shape}")
+    print(f"ks_2samp loop : {loop_time:.2f}s")
+    print(f"drift engine  : {engine_time:.2f}s ({loop_time/engine_time:.1f}x)")
+    print(f"max |statistic diff| : {np.max(np.abs(statistics-[result.statistic for result in loop_results])):.2e}")
+    print(f"max |pvalue diff|    : {np.max(np.abs(pvalues-[result.pvalue for result in loop_results])):.2e}")
+    print(f"sketches      : {sketch_time:.2f}s")
+    print(f"max |sketch statistic diff| : {np.max(np.abs(sketch_statistics-statistics)):.2e}")
+
+    if args.calibration_rows>0:
+        pvalues=np.concatenate([calibrate_sketches(args.calibration_rows,args.calibration_columns,args.sketch_capacity,args.batch_size,seed=seed)
+                                for seed in range(args.calibration_repeat)])
+        print(f"same distribution, {args.calibration_rows} rows : {np.mean(pvalues<0.05):.1%} of {len(pvalues)} columns with p < 0.05, "
+              f"{np.mean(pvalues<0.01):.1%} with p < 0.01")
@@ -0,0 +1,53 @@
+"""
+Compares the raw csv feature store (read_csv + replace("na") + convert_columns_float)
+with the typed parquet feature store on APS shaped data
+
+python -m benchmark.feature_store_format --rows 60000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from sensor import utils
+from sensor.config import TARGET_COLUMN
+from sensor.schema import APS_SCHEMA
+from benchmark.synthetic_data import generate_sensor_dataframe
+
+
+def time_it(func):
+    start=time.perf_counter()
+    result=func()
+    return time.perf_counter()-start,result
+
+
+def read_raw_csv(file_path:str)->pd.DataFrame:
+    df=pd.read_csv(file_path)
+    df.replace("na",np.nan,inplace=True)
+    return utils.convert_columns_float(df=df,exclude_columns=[TARGET_COLUMN])
+
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser()
+    parser.add_argument("--rows",type=int,default=60000)
+    args=parser.parse_args()
+
+    df=generate_sensor_dataframe(n_rows=args.rows)
+    typed_df=APS_SCHEMA.cast(df.copy())
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path=os.path.join(tmp_dir,"sensor.csv")
+        parquet_path=os.path.join(tmp_dir,"sensor.parquet")
+
+        csv_write,_=time_it(lambda:df.to_csv(csv_path,index=False,header=True,na_rep="na"))
+        csv_read,_=time_it(lambda:read_raw_csv(csv_path))
+        parquet_write,_=time_it(lambda:utils.write_dataset(typed_df,parquet_path))
+        parquet_read,_=time_it(lambda:utils.read_dataset(parquet_path))
+
+        print(f"rows : {args.rows}")
+        print(f"{'format':<10}{'write (s)':>12}{'read (s)':>12}{'size (MB)':>12}")
+        for name,write_time,read_time,file_path in [("csv",csv_write,csv_read,csv_path),
+                                                    ("parquet",parquet_write,parquet_read,parquet_path)]:
+            print(f"{name:<10}{write_time:>12.3f}{read_time:>12.3f}{os.path.getsize(file_path)/2**20:>12.1f}")
@@ -0,0 +1,64 @@
+"""
+Startup regression budget : imports every module below in a fresh interpreter with
+python -X importtime and fails when a module exceeds its budget or pulls in one of
+the heavy libraries that must only be loaded when a stage runs
+
+python -m benchmark.import_time
+"""
+import re
+import subprocess
+import sys
+
+# cumulative import time budget in milliseconds
+IMPORT_BUDGETS_MS={
+    "sensor":50,
+    "sensor.pipeline.batch_prediction":150,
+    "sensor.pipeline.training_pipeline":150,
+    "sensor.predictor":150,
+    "sensor.utils":1000,
+    "sensor.components.data_ingestion":1000,
+    "sensor.components.data_validation":1000,
+    "sensor.components.data_transformation":1000,
+    "sensor.components.model_trainer":1000,
+    "sensor.components.model_evaluation":1000,
+    "sensor.components.model_pusher":1000,
+}
+
+HEAVY_MODULES=["sklearn","imblearn","xgboost","scipy","pymongo","bson"]
+
+IMPORT_TIME_PATTERN=re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s+)(\S+)")
+
+
+def measure_import(module_name:str):
+    """
+    Returns the cumulative import time of module_name in milliseconds and the top
+    level packages it imported
+    """
+    result=subprocess.run([sys.executable,"-X","importtime","-c",f"import {module_name}"],
+                          capture_output=True,text=True,check=True)
+    cumulative_us=0
+    imported_packages=set()
+    for line in result.stderr.splitlines():
+        match=IMPORT_TIME_PATTERN.match(line)
+        if match is None:
+            continue
+        imported_packages.add(match.group(4).split(".")[0])
+        if match.group(4)==module_name:
+            cumulative_us=int(match.group(2))
+    return cumulative_us/1000,imported_packages
+
+
+if __name__=="__main__":
+    failures=[]
+    print(f"{'module':<42}{'ms':>8}{'budget':>8}  heavy imports")
+    for module_name,budget_ms in IMPORT_BUDGETS_MS.items():
+        import_ms,imported_packages=measure_import(module_name)
+        heavy_imports=sorted(imported_packages.intersection(HEAVY_MODULES))
+        print(f"{module_name:<42}{import_ms:>8.0f}{budget_ms:>8}  {','.join(heavy_imports)}")
+        if import_ms>budget_ms:
+            failures.append(f"{module_name} took {import_ms:.0f}ms, budget is {budget_ms}ms")
+        if len(heavy_imports)>0:
+            failures.append(f"{module_name} imports {heavy_imports} at import time")
+    for failure in failures:
+        print(f"FAILED : {failure}")
+    sys.exit(1 if len(failures)>0 else 0)
@@ -0,0 +1,49 @@
+"""
+Compares the fitted imputer + scaler pipeline with the FastTransformer compiled from it
+at several batch sizes : time per batch, rows per second, and whether both outputs are
+identical
+
+python -m benchmark.inference_transformer --rows 20000
+"""
+import argparse
+import time
+
+import numpy as np
+from sklearn.impute import SimpleImputer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import RobustScaler
+
+from sensor.config import TARGET_COLUMN
+from sensor.inference import FastTransformer
+from benchmark.synthetic_data import generate_sensor_dataframe
+
+
+def measure(transform_func,df,repeat:int)->float:
+    times=[]
+    for _ in range(repeat):
+        start=time.perf_counter()
+        transform_func(df)
+        times.append(time.perf_counter()-start)
+    return min(times)
+
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser()
+    parser.add_argument("--rows",type=int,default=20000)
+    parser.add_argument("--batch-sizes",type=int,nargs="+",default=[1,100,1000,10000])
+    parser.add_argument("--repeat",type=int,default=20)
+    args=parser.parse_args()
+
+    df=generate_sensor_dataframe(n_rows=args.rows).drop(TARGET_COLUMN,axis=1).astype(np.float32)
+    pipeline=Pipeline(steps=[("Imputer",SimpleImputer(strategy="constant",fill_value=0)),
+                             ("RobustScaler",RobustScaler())]).fit(df)
+    transformer=FastTransformer.from_pipeline(pipeline)
+
+    print(f"{'batch size':>10}{'sklearn (ms)':>14}{'fused (ms)':>12}{'speedup':>9}{'fused rows/s':>14}{'identical':>11}")
+    for batch_size in args.batch_sizes:
+        batch=df.iloc[:batch_size]
+        sklearn_time=measure(pipeline.transform,batch,args.repeat)
+        fused_time=measure(transformer.transform,batch,args.repeat)
+        identical=np.array_equal(pipeline.transform(batch),transformer.transform(batch))
+        print(f"{batch_size:>10}{sklearn_time*1000:>14.2f}{fused_time*1000:>12.2f}{sklearn_time/fused_time:>9.1f}"
+              f"{batch_size/fused_time:>14.0f}{str(identical):>11}")
@@ -0,0 +1,112 @@
+"""
+Cold load of a trained model for prediction : the three dill pickles (transformer.pkl,
+model.pkl, target_encoder.pkl) against the single model bundle. Every load runs in a
+fresh interpreter (page cache warm), timing the imports of the libraries the objects
+need, the load itself and the whole process. Then in process warm loads, file sizes
+and whether both predict the same
+
+python -m benchmark.model_bundle --rows 20000 --trees 300
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from sklearn.impute import SimpleImputer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import LabelEncoder,RobustScaler
+from xgboost import XGBClassifier
+
+from sensor.bundle import ModelBundle
+from sensor.config import TARGET_COLUMN
+from sensor.utils import load_object,save_object
+from benchmark.synthetic_data import generate_sensor_dataframe
+
+REPO_DIR=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# each prints the seconds spent importing the libraries its objects need and loading
+PICKLES_LOADER="""
+import sys,time
+start=time.perf_counter()
+import dill,xgboost,sklearn.pipeline,sklearn.impute,sklearn.preprocessing
+imported=time.perf_counter()
+for file_path in sys.argv[1:]:
+    with open(file_path,"rb") as file_obj:
+        dill.load(file_obj)
+print(imported-start,time.perf_counter()-imported)
+"""
+BUNDLE_LOADER="""
+import sys,time
+start=time.perf_counter()
+import xgboost
+from sensor.bundle import ModelBundle
+imported=time.perf_counter()
+ModelBundle.load(sys.argv[1])
+print(imported-start,time.perf_counter()-imported)
+"""
+
+
+def measure_cold(loader:str,file_paths:list,repeat:int)->tuple:
+    """
+    Median (import seconds, load seconds, process seconds) over repeat fresh interpreters
+    """
+    results=[]
+    for _ in range(repeat):
+        start=time.perf_counter()
+        output=subprocess.run([sys.executable,"-c",loader,*file_paths],cwd=REPO_DIR,capture_output=True,text=True,check=True).stdout
+        process_seconds=time.perf_counter()-start
+        import_seconds,load_seconds=map(float,output.split())
+        results.append((import_seconds,load_seconds,process_seconds))
+    return tuple(np.median(np.array(results),axis=0))
+
+
+def measure_warm(load_func,repeat:int)->float:
+    times=[]
+    for _ in range(repeat):
+        start=time.perf_counter()
+        load_func()
+        times.append(time.perf_counter()-start)
+    return min(times)
+
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser()
+    parser.add_argument("--rows",type=int,default=20000)
+    parser.add_argument("--trees",type=int,default=300)
+    parser.add_argument("--repeat",type=int,default=5)
+    args=parser.parse_args()
+
+    df=generate_sensor_dataframe(n_rows=args.rows,signal=1.5)
+    X=df.drop(TARGET_COLUMN,axis=1).astype(np.float32)
+    target_encoder=LabelEncoder().fit(df[TARGET_COLUMN])
+    transformer=Pipeline(steps=[("Imputer",SimpleImputer(strategy="constant",fill_value=0)),
+                                ("RobustScaler",RobustScaler())]).fit(X)
+    model=XGBClassifier(n_estimators=args.trees).fit(transformer.transform(X),target_encoder.transform(df[TARGET_COLUMN]))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pickle_paths=[os.path.join(tmp_dir,file_name) for file_name in ("transformer.pkl","model.pkl","target_encoder.pkl")]
+        for file_path,obj in zip(pickle_paths,(transformer,model,target_encoder)):
+            save_object(file_path=file_path,obj=obj)
+        bundle_path=os.path.join(tmp_dir,"model.bundle")
+        ModelBundle.from_objects(model=model,transformer=transformer,target_encoder=target_encoder).save(bundle_path)
+
+        pickles_cold=measure_cold(PICKLES_LOADER,pickle_paths,args.repeat)
+        bundle_cold=measure_cold(BUNDLE_LOADER,[bundle_path],args.repeat)
+        pickles_warm=measure_warm(lambda:[load_object(file_path) for file_path in pickle_paths],args.repeat)
+        bundle_warm=measure_warm(lambda:ModelBundle.load(bundle_path),args.repeat)
+        pickles_size=sum(os.path.getsize(file_path) for file_path in pickle_paths)
+        bundle_size=os.path.getsize(bundle_path)
+
+        loaded_transformer,loaded_model,loaded_encoder=[load_object(file_path) for file_path in pickle_paths]
+        expected=loaded_encoder.inverse_transform(loaded_model.predict(loaded_transformer.transform(X)))
+        bundle=ModelBundle.load(bundle_path)
+        identical=np.array_equal(expected,bundle.inverse_transform(bundle.predict(X)))
+
+    print(f"{args.trees} trees, {X.shape[1]} features")
+    print(f"{'format':<10}{'import (ms)':>13}{'cold load (ms)':>16}{'process (ms)':>14}{'warm load (ms)':>16}{'size (KB)':>11}")
+    for name,cold,warm,size in [("pickles",pickles_cold,pickles_warm,pickles_size),("bundle",bundle_cold,bundle_warm,bundle_size)]:
+        print(f"{name:<10}{cold[0]*1000:>13.1f}{cold[1]*1000:>16.1f}{cold[2]*1000:>14.0f}{warm*1000:>16.2f}{size/1024:>11.1f}")
+    print(f"identical predictions : {identical}")
@@ -0,0 +1,60 @@
+"""
+Throughput of the parallel range export for 1..N workers
+
+Runs against the mongod given by --mongo-url (a scratch collection is created and
+dropped) or, without it, against an in-process mongomock stand-in (pip install -r
+benchmark/requirements.txt)
+
+python -m benchmark.parallel_export --rows 50000 --max-workers 8
+"""
+import argparse
+import time
+
+from sensor import utils
+from sensor.config import get_mongo_client,set_mongo_client
+from benchmark.synthetic_data import generate_sensor_dataframe
+
+DATABASE_NAME="aps_benchmark"
+COLLECTION_NAME="sensor"
+
+
+def get_client(mongo_url:str):
+    if mongo_url:
+        import pymongo
+        return pymongo.MongoClient(mongo_url)
+    import mongomock
+    return mongomock.MongoClient()
+
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser()
+    parser.add_argument("--rows",type=int,default=50000)
+    parser.add_argument("--max-workers",type=int,default=8)
+    parser.add_argument("--batch-size",type=int,default=10000)
+    parser.add_argument("--mongo-url",default=None)
+    args=parser.parse_args()
+
+    set_mongo_client(get_client(args.mongo_url))
+    collection=get_mongo_client()[DATABASE_NAME][COLLECTION_NAME]
+    collection.drop()
+    df=generate_sensor_dataframe(n_rows=args.rows)
+    records=df.astype(object).where(df.notna(),"na").to_dict("records")
+    collection.insert_many(records)
+    del df,records
+
+    try:
+        print(f"rows : {args.rows} batch size : {args.batch_size}")
+        print(f"{'workers':<10}{'seconds':>10}{'rows/sec':>12}")
+        n_workers=1
+        while n_workers<=args.max_workers:
+            start=time.perf_counter()
+            exported_df=utils.get_collection_as_dataframe_parallel(database_name=DATABASE_NAME,
+                                                                   collection_name=COLLECTION_NAME,
+                                                                   n_workers=n_workers,
+                                                                   batch_size=args.batch_size)
+            elapsed=time.perf_counter()-start
+            assert len(exported_df)==args.rows
+            print(f"{n_workers:<10}{elapsed:>10.2f}{args.rows/elapsed:>12.0f}")
+            n_workers*=2
+    finally:
+        collection.drop()
@@ -0,0 +1,53 @@
+"""
+Wall time of every resampling strategy and the F1 score of an XGBoost model trained
+on its output, measured on a test set which is never resampled
+
+python -m benchmark.resampling --rows 60000 --n-jobs -1
+"""
+import argparse
+import time
+
+import numpy as np
+
+from sensor import resampling
+from sensor.config import TARGET_COLUMN
+from sensor.components.data_transformation import DataTransformation
+from benchmark.synthetic_data import generate_sensor_dataframe
+
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser()
+    parser.add_argument("--rows",type=int,default=60000)
+    parser.add_argument("--signal",type=float,default=1.0)
+    parser.add_argument("--n-jobs",type=int,default=-1)
+    parser.add_argument("--n-components",type=int,default=8)
+    parser.add_argument("--strategies",nargs="+",default=list(resampling.RESAMPLING_STRATEGIES))
+    args=parser.parse_args()
+
+    from sklearn.metrics import f1_score
+    from xgboost import XGBClassifier
+
+    df=generate_sensor_dataframe(n_rows=args.rows,signal=args.signal)
+    y=(df.pop(TARGET_COLUMN)=="pos").to_numpy(dtype=np.uint8)
+    n_train=int(len(y)*0.8)
+    pipeline=DataTransformation.get_data_transformer_object()
+    X_train=pipeline.fit_transform(df.iloc[:n_train]).astype(np.float32)
+    X_test=pipeline.transform(df.iloc[n_train:]).astype(np.float32)
+    y_train,y_test=y[:n_train],y[n_train:]
+
+    print(f"train {X_train.shape} positives {int(y_train.sum())} test {X_test.shape}")
+    print(f"{'strategy':<26}{'resample (s)':>14}{'rows':>10}{'fit (s)':>10}{'test f1':>10}")
+    for strategy in args.strategies:
+        start=time.perf_counter()
+        X,y_resampled,class_weights=resampling.resample(X_train,y_train,strategy=strategy,
+                                                        n_jobs=args.n_jobs,n_components=args.n_components)
+        resample_time=time.perf_counter()-start
+
+        sample_weight=None
+        if class_weights is not None:
+            sample_weight=np.array([class_weights[label] for label in range(len(class_weights))])[y_resampled]
+        start=time.perf_counter()
+        model=XGBClassifier().fit(X,y_resampled,sample_weight=sample_weight)
+        fit_time=time.perf_counter()-start
+        test_f1=f1_score(y_test,model.predict(X_test))
+        print(f"{strategy:<26}{resample_time:>14.2f}{len(y_resampled):>10}{fit_time:>10.2f}{test_f1:>10.3f}")
@@ -0,0 +1,212 @@
+"""
+Per stage benchmark of the pipeline components on synthetic APS shaped data : wall
+time, peak resident memory and throughput of DataIngestion (from an in-process
+mongomock stand-in, or a local mongod with --mongo-url), DataValidation,
+DataTransformation, Model_trainer and start_batch_prediction. Results are written to
+a JSON file tagged with the git commit, two files are compared with --compare. The
+mongomock stand-in needs the packages of benchmark/requirements.txt
+
+python -m benchmark.suite --rows 10000 100000 --output benchmark_results/suite.json
+python -m benchmark.suite --compare benchmark_results/before.json benchmark_results/after.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+from benchmark.synthetic_data import iter_sensor_dataframes,write_sensor_dataset
+
+STAGES=("ingestion","validation","transformation","training","prediction")
+REPO_DIR=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_git_commit()->str:
+    try:
+        return subprocess.run(["git","rev-parse","--short","HEAD"],cwd=REPO_DIR,capture_output=True,text=True,check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def load_stand_in(collection,n_rows:int,seed:int,signal:float)->None:
+    """
+    Inserts the generated rows as documents, missing values stored as "na" like the
+    documents loaded from the APS csv
+    """
+    collection.drop()
+    for df in iter_sensor_dataframes(n_rows=n_rows,seed=seed,signal=signal):
+        collection.insert_many(df.astype(object).where(df.notna(),"na").to_dict("records"))
+
+
+def run_suite(n_rows:int,stages:list,args)->dict:
+    """
+    Runs the components in pipeline order up to the last requested stage inside a
+    fresh working directory, returns the measures of the requested stages
+    """
+    from sensor.config import set_mongo_client
+    from sensor.profiling import StageProfiler
+    from sensor.entity import config_entity
+
+    last_stage=max(STAGES.index(stage) for stage in stages)
+    profiler=StageProfiler()
+    n_stage_rows=dict()
+    with tempfile.TemporaryDirectory(dir=args.work_dir) as work_dir:
+        cwd=os.getcwd()
+        os.chdir(work_dir)
+        try:
+            if args.mongo_url is None:
+                import mongomock
+                client=mongomock.MongoClient()
+            else:
+                import pymongo
+                client=pymongo.MongoClient(args.mongo_url)
+            set_mongo_client(client)
+            training_pipeline_config=config_entity.TrainingPipelineConfig()
+            data_ingestion_config=config_entity.DataIngestionConfig(training_pipeline_config)
+            data_ingestion_config.database_name=args.database_name
+            data_ingestion_config.ingestion_mode=args.ingestion_mode
+            load_stand_in(client[args.database_name][data_ingestion_config.collection_name],n_rows,seed=42,signal=args.signal)
+
+            from sensor.components.data_ingestion import DataIngestion
+            with profiler.stage("ingestion"):
+                data_ingestion_artifact=DataIngestion(data_ingestion_config=data_ingestion_config).initiate_data_ingestion()
+            n_stage_rows["ingestion"]=n_rows
+
+            if last_stage>=STAGES.index("validation"):
+                from sensor.components.data_validation import DataValidation
+                data_validation_config=config_entity.DataValidationConfig(training_pipeline_config=training_pipeline_config)
+                data_validation_config.drift_mode=args.drift_mode
+                write_sensor_dataset(data_validation_config.base_file_path,n_rows=min(n_rows,args.base_rows),seed=7,signal=args.signal)
+                with profiler.stage("validation"):
+                    DataValidation(data_validation_config=data_validation_config,
+                                   data_ingestion_artifact=data_ingestion_artifact).initiate_data_validation()
+                n_stage_rows["validation"]=n_rows
+
+            if last_stage>=STAGES.index("transformation"):
+                from sensor.components.data_transformation import DataTransformation
+                data_transformation_config=config_entity.DataTransformationConfig(training_pipeline_config=training_pipeline_config)
+                if args.resampling_strategy is not None:
+                    data_transformation_config.resampling_strategy=args.resampling_strategy
+                with profiler.stage("transformation"):
+                    data_transformation_artifact=DataTransformation(data_transformation_config=data_transformation_config,
+                                                                    data_ingestion_artifact=data_ingestion_artifact).initiate_data_transformation()
+                n_stage_rows["transformation"]=n_rows
+
+            if last_stage>=STAGES.index("training"):
+                from sensor.components.model_trainer import Model_trainer
+                model_trainer_config=config_entity.ModelTrainingConfig(training_pipeline_config=training_pipeline_config)
+                model_trainer_config.fine_tune=args.tuning_budget is not None
+                model_trainer_config.tuning_time_budget_seconds=args.tuning_budget
+                model_trainer_config.training_engine=args.training_engine
+                # the benchmark measures speed, the quality gates must not stop it
+                model_trainer_config.expected_score=0.0
+                model_trainer_config.overfitting_thresold=1.0
+                with profiler.stage("training"):
+                    model_trainer_artifact=Model_trainer(model_trainer_config=model_trainer_config,
+                                                         data_transformation_artifact=data_transformation_artifact).initiate_model_training()
+                n_stage_rows["training"]=len(np.load(data_transformation_artifact.transformed_train_file_path,mmap_mode="r"))
+
+            if last_stage>=STAGES.index("prediction"):
+                from sensor.components.model_pusher import ModelPusher
+                from sensor.pipeline.batch_prediction import start_batch_prediction
+                ModelPusher(model_pusher_config=config_entity.ModelPusherConfig(training_pipeline_config=training_pipeline_config),
+                            data_transformation_artifact=data_transformation_artifact,
+                            model_trainer_artifact=model_trainer_artifact).initiate_model_pusher()
+                n_prediction_rows=min(n_rows,args.prediction_rows)
+                input_file_path=write_sensor_dataset(os.path.join(work_dir,"prediction_input","aps.csv"),n_rows=n_prediction_rows,
+                                                     seed=11,signal=args.signal)
+                with profiler.stage("prediction"):
+                    start_batch_prediction(input_file_path=input_file_path)
+                n_stage_rows["prediction"]=n_prediction_rows
+        finally:
+            set_mongo_client(None)
+            os.chdir(cwd)
+
+    results=dict()
+    for stage in stages:
+        measures=dict(profiler.stages[stage])
+        measures["n_rows"]=n_stage_rows[stage]
+        measures["rows_per_second"]=round(n_stage_rows[stage]/max(measures["seconds"],1e-9),1)
+        results[stage]=measures
+    return results
+
+
+def print_results(runs:list)->None:
+    print(f"{'rows':>10} {'stage':<16}{'seconds':>10}{'peak rss (MB)':>15}{'rows/s':>14}")
+    for run in runs:
+        for stage,measures in run["stages"].items():
+            print(f"{run['n_rows']:>10} {stage:<16}{measures['seconds']:>10.2f}{measures['peak_rss_mb']:>15.1f}{measures['rows_per_second']:>14.0f}")
+
+
+def compare(before_file_path:str,after_file_path:str)->None:
+    """
+    Prints the ratio after/before of every stage measured in both files
+    """
+    with open(before_file_path) as file_obj:
+        before=json.load(file_obj)
+    with open(after_file_path) as file_obj:
+        after=json.load(file_obj)
+    print(f"{before['git_commit']} -> {after['git_commit']}")
+    print(f"{'rows':>10} {'stage':<16}{'seconds':>20}{'peak rss (MB)':>22}")
+    before_runs={run["n_rows"]:run for run in before["runs"]}
+    for run in after["runs"]:
+        before_run=before_runs.get(run["n_rows"])
+        if before_run is None:
+            continue
+        for stage,measures in run["stages"].items():
+            if stage not in before_run["stages"]:
+                continue
+            old=before_run["stages"][stage]
+            print(f"{run['n_rows']:>10} {stage:<16}"
+                  f"{old['seconds']:>8.2f} ->{measures['seconds']:>8.2f} x{measures['seconds']/max(old['seconds'],1e-9):<4.2f}"
+                  f"{old['peak_rss_mb']:>9.0f} ->{measures['peak_rss_mb']:>7.0f} x{measures['peak_rss_mb']/max(old['peak_rss_mb'],1e-9):<4.2f}")
+
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser()
+    parser.add_argument("--rows",type=int,nargs="+",default=[10000])
+    parser.add_argument("--stages",nargs="+",choices=STAGES,default=list(STAGES))
+    parser.add_argument("--output",default=None,help="JSON file, benchmark_results/suite_<commit>.json by default")
+    parser.add_argument("--compare",nargs=2,metavar=("BEFORE","AFTER"),help="compare two result files instead of running")
+    parser.add_argument("--mongo-url",default=None,help="local mongod to ingest from instead of mongomock")
+    parser.add_argument("--database-name",default="aps_benchmark")
+    parser.add_argument("--ingestion-mode",default="batch",choices=["batch","stream","parallel"])
+    parser.add_argument("--drift-mode",default="exact",choices=["exact","sketch"])
+    parser.add_argument("--resampling-strategy",default=None)
+    parser.add_argument("--training-engine",default="quantile")
+    parser.add_argument("--tuning-budget",type=float,default=None,help="seconds of hyperparameter search, none by default")
+    parser.add_argument("--base-rows",type=int,default=60000,help="rows of the drift base dataset")
+    parser.add_argument("--prediction-rows",type=int,default=1000000)
+    parser.add_argument("--signal",type=float,default=1.5)
+    parser.add_argument("--work-dir",default=None,help="directory of the temporary working directories")
+    args=parser.parse_args()
+
+    if args.compare is not None:
+        compare(*args.compare)
+        sys.exit(0)
+
+    git_commit=get_git_commit()
+    report={"git_commit":git_commit,
+            "timestamp":datetime.now().isoformat(timespec="seconds"),
+            "python":platform.python_version(),
+            "platform":platform.platform(),
+            "cpu_count":os.cpu_count(),
+            "args":{name:value for name,value in vars(args).items() if name not in ("compare","output","work_dir")},
+            "runs":[]}
+    for n_rows in args.rows:
+        start_time=time.perf_counter()
+        report["runs"].append({"n_rows":n_rows,"stages":run_suite(n_rows,args.stages,args)})
+        print(f"{n_rows} rows done in {time.perf_counter()-start_time:.1f}s")
+
+    output_file_path=args.output or os.path.join("benchmark_results",f"suite_{git_commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output_file_path)),exist_ok=True)
+    with open(output_file_path,"w") as file_obj:
+        json.dump(report,file_obj,indent=2)
+    print_results(report["runs"])
+    print(f"Results written to {output_file_path}")
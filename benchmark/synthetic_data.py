@@ -0,0 +1,117 @@
+import os
+from typing import Iterator,Optional
+
+import numpy as np
+import pandas as pd
+
+from sensor.config import TARGET_COLUMN
+from sensor.schema import APS_FEATURE_COLUMNS
+
+# rows are generated in full blocks seeded by (seed, block index), so any row count
+# yields the same leading rows and large datasets are written without being held in
+# memory
+BLOCK_ROWS=10000
+
+
+def get_feature_columns(n_features:int)->list:
+    """
+    APS sensor names, wider frames get sensor_### names
+    """
+    if n_features<=len(APS_FEATURE_COLUMNS):
+        return list(APS_FEATURE_COLUMNS[:n_features])
+    return [f"sensor_{i:03d}" for i in range(n_features)]
+
+
+def get_column_na_rates(n_features:int,na_rate:float,seed:int)->np.ndarray:
+    """
+    Missing value rate of every column. Like in the APS dataset most sensors miss a
+    few percent of readings and a handful miss most of them : rates are drawn from a
+    beta distribution whose mean is na_rate
+    """
+    if na_rate<=0:
+        return np.zeros(n_features)
+    shape=0.3
+    return np.random.default_rng([seed,n_features]).beta(shape,shape*(1-na_rate)/na_rate,size=n_features)
+
+
+def get_sensor_block(block_index:int,n_features:int=170,na_rate:float=0.08,pos_ratio:float=1/60,seed:int=42,
+                     signal:float=0.0,n_informative:int=10)->pd.DataFrame:
+    """
+    Rows block_index*BLOCK_ROWS to (block_index+1)*BLOCK_ROWS of the generated dataset
+    """
+    columns=get_feature_columns(n_features)
+    column_na_rates=get_column_na_rates(n_features,na_rate,seed)
+    sigma=3
+    random_state=np.random.default_rng([seed,block_index])
+    values=random_state.lognormal(mean=5,sigma=sigma,size=(BLOCK_ROWS,n_features))
+    is_missing=random_state.random((BLOCK_ROWS,n_features))<column_na_rates
+    is_pos=random_state.random(BLOCK_ROWS)<pos_ratio
+    if signal>0:
+        values[is_pos,:n_informative]*=np.exp(signal*sigma)
+    values=np.floor(values)
+    values[is_missing]=np.nan
+    start=block_index*BLOCK_ROWS
+    df=pd.DataFrame(values,columns=columns,index=pd.RangeIndex(start,start+BLOCK_ROWS))
+    df.insert(0,TARGET_COLUMN,np.where(is_pos,"pos","neg"))
+    return df
+
+
+def iter_sensor_dataframes(n_rows:int,**kwargs)->Iterator[pd.DataFrame]:
+    """
+    Yields the first n_rows rows of the generated dataset block by block, kwargs are
+    those of generate_sensor_dataframe
+    """
+    for block_index,start in enumerate(range(0,n_rows,BLOCK_ROWS)):
+        df=get_sensor_block(block_index,**kwargs)
+        yield df.iloc[:n_rows-start] if n_rows-start<BLOCK_ROWS else df
+
+
+def generate_sensor_dataframe(n_rows:int,n_features:int=170,na_rate:float=0.08,pos_ratio:float=1/60,seed:int=42,
+                              signal:float=0.0,n_informative:int=10)->pd.DataFrame:
+    """
+    Generates a deterministic APS shaped dataframe : non negative integer sensor
+    readings with NaN for missing values (na_rate on average, varying per column) and a
+    "pos"/"neg" target column with pos_ratio positives. With signal > 0 the log of the
+    first n_informative readings of "pos" rows is shifted by signal standard
+    deviations, so models have something to learn
+    """
+    return pd.concat(list(iter_sensor_dataframes(n_rows=n_rows,n_features=n_features,na_rate=na_rate,pos_ratio=pos_ratio,
+                                                 seed=seed,signal=signal,n_informative=n_informative)))
+
+
+def _get_csv_block(args:tuple)->str:
+    block_index,n_rows,kwargs=args
+    df=get_sensor_block(block_index,**kwargs).iloc[:n_rows]
+    return df.to_csv(header=block_index==0,index=False,na_rep="na")
+
+
+def write_sensor_dataset(file_path:str,n_rows:int,file_format:Optional[str]=None,n_workers:Optional[int]=None,**kwargs)->str:
+    """
+    Writes generated rows block by block to a csv (missing values as "na" like the APS
+    csv) or parquet file, kwargs are those of generate_sensor_dataframe. Formatting
+    csv text is slow, blocks are formatted by n_workers processes
+    """
+    file_format=file_format or os.path.splitext(file_path)[1].lstrip(".")
+    os.makedirs(os.path.dirname(os.path.abspath(file_path)),exist_ok=True)
+    if file_format=="csv":
+        from concurrent.futures import ProcessPoolExecutor
+        blocks=[(block_index,min(BLOCK_ROWS,n_rows-start),kwargs) for block_index,start in enumerate(range(0,n_rows,BLOCK_ROWS))]
+        with open(file_path,"w") as file_obj,ProcessPoolExecutor(max_workers=n_workers or os.cpu_count()) as executor:
+            for text in executor.map(_get_csv_block,blocks):
+                file_obj.write(text)
+    elif file_format=="parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        writer=None
+        try:
+            for df in iter_sensor_dataframes(n_rows=n_rows,**kwargs):
+                table=pa.Table.from_pandas(df,preserve_index=False)
+                if writer is None:
+                    writer=pq.ParquetWriter(file_path,table.schema)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        raise ValueError(f"Unsupported file format [{file_format}]")
+    return file_path
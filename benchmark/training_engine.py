@@ -0,0 +1,66 @@
+"""
+Trains the same model with every training engine on synthetic transformed arrays saved
+as .npy files : matrix construction and training time, rows per second and test f1
+
+python -m benchmark.training_engine --rows 100000 --nthread 8
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+from sklearn.metrics import f1_score
+
+from sensor import utils
+from sensor.config import TARGET_COLUMN
+from sensor.training import ENGINES,TrainingEngine
+from benchmark.synthetic_data import generate_sensor_dataframe
+
+
+def train_sklearn(X_train,y_train,X_test,nthread:int,n_rounds:int)->tuple:
+    from xgboost import XGBClassifier
+    start_time=time.perf_counter()
+    model=XGBClassifier(n_estimators=n_rounds,n_jobs=nthread).fit(X_train,y_train)
+    train_seconds=time.perf_counter()-start_time
+    return 0.0,train_seconds,model.predict(X_test)
+
+
+def train_engine(engine_name:str,X_train,y_train,X_test,nthread:int,n_rounds:int,cache_dir:str)->tuple:
+    engine=TrainingEngine(engine=engine_name,nthread=nthread,cache_dir=cache_dir)
+    train_matrix=engine.get_matrix(X_train,y_train)
+    test_matrix=engine.get_matrix(X_test,None,name="test",training=False)
+    booster=engine.train({"n_estimators":n_rounds},train_matrix)
+    return engine.stats["train_matrix_seconds"],engine.stats["train_seconds"],engine.predict_labels(booster,test_matrix)
+
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser()
+    parser.add_argument("--rows",type=int,default=100000)
+    parser.add_argument("--rounds",type=int,default=100)
+    parser.add_argument("--nthread",type=int,default=os.cpu_count())
+    args=parser.parse_args()
+
+    df=generate_sensor_dataframe(n_rows=args.rows,signal=1.5)
+    n_train=len(df)
+    X=np.log1p(df.drop(TARGET_COLUMN,axis=1).to_numpy(dtype=np.float32))
+    y=(df[TARGET_COLUMN]=="pos").to_numpy().astype(np.uint8)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        utils.save_numpy_array_mmap(os.path.join(tmp_dir,"train_features.npy"),X)
+        utils.save_numpy_array_mmap(os.path.join(tmp_dir,"train_target.npy"),y)
+        del df,X
+        X_train,y_train=utils.load_feature_target_arrays(os.path.join(tmp_dir,"train_features.npy"),os.path.join(tmp_dir,"train_target.npy"))
+        test_df=generate_sensor_dataframe(n_rows=args.rows//4,signal=1.5,seed=7)
+        X_test=np.log1p(test_df.drop(TARGET_COLUMN,axis=1).to_numpy(dtype=np.float32))
+        y_test=(test_df[TARGET_COLUMN]=="pos").to_numpy().astype(np.uint8)
+
+        print(f"train rows : {n_train} rounds : {args.rounds} nthread : {args.nthread}")
+        print(f"{'engine':<18}{'matrix (s)':>12}{'train (s)':>12}{'rows/s':>12}{'test f1':>10}")
+        for engine_name in ENGINES:
+            if engine_name=="sklearn":
+                matrix_seconds,train_seconds,yhat_test=train_sklearn(X_train,y_train,X_test,args.nthread,args.rounds)
+            else:
+                matrix_seconds,train_seconds,yhat_test=train_engine(engine_name,X_train,y_train,X_test,args.nthread,
+                                                                    args.rounds,os.path.join(tmp_dir,"xgb_cache"))
+            print(f"{engine_name:<18}{matrix_seconds:>12.2f}{train_seconds:>12.2f}{n_train/(matrix_seconds+train_seconds):>12.0f}"
+                  f"{f1_score(y_test,yhat_test):>10.3f}")
@@ -0,0 +1,62 @@
+"""
+Compares today's csv read path (read_csv, replace("na"), convert_columns_float) with a
+single pass read_csv driven by the APS schema : parse time, peak traced memory and the
+memory of the resulting dataframe
+
+python -m benchmark.typed_loading --rows 60000
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from sensor import utils
+from sensor.config import TARGET_COLUMN
+from sensor.schema import APS_SCHEMA
+from benchmark.synthetic_data import generate_sensor_dataframe
+
+
+def read_untyped_csv(file_path:str)->pd.DataFrame:
+    df=pd.read_csv(file_path)
+    df.replace("na",np.nan,inplace=True)
+    return utils.convert_columns_float(df=df,exclude_columns=[TARGET_COLUMN])
+
+
+def read_typed_csv(file_path:str)->pd.DataFrame:
+    return APS_SCHEMA.read_csv(file_path)
+
+
+def measure(read_func,file_path:str,repeat:int)->tuple:
+    times=[]
+    for _ in range(repeat):
+        start=time.perf_counter()
+        df=read_func(file_path)
+        times.append(time.perf_counter()-start)
+        del df
+    tracemalloc.start()
+    df=read_func(file_path)
+    _,peak=tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times),peak,df.memory_usage(deep=True).sum()
+
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser()
+    parser.add_argument("--rows",type=int,default=60000)
+    parser.add_argument("--repeat",type=int,default=3)
+    args=parser.parse_args()
+
+    df=generate_sensor_dataframe(n_rows=args.rows)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path=os.path.join(tmp_dir,"aps.csv")
+        df.to_csv(csv_path,index=False,header=True,na_rep="na")
+
+        print(f"rows : {args.rows} csv size : {os.path.getsize(csv_path)/2**20:.1f} MB")
+        print(f"{'read path':<28}{'time (s)':>10}{'peak (MB)':>12}{'frame (MB)':>12}")
+        for name,read_func in [("read_csv+convert_columns",read_untyped_csv),("schema read_csv",read_typed_csv)]:
+            read_time,peak,frame_size=measure(read_func,csv_path,args.repeat)
+            print(f"{name:<28}{read_time:>10.3f}{peak/2**20:>12.1f}{frame_size/2**20:>12.1f}")
@@ -1,6 +1,5 @@
-import pandas as pd
-import json
-from sensor.config import mongo_client
+import argparse
+from sensor.bulk_loader import BulkLoader
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -9,16 +8,19 @@ DATABASE_NAME='aps'
 COLLECTION_NAME='sensor'
 
 if __name__=='__main__':
-    df=pd.read_csv(DATA_FILE_PATH)
-    print(f"No of Rows and Columns :{df.shape}")
-
-    # convert dataframe into json so that we can dump data into mongo db
-    df.reset_index(drop=True,inplace=True)
-
-    json_record=list(json.loads(df.T.to_json()).values())
-    print(json_record[0])
-    #insert converted data into mongo db 
-
-    mongo_client[DATABASE_NAME][COLLECTION_NAME].insert_many(json_record)
-    print("Data inserted successfully into mongo db ")
+    parser=argparse.ArgumentParser(description="Load the sensor csv file into mongo db")
+    parser.add_argument("--file-path",default=DATA_FILE_PATH)
+    parser.add_argument("--database-name",default=DATABASE_NAME)
+    parser.add_argument("--collection-name",default=COLLECTION_NAME)
+    parser.add_argument("--chunk-size",type=int,default=10000)
+    parser.add_argument("--writers",type=int,default=4)
+    parser.add_argument("--restart",action="store_true",help="ignore the checkpoint of an interrupted load")
+    args=parser.parse_args()
 
+    bulk_loader=BulkLoader(file_path=args.file_path,
+                           database_name=args.database_name,
+                           collection_name=args.collection_name,
+                           chunk_size=args.chunk_size,
+                           n_writers=args.writers)
+    n_inserted=bulk_loader.load(restart=args.restart)
+    print(f"Data inserted successfully into mongo db : {n_inserted} rows")
@@ -1,11 +1,15 @@
-from sensor.pipeline.training import start_training_pipeline
+import argparse
+from sensor.pipeline.training_pipeline import start_training_pipeline
 from sensor.pipeline.batch_prediction import start_batch_prediction
 
 print(__name__)
 
 if __name__=="__main__":
+    parser=argparse.ArgumentParser()
+    parser.add_argument("--force",action="store_true",help="re-run every stage instead of reusing cached artifacts")
+    args=parser.parse_args()
     try:
         #start training 
-        start_training_pipeline()
+        start_training_pipeline(force=args.force)
     except Exception as e:
         print(e)
\ No newline at end of file
@@ -0,0 +1,25 @@
+import argparse
+import os
+
+from sensor.entity import config_entity
+from sensor.blob_store import BlobStore,prune_runs
+
+
+if __name__=="__main__":
+    training_pipeline_config=config_entity.TrainingPipelineConfig()
+    model_pusher_config=config_entity.ModelPusherConfig(training_pipeline_config)
+    parser=argparse.ArgumentParser(description="Prune old training runs and the stored files no run or model version uses")
+    parser.add_argument("--keep-runs",type=int,default=training_pipeline_config.keep_runs)
+    parser.add_argument("--max-age-days",type=float,default=training_pipeline_config.max_run_age_days)
+    args=parser.parse_args()
+
+    blob_store=BlobStore(store_dir=training_pipeline_config.blob_store_dir)
+    removed_run_dirs=prune_runs(artifact_root=os.path.dirname(training_pipeline_config.artifact_dir),
+                                blob_store=blob_store,
+                                keep_runs=args.keep_runs,
+                                max_age_days=args.max_age_days,
+                                stage_cache_dir=training_pipeline_config.stage_cache_dir)
+    removed=blob_store.gc(registry_dirs=[model_pusher_config.saved_model_dir])
+    stats=blob_store.get_stats()
+    print(f"Removed {len(removed_run_dirs)} runs and {removed['removed_objects']} objects ({removed['removed_mb']:.1f} MB)")
+    print(f"{stats['n_objects']} objects, {stats['stored_mb']:.1f} MB stored for {stats['logical_mb']:.1f} MB of run and model files")
@@ -1,3 +0,0 @@
-from dotenv import load_dotenv
-print(f"Loading environment variable from .env file")
-load_dotenv()
\ No newline at end of file
@@ -0,0 +1,223 @@
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+from datetime import datetime
+from typing import Dict,List,Optional
+
+from sensor.logger import logging
+from sensor.exception import SensorException
+from sensor.predictor import get_file_checksum,MANIFEST_FILE_NAME
+
+TREE_FILE_SUFFIX=".json"
+
+
+class BlobStore:
+    """
+    Content addressed store of artifact files. A file put in the store becomes the
+    object objects/<sha256[:2]>/<sha256>, and its path in the run or registry directory
+    a hard link to that object (a copy where the filesystem can not link), so identical
+    files of any number of runs and model versions are stored once. Linked files share
+    their inode with the object : the pipeline writers replace files through a
+    temporary file (utils.replace_file) and never write into an existing one. put_dir
+    also writes the tree of a directory, {relative path : sha256 and size}, to
+    trees/<directory path relative to base_dir>.json : objects and trees are all that
+    is needed to restore a directory with checkout, and neither is ever rewritten.
+    gc removes the objects no tree nor registry manifest refers to
+    """
+    def __init__(self,store_dir:str,base_dir:Optional[str]=None):
+        try:
+            self.store_dir=store_dir
+            self.base_dir=base_dir or os.getcwd()
+            self.objects_dir=os.path.join(store_dir,"objects")
+            self.trees_dir=os.path.join(store_dir,"trees")
+            os.makedirs(self.objects_dir,exist_ok=True)
+            os.makedirs(self.trees_dir,exist_ok=True)
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def get_object_path(self,digest:str)->str:
+        return os.path.join(self.objects_dir,digest[:2],digest)
+
+    def get_tree_path(self,dir_path:str)->str:
+        return os.path.join(self.trees_dir,f"{os.path.relpath(os.path.abspath(dir_path),self.base_dir)}{TREE_FILE_SUFFIX}")
+
+    def link(self,digest:str,file_path:str)->None:
+        """
+        Points file_path at the object, replacing any file already there
+        """
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(file_path)),exist_ok=True)
+            tmp_file_path=f"{file_path}.{uuid.uuid4().hex}.tmp"
+            try:
+                os.link(self.get_object_path(digest),tmp_file_path)
+            except OSError:
+                shutil.copyfile(self.get_object_path(digest),tmp_file_path)
+            os.replace(tmp_file_path,file_path)
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def put(self,file_path:str)->str:
+        """
+        Stores the content of file_path and makes the file a link to its object
+        returns: the sha256 of the content
+        """
+        try:
+            digest=get_file_checksum(file_path)
+            object_path=self.get_object_path(digest)
+            if not os.path.exists(object_path):
+                os.makedirs(os.path.dirname(object_path),exist_ok=True)
+                tmp_object_path=f"{object_path}.{uuid.uuid4().hex}.tmp"
+                try:
+                    os.link(file_path,tmp_object_path)
+                except OSError:
+                    shutil.copyfile(file_path,tmp_object_path)
+                os.replace(tmp_object_path,object_path)
+            elif not os.path.samefile(file_path,object_path):
+                self.link(digest,file_path)
+            return digest
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def put_dir(self,dir_path:str)->Dict[str,dict]:
+        """
+        Puts every file of a directory in the store and writes its tree
+        returns: the tree, {relative path : {"sha256","size"}}
+        """
+        try:
+            files=dict()
+            for root,_,file_names in os.walk(dir_path):
+                for file_name in sorted(file_names):
+                    file_path=os.path.join(root,file_name)
+                    if os.path.islink(file_path) or file_name.endswith((".tmp",".lock")):
+                        continue
+                    files[os.path.relpath(file_path,dir_path)]={"sha256":self.put(file_path),"size":os.path.getsize(file_path)}
+            tree={"created_at":datetime.now().isoformat(),"files":files}
+            tree_path=self.get_tree_path(dir_path)
+            os.makedirs(os.path.dirname(tree_path),exist_ok=True)
+            tmp_tree_path=f"{tree_path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_tree_path,"w") as file_obj:
+                json.dump(tree,file_obj,indent=2)
+            os.replace(tmp_tree_path,tree_path)
+            logging.info(f"Stored {len(files)} files of {dir_path}")
+            return files
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def read_trees(self)->Dict[str,dict]:
+        try:
+            trees=dict()
+            for root,_,file_names in os.walk(self.trees_dir):
+                for file_name in file_names:
+                    if file_name.endswith(TREE_FILE_SUFFIX):
+                        tree_path=os.path.join(root,file_name)
+                        with open(tree_path) as file_obj:
+                            trees[os.path.relpath(tree_path,self.trees_dir)[:-len(TREE_FILE_SUFFIX)]]=json.load(file_obj)
+            return trees
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def remove_tree(self,dir_path:str)->None:
+        tree_path=self.get_tree_path(dir_path)
+        if os.path.exists(tree_path):
+            os.remove(tree_path)
+
+    def checkout(self,tree_name:str,dir_path:Optional[str]=None)->str:
+        """
+        Restores the directory of a tree, e.g. "artifact/12-18-2022_10-00" after the
+        store was synced back from S3
+        """
+        try:
+            dir_path=dir_path or os.path.join(self.base_dir,tree_name)
+            with open(os.path.join(self.trees_dir,f"{tree_name}{TREE_FILE_SUFFIX}")) as file_obj:
+                tree=json.load(file_obj)
+            for relative_path,file_info in tree["files"].items():
+                self.link(file_info["sha256"],os.path.join(dir_path,relative_path))
+            return dir_path
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def iter_objects(self):
+        for root,_,file_names in os.walk(self.objects_dir):
+            for file_name in file_names:
+                yield os.path.join(root,file_name)
+
+    def gc(self,registry_dirs:Optional[List[str]]=None)->dict:
+        """
+        Removes the objects no tree and no manifest of registry_dirs refers to
+        returns: {"removed_objects","removed_mb"}
+        """
+        try:
+            live_digests={file_info["sha256"] for tree in self.read_trees().values() for file_info in tree["files"].values()}
+            for registry_dir in registry_dirs or []:
+                manifest_file_path=os.path.join(registry_dir,MANIFEST_FILE_NAME)
+                if os.path.exists(manifest_file_path):
+                    with open(manifest_file_path) as file_obj:
+                        manifest=json.load(file_obj)
+                    live_digests.update(file_info["sha256"] for version in manifest["versions"].values()
+                                        for file_info in version["files"].values())
+            removed_objects,removed_bytes=0,0
+            for object_path in list(self.iter_objects()):
+                if os.path.basename(object_path) not in live_digests:
+                    removed_bytes+=os.path.getsize(object_path)
+                    os.remove(object_path)
+                    removed_objects+=1
+            logging.info(f"Removed {removed_objects} unreferenced objects, {removed_bytes/2**20:.1f} MB")
+            return {"removed_objects":removed_objects,"removed_mb":removed_bytes/2**20}
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def get_stats(self)->dict:
+        """
+        Size of the stored objects against the size of the files the trees list
+        """
+        try:
+            stored_bytes=sum(os.path.getsize(object_path) for object_path in self.iter_objects())
+            logical_bytes=sum(file_info["size"] for tree in self.read_trees().values() for file_info in tree["files"].values())
+            return {"n_objects":sum(1 for _ in self.iter_objects()),
+                    "stored_mb":stored_bytes/2**20,
+                    "logical_mb":logical_bytes/2**20}
+        except Exception as e:
+            raise SensorException(e,sys)
+
+
+def prune_runs(artifact_root:str,blob_store:BlobStore,keep_runs:Optional[int]=None,max_age_days:Optional[float]=None,
+               stage_cache_dir:Optional[str]=None)->List[str]:
+    """
+    Removes run directories of artifact_root beyond the keep_runs most recent or older
+    than max_age_days, with their trees. The most recent run and runs holding a stage
+    the stage cache still reuses are kept
+    returns: the removed run directories
+    """
+    try:
+        if not os.path.isdir(artifact_root):
+            return []
+        run_dirs=[os.path.join(artifact_root,dir_name) for dir_name in os.listdir(artifact_root)
+                  if os.path.isdir(os.path.join(artifact_root,dir_name))]
+        run_dirs.sort(key=os.path.getmtime,reverse=True)
+
+        cached_run_dirs=set()
+        if stage_cache_dir is not None:
+            from sensor import utils
+            from sensor.stage_cache import INDEX_FILE_NAME
+            index_file_path=os.path.join(stage_cache_dir,INDEX_FILE_NAME)
+            if os.path.exists(index_file_path):
+                cached_run_dirs={os.path.dirname(entry["stage_dir"]) for entry in utils.read_yaml_file(index_file_path)["entries"].values()}
+
+        oldest_allowed=None if max_age_days is None else time.time()-max_age_days*86400
+        removed_run_dirs=[]
+        for position,run_dir in enumerate(run_dirs):
+            if position==0 or os.path.abspath(run_dir) in cached_run_dirs:
+                continue
+            too_many=keep_runs is not None and position>=keep_runs
+            too_old=oldest_allowed is not None and os.path.getmtime(run_dir)<oldest_allowed
+            if too_many or too_old:
+                logging.info(f"Pruning run {run_dir}")
+                shutil.rmtree(run_dir)
+                blob_store.remove_tree(run_dir)
+                removed_run_dirs.append(run_dir)
+        return removed_run_dirs
+    except Exception as e:
+        raise SensorException(e,sys)
@@ -0,0 +1,172 @@
+import os
+import sys
+import time
+import struct
+import hashlib
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor,ALL_COMPLETED,FIRST_COMPLETED,wait
+from typing import List,Optional
+from bson.objectid import ObjectId
+from pymongo.errors import BulkWriteError
+
+from sensor.logger import logging
+from sensor.exception import SensorException
+from sensor.config import get_mongo_client
+from sensor import utils
+
+DUPLICATE_KEY_ERROR_CODE=11000
+
+
+def make_object_id(load_timestamp:int,load_key:bytes,row_number:int)->ObjectId:
+    """
+    Deterministic ObjectId of a csv row : the same load always assigns the same _id to
+    a row, so re-inserting a chunk after a crash is rejected as a duplicate. The
+    timestamp part grows with the row number, which keeps _id order equal to file order
+    """
+    return ObjectId(struct.pack(">I",load_timestamp+(row_number>>24))+load_key+struct.pack(">I",row_number&0xFFFFFF)[1:])
+
+
+def chunk_to_records(df:pd.DataFrame,load_timestamp:int,load_key:bytes,first_row_number:int)->List[dict]:
+    """
+    Converts a csv chunk to BSON ready documents without a json round trip, missing
+    values become null
+    """
+    records=df.astype(object).where(df.notna(),None).to_dict("records")
+    for row_number,record in enumerate(records,start=first_row_number):
+        record["_id"]=make_object_id(load_timestamp,load_key,row_number)
+    return records
+
+
+def insert_records(database_name:str,collection_name:str,records:List[dict])->int:
+    """
+    Unordered insert of one chunk, rows which already exist from a previous partial
+    load are skipped. Returns the number of inserted rows
+    """
+    try:
+        result=get_mongo_client()[database_name][collection_name].insert_many(records,ordered=False)
+        return len(result.inserted_ids)
+    except BulkWriteError as e:
+        write_errors=e.details.get("writeErrors",[])
+        if any(error["code"]!=DUPLICATE_KEY_ERROR_CODE for error in write_errors):
+            raise e
+        return e.details["nInserted"]
+
+
+class BulkLoader:
+    """
+    Loads a csv file into a mongo collection in chunks with concurrent writers. Progress
+    is checkpointed after every chunk so an interrupted load resumes where it stopped
+    """
+    def __init__(self,file_path:str,database_name:str,collection_name:str,
+                 chunk_size:int=10000,n_writers:int=4,checkpoint_file_path:Optional[str]=None):
+        try:
+            self.file_path=file_path
+            self.database_name=database_name
+            self.collection_name=collection_name
+            self.chunk_size=chunk_size
+            self.n_writers=n_writers
+            self.checkpoint_file_path=checkpoint_file_path or f"{os.path.abspath(file_path)}.load_checkpoint.yaml"
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def get_load_identity(self)->dict:
+        """
+        What a checkpoint must match to be resumed : the target collection, the chunking
+        and the source file as it was when the load started
+        """
+        stat=os.stat(self.file_path)
+        return {"database_name":self.database_name,
+                "collection_name":self.collection_name,
+                "chunk_size":self.chunk_size,
+                "file_size":stat.st_size,
+                "file_mtime_ns":stat.st_mtime_ns}
+
+    def get_checkpoint(self,restart:bool)->dict:
+        try:
+            load_identity=self.get_load_identity()
+            if not restart and os.path.exists(self.checkpoint_file_path):
+                checkpoint=utils.read_yaml_file(self.checkpoint_file_path)
+                if checkpoint["status"]=="running":
+                    mismatches=[key for key,value in load_identity.items() if checkpoint.get(key)!=value]
+                    if len(mismatches)==0:
+                        logging.info(f"Resuming load, {len(checkpoint['completed_chunks'])} chunks already loaded")
+                        return checkpoint
+                    logging.info(f"Checkpoint does not match this load ({', '.join(mismatches)} changed), starting a fresh load")
+            load_key=hashlib.sha1(f"{os.path.abspath(self.file_path)}{time.time()}".encode()).digest()[:5]
+            return {"file_path":self.file_path,
+                    **load_identity,
+                    "load_timestamp":int(time.time()),
+                    "load_key":load_key.hex(),
+                    "completed_chunks":[],
+                    "status":"running"}
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def save_checkpoint(self,checkpoint:dict)->None:
+        try:
+            tmp_file_path=f"{self.checkpoint_file_path}.tmp"
+            utils.write_yaml_file(file_path=tmp_file_path,data=checkpoint)
+            os.replace(tmp_file_path,self.checkpoint_file_path)
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def load(self,restart:bool=False)->int:
+        """
+        Loads the csv file, returns the number of rows inserted by this run
+        """
+        try:
+            checkpoint=self.get_checkpoint(restart=restart)
+            load_timestamp,load_key=checkpoint["load_timestamp"],bytes.fromhex(checkpoint["load_key"])
+            completed_chunks=set(checkpoint["completed_chunks"])
+            self.save_checkpoint(checkpoint)
+
+            n_inserted=0
+            n_skipped=0
+            start=time.perf_counter()
+            pending={}
+            with ThreadPoolExecutor(max_workers=self.n_writers) as executor:
+                reader=pd.read_csv(self.file_path,chunksize=self.chunk_size,na_values=["na"])
+                for chunk_number,df in enumerate(reader):
+                    if chunk_number in completed_chunks:
+                        n_skipped+=len(df)
+                        continue
+                    records=chunk_to_records(df,load_timestamp,load_key,chunk_number*self.chunk_size)
+                    future=executor.submit(insert_records,self.database_name,self.collection_name,records)
+                    pending[future]=chunk_number
+
+                    # bound the number of chunks held in memory
+                    if len(pending)>=2*self.n_writers:
+                        n_inserted+=self.collect(pending,checkpoint,return_when=FIRST_COMPLETED)
+                        self.log_progress(n_inserted,start)
+
+                n_inserted+=self.collect(pending,checkpoint)
+
+            checkpoint["status"]="done"
+            self.save_checkpoint(checkpoint)
+            elapsed=time.perf_counter()-start
+            logging.info(f"Inserted {n_inserted} rows in {elapsed:.1f}s, {n_skipped} rows were loaded by a previous run")
+            self.log_progress(n_inserted,start)
+            return n_inserted
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def collect(self,pending:dict,checkpoint:dict,return_when:str=ALL_COMPLETED)->int:
+        """
+        Waits for pending chunks and records the finished ones in the checkpoint
+        """
+        try:
+            done,_=wait(list(pending),return_when=return_when)
+            n_inserted=0
+            for future in done:
+                n_inserted+=future.result()
+                checkpoint["completed_chunks"].append(pending.pop(future))
+            self.save_checkpoint(checkpoint)
+            return n_inserted
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def log_progress(self,n_inserted:int,start:float)->None:
+        elapsed=time.perf_counter()-start
+        message=f"Inserted rows : {n_inserted} rows/sec : {n_inserted/max(elapsed,1e-9):.0f}"
+        logging.info(message)
+        print(message)
@@ -0,0 +1,132 @@
+import os
+import sys
+import json
+import mmap
+import numpy as np
+from typing import TYPE_CHECKING,Optional,Sequence,Union
+
+from sensor.exception import SensorException
+from sensor.inference import FastTransformer
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# file layout : MAGIC, header length (uint64 little endian), JSON header, padding to
+# ALIGNMENT, then the sections, each at an ALIGNMENT multiple offset from the end of
+# the padded header
+MAGIC=b"SNSRBNDL"
+FORMAT_VERSION=1
+ALIGNMENT=64
+
+
+def _get_padding(offset:int)->int:
+    return -offset%ALIGNMENT
+
+
+class ModelBundle:
+    """
+    Everything batch prediction needs in one file : the xgboost booster in its native
+    UBJSON form, the fused transformer parameters (fill values, center, scale) and the
+    label classes as raw arrays, described by a small JSON header. Loading maps the
+    file and reads the arrays in place, no pickle is involved
+    """
+    def __init__(self,booster,transformer:FastTransformer,classes:np.ndarray):
+        self.booster=booster
+        self.transformer=transformer
+        self.classes=classes
+
+    @classmethod
+    def from_objects(cls,model,transformer,target_encoder)->"ModelBundle":
+        """
+        Bundle of the objects saved by training : XGBClassifier, fitted SimpleImputer +
+        RobustScaler pipeline and LabelEncoder
+        """
+        try:
+            return cls(booster=model.get_booster(),
+                       transformer=FastTransformer.from_pipeline(transformer),
+                       classes=np.asarray(target_encoder.classes_))
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def save(self,file_path:str)->None:
+        try:
+            params=self.transformer.get_params()
+            arrays={name:np.ascontiguousarray(params[name]) for name in ("fill_values","center","scale") if params[name] is not None}
+            # LabelEncoder keeps string classes in an object array, stored as fixed width strings
+            arrays["classes"]=np.ascontiguousarray(np.asarray(np.asarray(self.classes).tolist()))
+            if arrays["classes"].dtype.hasobject:
+                raise Exception(f"Label classes of dtype {self.classes.dtype} can not be stored as a raw array")
+            sections={name:array.tobytes() for name,array in arrays.items()}
+            sections["booster"]=bytes(self.booster.save_raw("ubj"))
+
+            header={"format_version":FORMAT_VERSION,
+                    "feature_names":params["feature_names"],
+                    "dtype":params["dtype"],
+                    "arrays":{name:{"dtype":array.dtype.str,"shape":list(array.shape)} for name,array in arrays.items()},
+                    "sections":dict()}
+            offset=0
+            for name,section in sections.items():
+                header["sections"][name]={"offset":offset,"size":len(section)}
+                offset+=len(section)+_get_padding(len(section))
+            header_bytes=json.dumps(header).encode()
+            header_bytes+=b" "*_get_padding(len(MAGIC)+8+len(header_bytes))
+
+            os.makedirs(os.path.dirname(os.path.abspath(file_path)),exist_ok=True)
+            tmp_file_path=f"{file_path}.{os.getpid()}.tmp"
+            with open(tmp_file_path,"wb") as file_obj:
+                file_obj.write(MAGIC)
+                file_obj.write(len(header_bytes).to_bytes(8,"little"))
+                file_obj.write(header_bytes)
+                for section in sections.values():
+                    file_obj.write(section)
+                    file_obj.write(b"\0"*_get_padding(len(section)))
+            os.replace(tmp_file_path,file_path)
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    @classmethod
+    def load(cls,file_path:str)->"ModelBundle":
+        try:
+            import xgboost as xgb
+            with open(file_path,"rb") as file_obj:
+                buffer=mmap.mmap(file_obj.fileno(),0,access=mmap.ACCESS_READ)
+            if buffer[:len(MAGIC)]!=MAGIC:
+                raise Exception(f"{file_path} is not a model bundle")
+            header_size=int.from_bytes(buffer[len(MAGIC):len(MAGIC)+8],"little")
+            header=json.loads(bytes(buffer[len(MAGIC)+8:len(MAGIC)+8+header_size]))
+            data_offset=len(MAGIC)+8+header_size
+            if header["format_version"]!=FORMAT_VERSION:
+                raise Exception(f"Unsupported bundle format version {header['format_version']}")
+
+            arrays=dict()
+            for name,array_info in header["arrays"].items():
+                section=header["sections"][name]
+                arrays[name]=np.frombuffer(buffer,dtype=np.dtype(array_info["dtype"]),offset=data_offset+section["offset"],
+                                           count=int(np.prod(array_info["shape"]))).reshape(array_info["shape"])
+            section=header["sections"]["booster"]
+            booster=xgb.Booster()
+            start=data_offset+section["offset"]
+            booster.load_model(bytearray(buffer[start:start+section["size"]]))
+            transformer=FastTransformer(feature_names=header["feature_names"],
+                                        fill_values=arrays["fill_values"],
+                                        center=arrays.get("center"),
+                                        scale=arrays.get("scale"),
+                                        dtype=header["dtype"])
+            return cls(booster=booster,transformer=transformer,classes=arrays["classes"])
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def predict(self,X:Union["pd.DataFrame",np.ndarray],columns:Optional[Sequence[str]]=None)->np.ndarray:
+        """
+        Encoded predictions, like XGBClassifier.predict on the transformed input
+        """
+        try:
+            output=self.booster.inplace_predict(self.transformer.transform(X,columns=columns))
+            if output.ndim==2:
+                return output.argmax(axis=1)
+            return (output>0.5).astype(int)
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def inverse_transform(self,y:np.ndarray)->np.ndarray:
+        return self.classes[y]
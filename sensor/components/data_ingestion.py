@@ -2,6 +2,8 @@ import os
 import sys
 import pandas as pd
 import numpy as np
+from datetime import datetime
+from typing import TYPE_CHECKING,Optional,Tuple
 
 from sensor.logger import logging
 from sensor.exception import SensorException
@@ -9,7 +11,8 @@ from sensor import utils
 from sensor.entity import config_entity
 from sensor.entity import artifact_entity
 
-from sklearn.model_selection import train_test_split
+if TYPE_CHECKING:
+    from bson.objectid import ObjectId
 
 from sensor.entity.config_entity import TrainingPipelineConfig
 from sensor.entity.config_entity import DataIngestionConfig
@@ -24,41 +27,162 @@ class DataIngestion:
         except Exception as e:
             raise SensorException(e,sys)
         
-    def initiate_data_ingestion(self)->artifact_entity.DataIngestionArtifact:
+    def stream_data_ingestion(self,feature_store_file_path:str,train_file_path:str,test_file_path:str,
+                              query:Optional[dict]=None,keep_id:bool=False)->Tuple[int,Optional["ObjectId"]]:
+        """
+        Streams the collection batch by batch into the feature store and splits every
+        batch into train and test rows, so only one batch is held in memory at a time
+        ==============================================================================================
+        returns number of rows written and the largest _id seen (only tracked when keep_id is set)
+        """
         try:
-            logging.info("Exporting collection as dataframe")
-            df:pd.DataFrame=utils.get_collection_as_dataframe(
-                database_name=self.data_ingestion_config.database_name,
-                collection_name=self.data_ingestion_config.collection_name
-            )
+            config=self.data_ingestion_config
+            random_state=np.random.default_rng(42)
+            last_id=None
+            with utils.DatasetWriter(feature_store_file_path) as feature_store_writer,\
+                 utils.DatasetWriter(train_file_path) as train_writer,\
+                 utils.DatasetWriter(test_file_path) as test_writer:
+                for df in utils.iter_collection_batches(database_name=config.database_name,
+                                                        collection_name=config.collection_name,
+                                                        batch_size=config.batch_size,
+                                                        query=query,keep_id=keep_id):
+                    if keep_id:
+                        last_id=df["_id"].iloc[-1]
+                        df.drop("_id",axis=1,inplace=True)
+                    feature_store_writer.write(df)
+
+                    is_test=random_state.random(len(df))<config.test_size
+                    train_writer.write(df[~is_test])
+                    test_writer.write(df[is_test])
+                    logging.info(f"Rows written to feature store : {feature_store_writer.n_rows}")
+
+            return feature_store_writer.n_rows,last_id
+        except Exception as e:
+            raise SensorException(e,sys)
 
-            logging.info("Saving data in feature store ")
+    def incremental_data_ingestion(self)->artifact_entity.DataIngestionArtifact:
+        """
+        Fetches only the documents inserted after the previous run's watermark and appends
+        them as a new partition to the persistent feature store, train and test datasets
+        """
+        try:
+            from bson.objectid import ObjectId
+            config=self.data_ingestion_config
+            query=None
+            if os.path.exists(config.watermark_file_path):
+                watermark=utils.read_yaml_file(config.watermark_file_path)
+                logging.info(f"Previous watermark {watermark}")
+                query={"_id":{"$gt":ObjectId(watermark["last_id"])}}
+
+            partition_file_name=f"part-{datetime.now().strftime('%Y%m%d%H%M%S')}.{config.file_format}"
+            partition_paths={dir_path:os.path.join(dir_path,partition_file_name)
+                             for dir_path in [config.feature_store_partition_dir,config.train_partition_dir,config.test_partition_dir]}
+            tmp_paths={dir_path:os.path.join(dir_path,f".tmp-{partition_file_name}") for dir_path in partition_paths}
+
+            n_rows,last_id=self.stream_data_ingestion(feature_store_file_path=tmp_paths[config.feature_store_partition_dir],
+                                                      train_file_path=tmp_paths[config.train_partition_dir],
+                                                      test_file_path=tmp_paths[config.test_partition_dir],
+                                                      query=query,keep_id=True)
+            logging.info(f"New rows since previous watermark : {n_rows}")
+
+            if n_rows==0:
+                for tmp_path in tmp_paths.values():
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                if not os.path.exists(config.watermark_file_path):
+                    raise Exception(f"No records found in collection {config.collection_name}")
+                return self.get_data_ingestion_artifact(feature_store_file_path=config.feature_store_partition_dir,
+                                                        train_file_path=config.train_partition_dir,
+                                                        test_file_path=config.test_partition_dir)
+
+            # partitions become visible before the watermark moves forward
+            for dir_path,tmp_path in tmp_paths.items():
+                os.replace(tmp_path,partition_paths[dir_path])
+            utils.write_yaml_file(file_path=config.watermark_file_path,
+                                  data={"last_id":str(last_id),
+                                        "last_id_timestamp":last_id.generation_time.isoformat(),
+                                        "last_partition":partition_file_name})
+
+            return self.get_data_ingestion_artifact(feature_store_file_path=config.feature_store_partition_dir,
+                                                    train_file_path=config.train_partition_dir,
+                                                    test_file_path=config.test_partition_dir,
+                                                    new_train_file_path=partition_paths[config.train_partition_dir],
+                                                    new_test_file_path=partition_paths[config.test_partition_dir])
+        except Exception as e:
+            raise SensorException(e,sys)
 
-            # replace na values with nan
+    def initiate_data_ingestion(self)->artifact_entity.DataIngestionArtifact:
+        try:
+            if self.data_ingestion_config.ingestion_mode=="incremental":
+                logging.info("Appending new documents to the persistent feature store")
+                return self.incremental_data_ingestion()
+
+            if self.data_ingestion_config.ingestion_mode=="stream":
+                logging.info("Streaming collection into feature store")
+                n_rows,_=self.stream_data_ingestion(feature_store_file_path=self.data_ingestion_config.feature_store_file_path,
+                                                    train_file_path=self.data_ingestion_config.train_file_path,
+                                                    test_file_path=self.data_ingestion_config.test_file_path)
+                if n_rows==0:
+                    raise Exception(f"No records found in collection {self.data_ingestion_config.collection_name}")
+                self.export_feature_store_to_csv()
+                return self.get_data_ingestion_artifact()
+
+            if self.data_ingestion_config.ingestion_mode=="parallel":
+                logging.info("Exporting collection as dataframe with parallel range readers")
+                df:pd.DataFrame=utils.get_collection_as_dataframe_parallel(
+                    database_name=self.data_ingestion_config.database_name,
+                    collection_name=self.data_ingestion_config.collection_name,
+                    n_workers=self.data_ingestion_config.n_workers,
+                    batch_size=self.data_ingestion_config.batch_size
+                )
+            else:
+                logging.info("Exporting collection as dataframe")
+                df:pd.DataFrame=utils.get_collection_as_dataframe(
+                    database_name=self.data_ingestion_config.database_name,
+                    collection_name=self.data_ingestion_config.collection_name,
+                    batch_size=self.data_ingestion_config.batch_size
+                )
 
-            df.replace("na",np.nan,inplace=True)
+            logging.info("Saving data in feature store ")
 
-            feature_store_dir=os.path.dirname(self.data_ingestion_config.feature_store_file_path)
-            os.makedirs(feature_store_dir,exist_ok=True)
             logging.info("Saving df to feature store folder ")
-            df.to_csv(self.data_ingestion_config.feature_store_file_path,index=False,header=True)
+            utils.write_dataset(df,self.data_ingestion_config.feature_store_file_path)
+            self.export_feature_store_to_csv()
 
             logging.info("Splitting data into train and test ")
+            from sklearn.model_selection import train_test_split
             train_df,test_df=train_test_split(df,test_size=self.data_ingestion_config.test_size,random_state=42)
-            
-            logging.info("Create dataset dirctory if not available ")
-            dataset_dir=os.path.dirname(self.data_ingestion_config.train_file_path)
-            os.makedirs(dataset_dir,exist_ok=True)
 
-            train_df.to_csv(self.data_ingestion_config.train_file_path,index=False,header=True)
-            test_df.to_csv(self.data_ingestion_config.test_file_path,index=False,header=True)
+            utils.write_dataset(train_df,self.data_ingestion_config.train_file_path)
+            utils.write_dataset(test_df,self.data_ingestion_config.test_file_path)
 
-            # Prepare artifact
+            return self.get_data_ingestion_artifact()
+        except Exception as e:
+            raise SensorException(e,sys)
 
+    def export_feature_store_to_csv(self)->None:
+        try:
+            config=self.data_ingestion_config
+            if config.export_csv and config.file_format!="csv":
+                logging.info(f"Exporting feature store to csv : {config.feature_store_csv_file_path}")
+                utils.export_dataset_to_csv(file_path=config.feature_store_file_path,csv_file_path=config.feature_store_csv_file_path)
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def get_data_ingestion_artifact(self,
+                                    feature_store_file_path:Optional[str]=None,
+                                    train_file_path:Optional[str]=None,
+                                    test_file_path:Optional[str]=None,
+                                    new_train_file_path:Optional[str]=None,
+                                    new_test_file_path:Optional[str]=None
+                                    )->artifact_entity.DataIngestionArtifact:
+        try:
             data_ingestion_artifact=artifact_entity.DataIngestionArtifact(
-                feature_store_file_path=self.data_ingestion_config.feature_store_file_path,
-                train_file_path=self.data_ingestion_config.train_file_path,
-                test_file_path=self.data_ingestion_config.test_file_path
+                feature_store_file_path=feature_store_file_path or self.data_ingestion_config.feature_store_file_path,
+                train_file_path=train_file_path or self.data_ingestion_config.train_file_path,
+                test_file_path=test_file_path or self.data_ingestion_config.test_file_path,
+                new_train_file_path=new_train_file_path,
+                new_test_file_path=new_test_file_path
             )
 
             logging.info(f"DataIngestion artifact {data_ingestion_artifact}")
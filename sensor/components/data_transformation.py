@@ -1,20 +1,18 @@
 import os , sys 
+import warnings
 import pandas as pd
 import numpy as np
-from typing import Optional
+from typing import TYPE_CHECKING,Optional
 
 from sensor.logger import logging
 from sensor.exception import SensorException
 from sensor.entity import artifact_entity,config_entity
-from sensor import utils
-
-from sklearn.pipeline import Pipeline
-
-from sklearn.impute import SimpleImputer
-from sklearn.preprocessing import RobustScaler
-from sklearn.preprocessing import LabelEncoder
-from imblearn.combine import SMOTETomek
+from sensor import utils,resampling
 from sensor.config import TARGET_COLUMN
+from sensor.profiling import StageProfiler
+
+if TYPE_CHECKING:
+    from sklearn.pipeline import Pipeline
 
 
 class DataTransformation:
@@ -31,8 +29,11 @@ class DataTransformation:
         
     
     @classmethod
-    def get_data_transformer_object(cls)->Pipeline:
+    def get_data_transformer_object(cls)->"Pipeline":
         try:
+            from sklearn.pipeline import Pipeline
+            from sklearn.impute import SimpleImputer
+            from sklearn.preprocessing import RobustScaler
             simple_imputer=SimpleImputer(strategy='constant',fill_value=0)
             robust_scaler=RobustScaler()
             pipeline=Pipeline(steps=[
@@ -43,10 +44,10 @@ class DataTransformation:
         except Exception as e:
             raise SensorException(e,sys)
         
-    def initiate_data_transformation(self)->artifact_entity.DataTransformationArtifact:
+    def transform_in_memory(self)->tuple:
         try:
-            train_df=pd.read_csv(self.data_ingestion_artifact.train_file_path)
-            test_df=pd.read_csv(self.data_ingestion_artifact.test_file_path)
+            train_df=utils.read_dataset(self.data_ingestion_artifact.train_file_path)
+            test_df=utils.read_dataset(self.data_ingestion_artifact.test_file_path)
 
             #selecting input feature for train and test dataframe
             input_feature_train_df=train_df.drop(TARGET_COLUMN,axis=1)
@@ -56,6 +57,7 @@ class DataTransformation:
             target_feature_train_df=train_df[TARGET_COLUMN]
             target_feature_test_df=test_df[TARGET_COLUMN]
 
+            from sklearn.preprocessing import LabelEncoder
             label_encoder=LabelEncoder()
             label_encoder.fit(target_feature_train_df)
 
@@ -65,17 +67,12 @@ class DataTransformation:
             transformation_pipeline=DataTransformation.get_data_transformer_object()
             transformation_pipeline.fit(input_feature_train_df)
 
-            input_feature_train_arr=transformation_pipeline.transform(input_feature_train_df)
-            input_feature_test_arr=transformation_pipeline.transform(input_feature_test_df)
+            input_feature_train_arr=transformation_pipeline.transform(input_feature_train_df).astype(np.float64)
+            input_feature_test_arr=transformation_pipeline.transform(input_feature_test_df).astype(np.float64)
 
-            smt=SMOTETomek(random_state=42)
-            logging.info(f"Before resampling in training set Input: {input_feature_train_arr.shape} Target:{target_feature_train_arr.shape}")
-            input_feature_train_arr, target_feature_train_arr = smt.fit_resample(input_feature_train_arr, target_feature_train_arr)
-            logging.info(f"After resampling in training set Input: {input_feature_train_arr.shape} Target:{target_feature_train_arr.shape}")
-            
-            logging.info(f"Before resampling in testing set Input: {input_feature_test_arr.shape} Target:{target_feature_test_arr.shape}")
-            input_feature_test_arr, target_feature_test_arr = smt.fit_resample(input_feature_test_arr, target_feature_test_arr)
-            logging.info(f"After resampling in testing set Input: {input_feature_test_arr.shape} Target:{target_feature_test_arr.shape}")
+            input_feature_train_arr,target_feature_train_arr,class_weights=self.resample(input_feature_train_arr,target_feature_train_arr)
+            if self.data_transformation_config.resample_test:
+                input_feature_test_arr,target_feature_test_arr,_=self.resample(input_feature_test_arr,target_feature_test_arr)
 
             # merge input feature and target feature for both train and test 
             train_arr=np.c_[input_feature_train_arr,target_feature_train_arr]
@@ -87,7 +84,153 @@ class DataTransformation:
 
             utils.save_numpy_array_data(file_path=self.data_transformation_config.transformed_test_path,
                                         array=test_arr)
+            return transformation_pipeline,label_encoder,class_weights
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def transform_dataset(self,df:pd.DataFrame,transformation_pipeline:"Pipeline",label_encoder)->tuple:
+        """
+        Low memory transformation of one dataset : float32 features transformed in
+        place and labels encoded as uint8. The dataframe is emptied as soon as its
+        columns are no longer needed
+        """
+        try:
+            target_arr=label_encoder.transform(df.pop(TARGET_COLUMN)).astype(np.uint8)
+            input_feature_arr=df[list(transformation_pipeline.feature_names_in_)].to_numpy(dtype=np.float32)
+            df.drop(df.columns,axis=1,inplace=True)
+            # imputer and scaler reuse the input buffer, the saved pipeline keeps copying
+            transformation_pipeline.set_params(Imputer__copy=False,RobustScaler__copy=False)
+            try:
+                with warnings.catch_warnings():
+                    # the array holds the columns in feature_names_in_ order
+                    warnings.filterwarnings("ignore",message="X does not have valid feature names")
+                    input_feature_arr=transformation_pipeline.transform(input_feature_arr)
+            finally:
+                transformation_pipeline.set_params(Imputer__copy=True,RobustScaler__copy=True)
+            return input_feature_arr,target_arr
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def resample(self,input_feature_arr:np.ndarray,target_arr:np.ndarray)->tuple:
+        try:
+            config=self.data_transformation_config
+            return resampling.resample(input_feature_arr,target_arr,
+                                       strategy=config.resampling_strategy,
+                                       random_state=42,
+                                       n_jobs=config.resampling_n_jobs,
+                                       n_components=config.resampling_n_components)
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def save_transformed_dataset(self,df:pd.DataFrame,dataset_name:str,transformation_pipeline:"Pipeline",label_encoder,
+                                 profiler:StageProfiler,features_file_path:str,target_file_path:str,resample:bool)->Optional[dict]:
+        """
+        Transforms, optionally resamples and saves one dataset, returns the class
+        weights of the resampling strategy
+        """
+        try:
+            class_weights=None
+            with profiler.stage(f"transform_{dataset_name}"):
+                input_feature_arr,target_arr=self.transform_dataset(df,transformation_pipeline,label_encoder)
+            if resample:
+                with profiler.stage(f"resample_{dataset_name}"):
+                    input_feature_arr,target_arr,class_weights=self.resample(input_feature_arr,target_arr)
+                    input_feature_arr=input_feature_arr.astype(np.float32,copy=False)
+                    target_arr=target_arr.astype(np.uint8,copy=False)
+            with profiler.stage(f"save_{dataset_name}"):
+                utils.save_numpy_array_mmap(file_path=features_file_path,array=input_feature_arr)
+                utils.save_numpy_array_mmap(file_path=target_file_path,array=target_arr)
+            return class_weights
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def initiate_low_memory_data_transformation(self,profiler:StageProfiler)->tuple:
+        """
+        Train and test sets are processed one after the other and saved before the next
+        one is read, so at most one dataset and its arrays are in memory
+        """
+        try:
+            with profiler.stage("read_train"):
+                train_df=utils.read_dataset(self.data_ingestion_artifact.train_file_path)
+
+            with profiler.stage("fit"):
+                from sklearn.preprocessing import LabelEncoder
+                label_encoder=LabelEncoder()
+                label_encoder.fit(train_df[TARGET_COLUMN])
+                transformation_pipeline=DataTransformation.get_data_transformer_object()
+                transformation_pipeline.fit(train_df.drop([TARGET_COLUMN,"_id"],axis=1,errors="ignore"))
+
+            class_weights=self.save_transformed_dataset(train_df,"train",transformation_pipeline,label_encoder,profiler,
+                                                        features_file_path=self.data_transformation_config.transformed_train_features_path,
+                                                        target_file_path=self.data_transformation_config.transformed_train_target_path,
+                                                        resample=True)
+            del train_df
+            with profiler.stage("read_test"):
+                test_df=utils.read_dataset(self.data_ingestion_artifact.test_file_path)
+            self.save_transformed_dataset(test_df,"test",transformation_pipeline,label_encoder,profiler,
+                                          features_file_path=self.data_transformation_config.transformed_test_features_path,
+                                          target_file_path=self.data_transformation_config.transformed_test_target_path,
+                                          resample=self.data_transformation_config.resample_test)
+            del test_df
+
+            return transformation_pipeline,label_encoder,class_weights
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def initiate_incremental_data_transformation(self,transformer_path:str,target_encoder_path:str)->artifact_entity.DataTransformationArtifact:
+        """
+        Transforms only the partitions added by incremental ingestion with an already
+        fitted transformer and target encoder (the production ones), so a model trained
+        on them can be boosted further. Nothing is refitted or resampled
+        """
+        try:
+            from sensor.inference import FastTransformer
+            config=self.data_transformation_config
+            artifact=self.data_ingestion_artifact
+            if artifact.new_train_file_path is None or artifact.new_test_file_path is None:
+                raise Exception("Data ingestion did not add a new partition")
+            transformation_pipeline=utils.load_object(file_path=transformer_path)
+            label_encoder=utils.load_object(file_path=target_encoder_path)
+            transformer=FastTransformer.from_pipeline(transformation_pipeline)
+
+            for file_path,features_file_path,target_file_path in [
+                (artifact.new_train_file_path,config.incremental_train_features_path,config.incremental_train_target_path),
+                (artifact.new_test_file_path,config.incremental_test_features_path,config.incremental_test_target_path)]:
+                df=utils.read_dataset(file_path)
+                logging.info(f"Transforming {len(df)} new rows of {file_path}")
+                target_arr=label_encoder.transform(df[TARGET_COLUMN]).astype(np.uint8)
+                input_feature_arr=transformer.transform(df[transformer.feature_names])
+                del df
+                utils.save_numpy_array_mmap(file_path=features_file_path,array=input_feature_arr)
+                utils.save_numpy_array_mmap(file_path=target_file_path,array=target_arr)
+
+            utils.save_object(file_path=config.incremental_transformer_object_path,obj=transformation_pipeline)
+            utils.save_object(file_path=config.incremental_target_encoder_path,obj=label_encoder)
 
+            data_transformation_artifact=artifact_entity.DataTransformationArtifact(
+                transformer_obj_path=config.incremental_transformer_object_path,
+                transformed_train_file_path=config.incremental_train_features_path,
+                transformed_test_file_path=config.incremental_test_features_path,
+                target_encoder_file_path=config.incremental_target_encoder_path,
+                transformed_train_features_file_path=config.incremental_train_features_path,
+                transformed_train_target_file_path=config.incremental_train_target_path,
+                transformed_test_features_file_path=config.incremental_test_features_path,
+                transformed_test_target_file_path=config.incremental_test_target_path
+            )
+            logging.info(f"Incremental Data Transformation Done \n{data_transformation_artifact}")
+            return data_transformation_artifact
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def initiate_data_transformation(self)->artifact_entity.DataTransformationArtifact:
+        try:
+            profiler=StageProfiler()
+            if self.data_transformation_config.low_memory:
+                transformation_pipeline,label_encoder,class_weights=self.initiate_low_memory_data_transformation(profiler)
+            else:
+                with profiler.stage("transform"):
+                    transformation_pipeline,label_encoder,class_weights=self.transform_in_memory()
+            profiler.write_report(self.data_transformation_config.memory_report_file_path)
 
             utils.save_object(file_path=self.data_transformation_config.transformer_object_path,
              obj=transformation_pipeline)
@@ -95,12 +238,27 @@ class DataTransformation:
             utils.save_object(file_path=self.data_transformation_config.target_encoder_path,
             obj=label_encoder)
 
-            data_transformation_artifact=artifact_entity.DataTransformationArtifact(
-                transformer_obj_path=self.data_transformation_config.transformer_object_path,
-                transformed_train_file_path=self.data_transformation_config.transformed_train_path,
-                transformed_test_file_path=self.data_transformation_config.transformed_test_path,
-                target_encoder_file_path=self.data_transformation_config.target_encoder_path
-            )
+            config=self.data_transformation_config
+            if config.low_memory:
+                data_transformation_artifact=artifact_entity.DataTransformationArtifact(
+                    transformer_obj_path=config.transformer_object_path,
+                    transformed_train_file_path=config.transformed_train_features_path,
+                    transformed_test_file_path=config.transformed_test_features_path,
+                    target_encoder_file_path=config.target_encoder_path,
+                    class_weights=class_weights,
+                    transformed_train_features_file_path=config.transformed_train_features_path,
+                    transformed_train_target_file_path=config.transformed_train_target_path,
+                    transformed_test_features_file_path=config.transformed_test_features_path,
+                    transformed_test_target_file_path=config.transformed_test_target_path
+                )
+            else:
+                data_transformation_artifact=artifact_entity.DataTransformationArtifact(
+                    transformer_obj_path=config.transformer_object_path,
+                    transformed_train_file_path=config.transformed_train_path,
+                    transformed_test_file_path=config.transformed_test_path,
+                    target_encoder_file_path=config.target_encoder_path,
+                    class_weights=class_weights
+                )
 
             logging.info(f"Data Transformation Done \n{data_transformation_artifact}")
             return data_transformation_artifact
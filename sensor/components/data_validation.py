@@ -1,14 +1,15 @@
 import os , sys
+import time
 import pandas as pd
 import numpy as np
 from typing import Optional
-from scipy.stats import ks_2samp
 
 from sensor.logger import logging
 from sensor.exception import SensorException
 from sensor.entity import config_entity,artifact_entity
-from sensor import utils
+from sensor import utils,drift
 from sensor.config import TARGET_COLUMN
+from sensor.reference_profile import ReferenceProfile,get_reference_profile
 
 
 class DataValidation:
@@ -58,11 +59,8 @@ class DataValidation:
             raise SensorException(e,sys)
 
 
-    def is_required_columns_exits(self,base_df:pd.DataFrame,current_df:pd.DataFrame,report_key_name:str)->bool:
+    def is_required_columns_exits(self,base_columns:list,current_columns:list,report_key_name:str)->bool:
         try:
-            base_columns=base_df.columns
-            current_columns=current_df.columns
-
             missing_columns=[]
 
             for base_column in base_columns:
@@ -78,76 +76,159 @@ class DataValidation:
         except Exception as e:
             raise SensorException(e,sys)
         
-    def data_drift(self,base_df:pd.DataFrame,current_df:pd.DataFrame,report_key_name:str):
+    def data_drift(self,base_profile:ReferenceProfile,current_df:pd.DataFrame,report_key_name:str):
         try:
             drift_report=dict()
 
-            base_columns=base_df.columns
-            current_columns=current_df.columns
-
-            for base_column in base_columns:
-                base_data,current_data=base_df[base_column],current_df[base_column]
-                #null hypothesis is that both the data is drawn from same distribution 
-
-                logging.info(f"hypothesis {base_column}:{base_data}, {current_data}")
-
-                same_distribution=ks_2samp(base_data,current_data)
+            #null hypothesis is that both the data is drawn from same distribution
+            #all sensor columns are tested in one vectorized pass against the presorted
+            #base columns of the reference profile, the target column is not tested
+            base_columns=base_profile.feature_columns
+            current_sorted=drift.sort_columns(current_df[base_columns].to_numpy(dtype=np.float64))
+            _,pvalues=drift.ks_2samp_sorted(base_sorted=base_profile.sorted_values,
+                                            current_sorted=current_sorted,
+                                            n_jobs=self.data_validation_config.drift_n_jobs)
+
+            for base_column,pvalue in zip(base_columns,pvalues):
+                drift_report[base_column]={
+                    "pvalues":float(pvalue),
+                    # we accept null hypothesis when pvalue is above 0.05
+                    "same_distribution":bool(pvalue>0.05)
+                }
+
+            n_drifted=sum(not column_report["same_distribution"] for column_report in drift_report.values())
+            logging.info(f"{report_key_name} : {n_drifted} of {len(base_columns)} columns have a different distribution")
+            self.validation_error[report_key_name]=drift_report
 
-                if same_distribution.pvalue > 0.05:
-                    # we accept null hypothesis
-                    drift_report[base_column]={
-                        "pvalues":float(same_distribution.pvalue),
-                        "same_distribution":True
-                    }
+        except Exception as e:
+            raise SensorException(e,sys)
+        
+    def get_sketch(self,partition_paths:list)->drift.QuantileSketch:
+        try:
+            return drift.get_dataset_sketch(partition_paths=partition_paths,
+                                            capacity=self.data_validation_config.sketch_capacity,
+                                            batch_size=self.data_validation_config.sketch_batch_size,
+                                            cache_dir=self.data_validation_config.sketch_cache_dir)
+        except Exception as e:
+            raise SensorException(e,sys)
 
-                else:
-                    drift_report[base_column]={
-                        "pvalues":float(same_distribution.pvalue),
-                        "same_distribution":False
-                    }
+    def get_sketch_columns(self,sketch:drift.QuantileSketch,report_key_name:str)->list:
+        """
+        Columns of a sketch with a missing value fraction below the thresold, the dropped
+        columns are written to the report like drop_missing_values_columns does
+        """
+        try:
+            null_fractions=sketch.null_counts/max(sketch.n_rows,1)
+            thresold=self.data_validation_config.missing_value_thresold
+            self.validation_error[report_key_name]=[column for column,fraction in zip(sketch.columns,null_fractions) if fraction>thresold]
+            return [column for column,fraction in zip(sketch.columns,null_fractions) if fraction<=thresold]
+        except Exception as e:
+            raise SensorException(e,sys)
 
+    def sketch_data_drift(self,base_sketch:drift.QuantileSketch,current_sketch:drift.QuantileSketch,base_columns:list,report_key_name:str):
+        try:
+            drift_report=dict()
 
+            #same null hypothesis as data_drift, the KS statistic is approximated from
+            #the sketch CDFs and the population stability index is reported with it
+            statistics,pvalues=drift.ks_2samp_sketches(base=base_sketch,current=current_sketch,columns=base_columns)
+            psi=drift.psi_sketches(base=base_sketch,current=current_sketch,columns=base_columns)
+
+            for base_column,statistic,pvalue,column_psi in zip(base_columns,statistics,pvalues,psi):
+                drift_report[base_column]={
+                    "pvalues":float(pvalue),
+                    "same_distribution":bool(pvalue>0.05),
+                    "ks_statistic":float(statistic),
+                    "psi":float(column_psi)
+                }
+
+            n_drifted=sum(not column_report["same_distribution"] for column_report in drift_report.values())
+            logging.info(f"{report_key_name} : {n_drifted} of {len(base_columns)} columns have a different distribution")
             self.validation_error[report_key_name]=drift_report
 
         except Exception as e:
             raise SensorException(e,sys)
-        
+
+    def initiate_sketch_data_validation(self)->None:
+        """
+        Data validation over quantile sketches, every dataset is read once in chunks of
+        sketch_batch_size rows and sketches of unchanged partitions are reused
+        """
+        try:
+            started_at=time.time()
+            logging.info("Sketching base dataframe")
+            base_sketch=self.get_sketch(partition_paths=[self.data_validation_config.base_file_path])
+            base_columns=self.get_sketch_columns(base_sketch,report_key_name="Missing_value_within_base_dataframe")
+
+            datasets={"train":self.data_ingestion_artifact.train_file_path,
+                      "test":self.data_ingestion_artifact.test_file_path}
+            report_key_names={"train":("missing_value-within_train_dataframe","missing_columns_within_train_dataset","data_drift_within_train_dataset"),
+                              "test":("missing_values_within_test_dataframe","missing_columns_within_test_dataset","data_drift_within_test_dataset")}
+            for dataset_name,file_path in datasets.items():
+                missing_value_key,missing_columns_key,data_drift_key=report_key_names[dataset_name]
+                logging.info(f"Sketching {dataset_name} dataframe")
+                current_sketch=self.get_sketch(partition_paths=utils.get_partition_paths(file_path))
+                current_columns=self.get_sketch_columns(current_sketch,report_key_name=missing_value_key)
+                if self.is_required_columns_exits(base_columns=base_columns,current_columns=current_columns,report_key_name=missing_columns_key):
+                    logging.info(f"As all column are available in {dataset_name} df hence detecting data drift")
+                    self.sketch_data_drift(base_sketch=base_sketch,current_sketch=current_sketch,
+                                           base_columns=base_columns,report_key_name=data_drift_key)
+
+            new_train_file_path=self.data_ingestion_artifact.new_train_file_path
+            if new_train_file_path is not None:
+                history_paths=[path for path in utils.get_partition_paths(self.data_ingestion_artifact.train_file_path) if path!=new_train_file_path]
+                if len(history_paths)>0:
+                    logging.info("Detecting data drift of the new partition against the previous partitions")
+                    new_sketch=self.get_sketch(partition_paths=[new_train_file_path])
+                    history_sketch=self.get_sketch(partition_paths=history_paths)
+                    columns=[column for column in history_sketch.columns if column in new_sketch.columns]
+                    self.sketch_data_drift(base_sketch=history_sketch,current_sketch=new_sketch,
+                                           base_columns=columns,report_key_name="data_drift_within_new_partition")
+
+            drift.evict_sketches(cache_dir=self.data_validation_config.sketch_cache_dir,
+                                 max_age_days=self.data_validation_config.sketch_cache_max_age_days,
+                                 max_size_mb=self.data_validation_config.sketch_cache_max_size_mb,
+                                 used_since=started_at)
+        except Exception as e:
+            raise SensorException(e,sys)
+
     def initiate_data_validation(self)->artifact_entity.DataValidationArtifact:
         try:
-             logging.info("Reading base Dataframe")
-             base_df=pd.read_csv(self.data_validation_config.base_file_path)
-             base_df.replace("na",np.NaN,inplace=True)
-             logging.info("Replace na values in dataframe base_df")
-             # df has na as null 
-             logging.info("Drop null values columns from base_df")
-             base_df=self.drop_missing_values_columns(df=base_df,report_key_name="Missing_value_within_base_dataframe")
+             if self.data_validation_config.drift_mode=="sketch":
+                self.initiate_sketch_data_validation()
+                logging.info("Writing the report in yaml file")
+                utils.write_yaml_file(file_path=self.data_validation_config.report_file_path,data=self.validation_error)
+                data_validation_artifact=artifact_entity.DataValidationArtifact(report_file_path=self.data_validation_config.report_file_path)
+                logging.info(f"data validation artifact {data_validation_artifact}")
+                return data_validation_artifact
+
+             logging.info("Loading reference profile of base dataframe")
+             base_profile=get_reference_profile(base_file_path=self.data_validation_config.base_file_path,
+                                                reference_profile_dir=self.data_validation_config.reference_profile_dir,
+                                                missing_value_thresold=self.data_validation_config.missing_value_thresold)
+             self.validation_error["Missing_value_within_base_dataframe"]=base_profile.dropped_columns
              
              logging.info("Reading train dataframe")
-             train_df=pd.read_csv(self.data_ingestion_artifact.train_file_path)
+             train_df=utils.read_dataset(self.data_ingestion_artifact.train_file_path)
              logging.info("Reading test dataframe")
-             test_df=pd.read_csv(self.data_ingestion_artifact.test_file_path)
+             test_df=utils.read_dataset(self.data_ingestion_artifact.test_file_path)
 
              logging.info("Drop null columns from train dataframe")
              train_df=self.drop_missing_values_columns(train_df,report_key_name="missing_value-within_train_dataframe")
              logging.info("Drop null columns from test dataframe")
              test_df=self.drop_missing_values_columns(test_df,report_key_name='missing_values_within_test_dataframe')
 
-             exclude_columns=[TARGET_COLUMN]
-             base_df = utils.convert_columns_float(df=base_df, exclude_columns=exclude_columns)
-             train_df = utils.convert_columns_float(df=train_df, exclude_columns=exclude_columns)
-             test_df = utils.convert_columns_float(df=test_df, exclude_columns=exclude_columns)
-
              logging.info(f"Is all required columns present in train df")
-             train_df_columns_status =self.is_required_columns_exits(base_df=base_df,current_df=train_df,report_key_name="missing_columns_within_train_dataset")
+             train_df_columns_status =self.is_required_columns_exits(base_columns=base_profile.columns,current_columns=train_df.columns,report_key_name="missing_columns_within_train_dataset")
              logging.info(f"Is all required columns present in test df")
-             test_df_columns_status =self.is_required_columns_exits(base_df=base_df,current_df=test_df,report_key_name="missing_columns_within_test_dataset")
+             test_df_columns_status =self.is_required_columns_exits(base_columns=base_profile.columns,current_columns=test_df.columns,report_key_name="missing_columns_within_test_dataset")
             
              if train_df_columns_status:
                 logging.info(f"As all column are available in train df hence detecting data drift")
-                self.data_drift(base_df=base_df, current_df=train_df,report_key_name="data_drift_within_train_dataset")
+                self.data_drift(base_profile=base_profile, current_df=train_df,report_key_name="data_drift_within_train_dataset")
              if test_df_columns_status:
                 logging.info(f"As all column are available in test df hence detecting data drift")
-                self.data_drift(base_df=base_df, current_df=test_df,report_key_name="data_drift_within_test_dataset")
+                self.data_drift(base_profile=base_profile, current_df=test_df,report_key_name="data_drift_within_test_dataset")
              
              #write the report 
 
@@ -1,12 +1,11 @@
 import os , sys
-import pandas as pd
-from sklearn.metrics import f1_score
 
 from sensor.logger import logging
-from sensor.exception import SensorException
+from sensor.exception import SensorException,ModelRejected
 from sensor.entity import artifact_entity,config_entity
-from sensor.config import TARGET_COLUMN
-from sensor.utils import load_object
+from sensor import utils
+from sensor.evaluation import Candidate,ChampionChallenger,get_performance_regressions
+from sensor.bundle import ModelBundle
 from sensor.predictor import ModelResolver
 
 
@@ -37,54 +36,75 @@ class ModelEvaluation:
             if latest_dir_path==None:
                 model_eval_artifact=artifact_entity.ModelEvaluationArtifact(is_model_accepted=True,improved_accuracy=None)
                 return model_eval_artifact
-            
-            #finding the location of transformer model and target encoder 
-            logging.info("Finding the location of transformer model and targer encdoer ")
-            transformer_path=self.ModelResolver.get_latest_dir_path()
-            model_path=self.ModelResolver.get_latest_dir_path()
-            target_encoder_path=self.ModelResolver.get_latest_dir_path()
-            
-            logging.info("Previously trained objects of model , tranformer , target encoder")
-            model=load_object(model_path)
-            transformer=load_object(transformer_path)
-            target_encoder=load_object(target_encoder_path)
 
-            logging.info("Currently Trained model objects")
-            current_transformer=load_object(self.data_transformation_artifact.transformer_obj_path)
-            current_model=load_object(self.model_trainer_artifact.model_file_path)
-            current_target_encoder=load_object(self.data_transformation_artifact.target_encoder_file_path)
-
-            test_df=self.data_ingestion_artifact.test_file_path
-            target_df=test_df[TARGET_COLUMN]
-            y_true=target_encoder.transform(target_df)
+            #the production model is the champion, the currently trained model the challenger
+            logging.info("Finding the location of transformer model and targer encdoer ")
+            champion=Candidate(name="champion",
+                               model_path=self.model_resolver.get_latest_model_path(),
+                               transformer_path=self.model_resolver.get_latest_transformer_path(),
+                               target_encoder_path=self.model_resolver.get_latest_target_encoder_path(),
+                               bundle_path=self.model_resolver.get_latest_bundle_path())
+            challenger=Candidate(name="challenger",
+                                 model_path=self.model_trainer_artifact.model_file_path,
+                                 transformer_path=self.data_transformation_artifact.transformer_obj_path,
+                                 target_encoder_path=self.data_transformation_artifact.target_encoder_file_path)
 
-            input_feature_name=list(transformer.feature_names_in_)
-            input_arr=transformer.transform(test_df[input_feature_name])
-            y_pred=model.predict(input_arr)
-            print(f"Prediction using previous model : {target_encoder.inverse_transform(y_pred[:5])}")
-            previous_model_score=f1_score(y_pred=y_pred,y_true=y_true)
+            #both are scored on the same test set, the champion's predictions usually come from the cache
+            champion_challenger=ChampionChallenger(cache_dir=self.model_eval_config.prediction_cache_dir,
+                                                   work_dir=self.model_eval_config.model_evaluation_dir,
+                                                   max_cache_entries=self.model_eval_config.prediction_cache_max_entries,
+                                                   n_workers=self.model_eval_config.n_workers)
+            results=champion_challenger.score(candidates=[champion,challenger],
+                                              test_file_path=self.data_ingestion_artifact.test_file_path)
+            previous_model_score=results["champion"]["score"]
+            current_model_score=results["challenger"]["score"]
             logging.info(f"Accuracy of previous trained model : {previous_model_score}")
-
-            #accuracy using current model 
-
-            input_feature_name=list(current_model.feature_names_in_)
-            input_arr=current_transformer.transform(test_df[input_feature_name])
-            y_pred=current_model.predict(input_arr)
-            y_true=current_target_encoder.transform(test_df[TARGET_COLUMN])
-            print(f"Prediction using current trained model : {target_encoder.inverse_transform(y_pred[:5])}")
-            current_model_score=f1_score(y_pred=y_pred,y_true=y_true)
             logging.info(f"Accuracy of current model is :{current_model_score}")
+            utils.write_yaml_file(file_path=self.model_eval_config.report_file_path,data=results)
 
             if current_model_score<=previous_model_score:
                 logging.info("Current trained model is not better than previous model ")
-                raise Exception("Current trained model is not better than previous model ")
+                raise ModelRejected("Current trained model is not better than previous model ")
+
+            #a better model must still fit the batch window
+            performance=dict()
+            if self.model_eval_config.performance_gate:
+                # the challenger is measured on the bundle the pusher will publish
+                ModelBundle.from_objects(model=utils.load_object(challenger.model_path),
+                                         transformer=utils.load_object(challenger.transformer_path),
+                                         target_encoder=utils.load_object(challenger.target_encoder_path)
+                                         ).save(self.model_eval_config.challenger_bundle_path)
+                challenger.bundle_path=self.model_eval_config.challenger_bundle_path
+                performance=champion_challenger.benchmark(candidates=[champion,challenger],
+                                                          test_file_path=self.data_ingestion_artifact.test_file_path,
+                                                          batch_sizes=self.model_eval_config.latency_batch_sizes,
+                                                          n_single_rows=self.model_eval_config.latency_n_single_rows,
+                                                          n_repeats=self.model_eval_config.latency_n_repeats)
+                for name,candidate_performance in performance.items():
+                    results[name]["performance"]=candidate_performance
+                utils.write_yaml_file(file_path=self.model_eval_config.report_file_path,data=results)
+                regressions=get_performance_regressions(champion=performance["champion"],
+                                                        challenger=performance["challenger"],
+                                                        max_latency_ratio=self.model_eval_config.max_latency_ratio,
+                                                        min_throughput_ratio=self.model_eval_config.min_throughput_ratio,
+                                                        max_load_time_ratio=self.model_eval_config.max_load_time_ratio,
+                                                        max_size_ratio=self.model_eval_config.max_size_ratio,
+                                                        timing_tolerance_ms=self.model_eval_config.timing_tolerance_ms)
+                if len(regressions)>0:
+                    logging.info(f"Current trained model exceeds the serving performance budgets : {regressions}")
+                    raise ModelRejected(f"Current trained model exceeds the serving performance budgets : {regressions}")
             
             model_eval_artifact=artifact_entity.ModelEvaluationArtifact(is_model_accepted=True,
-                                                        improved_accuracy=current_model_score-previous_model_score)
+                                                        improved_accuracy=current_model_score-previous_model_score,
+                                                        champion_score=previous_model_score,
+                                                        challenger_score=current_model_score,
+                                                        report_file_path=self.model_eval_config.report_file_path,
+                                                        champion_performance=performance.get("champion"),
+                                                        challenger_performance=performance.get("challenger"))
             logging.info(f"Model evaluation Artifact {model_eval_artifact}")
             return model_eval_artifact
 
-
+        except ModelRejected:
+            raise
         except Exception as e:
             raise SensorException(e,sys)
-        
\ No newline at end of file
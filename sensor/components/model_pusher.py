@@ -3,7 +3,10 @@ from sensor.logger import logging
 from sensor.exception import SensorException
 from sensor.entity import config_entity,artifact_entity
 from sensor.predictor import ModelResolver
-from sensor.utils import save_object,load_object
+from sensor.entity.config_entity import MODEL_FILE_NAME,TRANSFORMER_FILE_NAME,TARGET_ENCODER_OBJECT_FILE_NAME,BUNDLE_FILE_NAME
+from sensor.bundle import ModelBundle
+from sensor.utils import load_object
+from sensor.blob_store import BlobStore
 from sensor.entity.artifact_entity import DataTransformationArtifact,ModelTrainingArtifact,ModelPusherArtifact
 
 class ModelPusher:
@@ -32,20 +35,29 @@ class ModelPusher:
             #model pusher dir
 
             logging.info("Saving model into model pusher directory")
-            save_object(file_path=self.model_pusher_config.pusher_transformer_path,obj=transformer)
-            save_object(file_path=self.model_pusher_config.pusher_target_encoder_path,obj=target_encoder)
-            save_object(file_path=self.model_pusher_config.pusher_model_path,obj=model)
+            # the pusher dir and the registry link the trained files stored once in the blob store
+            blob_store=BlobStore(store_dir=self.model_pusher_config.blob_store_dir)
+            for file_path,pusher_file_path in [(self.data_transformation_artifact.transformer_obj_path,self.model_pusher_config.pusher_transformer_path),
+                                               (self.data_transformation_artifact.target_encoder_file_path,self.model_pusher_config.pusher_target_encoder_path),
+                                               (self.model_trainer_artifact.model_file_path,self.model_pusher_config.pusher_model_path)]:
+                blob_store.link(blob_store.put(file_path),pusher_file_path)
+            ModelBundle.from_objects(model=model,transformer=transformer,target_encoder=target_encoder).save(
+                file_path=self.model_pusher_config.pusher_bundle_path)
             
 
             #saved model dir
             logging.info("Saving model in saved model dir")
-            transformer_path=self.model_resolver.get_latest_save_transformer_path()
-            model_path=self.model_resolver.get_latest_save_model_path()
-            target_encoder_path=self.model_resolver.get_latest_save_target_encoder_path()
-
-            save_object(file_path=transformer_path,obj=transformer_path)
-            save_object(file_path=model_path,obj=model)
-            save_object(file_path=target_encoder_path,obj=target_encoder)
+            # published as a whole into the next version, listed in the registry manifest
+            saved_model_dir=self.model_resolver.publish(
+                file_paths={os.path.join(self.model_resolver.transformer_dir_name,TRANSFORMER_FILE_NAME):self.model_pusher_config.pusher_transformer_path,
+                            os.path.join(self.model_resolver.model_dir,MODEL_FILE_NAME):self.model_pusher_config.pusher_model_path,
+                            os.path.join(self.model_resolver.target_endcoder_dir_name,TARGET_ENCODER_OBJECT_FILE_NAME):self.model_pusher_config.pusher_target_encoder_path,
+                            BUNDLE_FILE_NAME:self.model_pusher_config.pusher_bundle_path},
+                metrics={"f1_train_score":float(self.model_trainer_artifact.f1_train_score),
+                         "f1_test_score":float(self.model_trainer_artifact.f1_test_score)},
+                blob_store=blob_store)
+            blob_store.put_dir(saved_model_dir)
+            logging.info(f"Published model version {saved_model_dir}")
 
             model_pusher_artifact=artifact_entity.ModelPusherArtifact(
                 pusher_model_dir=self.model_pusher_config.pusher_model_dir,
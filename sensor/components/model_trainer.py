@@ -1,14 +1,14 @@
 import os , sys
+import time
+import shutil
 import pandas as pd
 import numpy as np
 from typing import Optional
-from sklearn.metrics import f1_score
-from xgboost import XGBClassifier
 
 from sensor.logger import logging
-from sensor.exception import SensorException
+from sensor.exception import SensorException,ModelRejected,IncrementalUpdateRejected
 from sensor.entity import artifact_entity,config_entity
-from sensor import utils 
+from sensor import utils,resampling
 
 
 class Model_trainer:
@@ -23,40 +23,169 @@ class Model_trainer:
         except Exception as e:
             raise SensorException(e,sys)
         
-    def fine_tune(self):
+    def fine_tune(self)->Optional[dict]:
+        """
+        Budgeted hyperband search of the xgboost parameters on the transformed train
+        arrays, returns the search report (None when fine tuning is disabled)
+        """
         try:
-            # write code for grid search cv
-            pass
+            config=self.model_trainer_config
+            if not config.fine_tune:
+                return None
+            from sensor.tuning import HyperbandSearch
+            artifact=self.data_transformation_artifact
+            search=HyperbandSearch(history_dir=config.tuning_history_dir,
+                                   min_rounds=config.tuning_min_rounds,
+                                   max_rounds=config.tuning_max_rounds,
+                                   eta=config.tuning_eta,
+                                   early_stopping_rounds=config.tuning_early_stopping_rounds,
+                                   time_budget_seconds=config.tuning_time_budget_seconds,
+                                   cpu_budget_seconds=config.tuning_cpu_budget_seconds,
+                                   max_passes=config.tuning_max_passes,
+                                   n_workers=config.tuning_n_workers,
+                                   base_params={"tree_method":config.tree_method,"max_bin":config.max_bin})
+            report=search.search(features_file_path=artifact.transformed_train_file_path,
+                                 target_file_path=artifact.transformed_train_target_file_path,
+                                 validation_size=config.tuning_validation_size,
+                                 class_weights=artifact.class_weights)
+            utils.write_yaml_file(file_path=config.tuning_report_file_path,data=report)
+            return report
         except Exception as e:
             raise SensorException(e,sys)
         
-    def train_model(self,X,y):
+    def train_model(self,X,y,class_weights:Optional[dict]=None,params:Optional[dict]=None):
         try:
-            xgb_classifier=XGBClassifier()
-            xgb_classifier.fit(X,y)
+            from xgboost import XGBClassifier
+            xgb_classifier=XGBClassifier(**(params or dict()))
+            # classes which were not resampled are balanced by weighting every row by its class weight
+            xgb_classifier.fit(X,y,sample_weight=resampling.get_sample_weight(y,class_weights))
             return xgb_classifier
         except Exception as e:
             raise SensorException(e,sys)
         
+    def train_model_with_engine(self,X_train,y_train,X_test,y_test,class_weights:Optional[dict]=None,params:Optional[dict]=None):
+        """
+        Trains on a matrix built once by the configured engine, the train labels are
+        predicted from the same matrix
+        returns: (model, train predictions, test predictions, training stats)
+        """
+        try:
+            from sensor.training import TrainingEngine
+            config=self.model_trainer_config
+            engine=TrainingEngine(engine=config.training_engine,tree_method=config.tree_method,nthread=config.nthread,
+                                  max_bin=config.max_bin,chunk_rows=config.external_memory_chunk_rows,
+                                  cache_dir=config.external_memory_cache_dir)
+            train_matrix=engine.get_matrix(X_train,y_train,weight=resampling.get_sample_weight(y_train,class_weights),name="train")
+            test_matrix=engine.get_matrix(X_test,y_test,name="test",training=False)
+            booster=engine.train(params,train_matrix)
+            yhat_train=engine.predict_labels(booster,train_matrix)
+            yhat_test=engine.predict_labels(booster,test_matrix)
+            # the pages of external memory matrices are not needed once trained
+            del train_matrix,test_matrix
+            shutil.rmtree(config.external_memory_cache_dir,ignore_errors=True)
+            return engine.to_classifier(booster),yhat_train,yhat_test,engine.stats
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def initiate_incremental_model_training(self,base_model_path:str)->artifact_entity.ModelTrainingArtifact:
+        """
+        Continues boosting the model saved at base_model_path (the production model) for
+        incremental_rounds at incremental_learning_rate on the new partition the
+        transformation artifact holds, as it arrived (not resampled or weighted). The
+        update is rejected, and a full retrain is expected instead, when the partition
+        is too small or misses a class, the model already had incremental_max_updates
+        updates, or its f1 on the new test partition drops by more than
+        incremental_max_score_drop compared to the base model
+        """
+        try:
+            from sklearn.metrics import f1_score
+            from sensor.training import TrainingEngine,INCREMENTAL_UPDATES_ATTR,get_training_params,get_incremental_updates
+            config=self.model_trainer_config
+            artifact=self.data_transformation_artifact
+            base_model=utils.load_object(file_path=base_model_path)
+            n_updates=get_incremental_updates(base_model)
+            if n_updates>=config.incremental_max_updates:
+                raise IncrementalUpdateRejected(f"Model already had {n_updates} incremental updates, a full retrain is due")
+
+            X_train,y_train=utils.load_feature_target_arrays(file_path=artifact.transformed_train_file_path,
+                                                             target_file_path=artifact.transformed_train_target_file_path)
+            X_test,y_test=utils.load_feature_target_arrays(file_path=artifact.transformed_test_file_path,
+                                                           target_file_path=artifact.transformed_test_target_file_path)
+            if len(y_train)<config.incremental_min_rows or len(np.unique(y_train))<2:
+                raise IncrementalUpdateRejected(f"New partition has {len(y_train)} rows and classes {np.unique(y_train)}, "
+                                f"at least {config.incremental_min_rows} rows of both classes are needed")
+
+            params={**get_training_params(base_model),"n_estimators":config.incremental_rounds,
+                    "learning_rate":config.incremental_learning_rate}
+            logging.info(f"Boosting {config.incremental_rounds} more rounds on {len(y_train)} new rows with {params}")
+            engine=TrainingEngine(engine=config.training_engine if config.training_engine!="sklearn" else "quantile",
+                                  tree_method=config.tree_method,nthread=config.nthread,max_bin=config.max_bin,
+                                  chunk_rows=config.external_memory_chunk_rows,cache_dir=config.external_memory_cache_dir)
+            train_matrix=engine.get_matrix(X_train,y_train)
+            test_matrix=engine.get_matrix(X_test,y_test,name="test",training=False)
+            booster=engine.train(params,train_matrix,xgb_model=base_model.get_booster())
+            booster.set_attr(**{INCREMENTAL_UPDATES_ATTR:str(n_updates+1)})
+            model=engine.to_classifier(booster)
+            utils.write_yaml_file(file_path=config.incremental_training_report_file_path,data=engine.stats)
+            logging.info(f"Training throughput : {engine.stats['rows_per_second']:.0f} rows/sec")
+
+            f1_train_score=f1_score(y_train,engine.predict_labels(booster,train_matrix))
+            f1_test_score=f1_score(y_test,engine.predict_labels(booster,test_matrix),zero_division=0)
+            base_f1_test_score=f1_score(y_test,base_model.predict(X_test),zero_division=0)
+            logging.info(f"train score:{f1_train_score} and tests score {f1_test_score}, base model test score {base_f1_test_score}")
+            if f1_test_score<base_f1_test_score-config.incremental_max_score_drop:
+                raise IncrementalUpdateRejected(f"Incremental update dropped the test score from {base_f1_test_score} to {f1_test_score}")
+
+            del train_matrix,test_matrix
+            shutil.rmtree(config.external_memory_cache_dir,ignore_errors=True)
+            utils.save_object(file_path=config.incremental_model_path,obj=model)
+            model_trainer_artifact=artifact_entity.ModelTrainingArtifact(model_file_path=config.incremental_model_path,
+                                                                         f1_train_score=f1_train_score,f1_test_score=f1_test_score,
+                                                                         training_rows_per_second=engine.stats["rows_per_second"])
+            logging.info(f"Model trainer artifact: {model_trainer_artifact}")
+            return model_trainer_artifact
+        except ModelRejected:
+            raise
+        except Exception as e:
+            raise SensorException(e,sys)
+
     def initiate_model_training(self)->artifact_entity.ModelTrainingArtifact:
         try:
             logging.info("Loading train and test array ")
-            train_arr=utils.load_numpy_array_data(file_path=self.data_transformation_artifact.transformed_train_file_path)
-            test_arr=utils.load_numpy_array_data(file_path=self.data_transformation_artifact.transformed_test_file_path)
+            artifact=self.data_transformation_artifact
+            X_train,y_train=utils.load_feature_target_arrays(file_path=artifact.transformed_train_file_path,
+                                                             target_file_path=artifact.transformed_train_target_file_path)
+            X_test,y_test=utils.load_feature_target_arrays(file_path=artifact.transformed_test_file_path,
+                                                           target_file_path=artifact.transformed_test_target_file_path)
 
-            logging.info("splitting input and target column from both train and test ")
-            X_train,y_train=train_arr[:,:-1],train_arr[:,-1]
-            X_test,y_test=test_arr[:,:-1],test_arr[:,-1]
+            params=None
+            report=self.fine_tune()
+            if report is not None and report["best_params"] is not None:
+                params={**report["best_params"],"n_estimators":report["best_n_rounds"]}
+                logging.info(f"Using tuned parameters {params}")
+            elif report is not None:
+                logging.info("No tuning trial finished within the budget, using the default parameters")
 
-            logging.info("Training model")
-            model=self.train_model(X_train,y_train)
+            logging.info(f"Training model with the {self.model_trainer_config.training_engine} engine")
+            from sklearn.metrics import f1_score
+            class_weights=self.data_transformation_artifact.class_weights
+            if self.model_trainer_config.training_engine=="sklearn":
+                start_time=time.perf_counter()
+                model=self.train_model(X_train,y_train,class_weights=class_weights,params=params)
+                training_stats={"engine":"sklearn","n_rows":len(y_train),"train_seconds":time.perf_counter()-start_time}
+                training_stats["rows_per_second"]=len(y_train)/training_stats["train_seconds"]
+                yhat_train=model.predict(X_train)
+                yhat_test=model.predict(X_test)
+            else:
+                model,yhat_train,yhat_test,training_stats=self.train_model_with_engine(X_train,y_train,X_test,y_test,
+                                                                                       class_weights=class_weights,params=params)
+            logging.info(f"Training throughput : {training_stats['rows_per_second']:.0f} rows/sec")
+            utils.write_yaml_file(file_path=self.model_trainer_config.training_report_file_path,data=training_stats)
 
             logging.info("Calculating f1 train score")
-            yhat_train=model.predict(X_train)
             f1_train_score=f1_score(y_train,yhat_train)
 
             logging.info("Calculating f1 test score")
-            yhat_test=model.predict(X_test)
             f1_test_score=f1_score(y_test,yhat_test)
 
             logging.info(f"train score:{f1_train_score} and tests score {f1_test_score}")
@@ -71,7 +200,7 @@ class Model_trainer:
             diff = abs(f1_train_score-f1_test_score)
 
             if diff>self.model_trainer_config.overfitting_thresold:
-                raise Exception(f"Train and test score diff: {diff} is more than overfitting threshold {self.model_trainer_config.overfitting_threshold}")
+                raise Exception(f"Train and test score diff: {diff} is more than overfitting threshold {self.model_trainer_config.overfitting_thresold}")
             #save the trained model
             logging.info(f"Saving mode object")
             utils.save_object(file_path=self.model_trainer_config.model_path, obj=model)
@@ -79,7 +208,8 @@ class Model_trainer:
             #prepare artifact
             logging.info(f"Prepare the artifact")
             model_trainer_artifact  = artifact_entity.ModelTrainingArtifact(model_file_path=self.model_trainer_config.model_path, 
-            f1_train_score=f1_train_score, f1_test_score=f1_test_score)
+            f1_train_score=f1_train_score, f1_test_score=f1_test_score,
+            training_rows_per_second=training_stats["rows_per_second"])
             logging.info(f"Model trainer artifact: {model_trainer_artifact}")
             return model_trainer_artifact
 
@@ -1,20 +1,66 @@
-import pymongo
 import os
+import threading
 from dataclasses import dataclass
 from dotenv import load_dotenv
+from sensor.logger import logging
 load_dotenv()
 
 @dataclass
 class EnvironmentVariable:
     mongo_db_url:str=os.getenv('MONGO_DB_URL')
+    mongo_max_pool_size:int=int(os.getenv('MONGO_MAX_POOL_SIZE','100'))
+    mongo_connect_timeout_ms:int=int(os.getenv('MONGO_CONNECT_TIMEOUT_MS','20000'))
+    mongo_server_selection_timeout_ms:int=int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS','30000'))
+    # comma separated wire compressors e.g. "zstd,snappy,zlib", empty disables compression
+    mongo_compressors:str=os.getenv('MONGO_COMPRESSORS','')
 
 
 
 
 env_var=EnvironmentVariable()
-mongo_client=pymongo.MongoClient(env_var.mongo_db_url)
-print("Connection Estalished successfully")
 
+_mongo_client=None
+_mongo_client_pid=None
+_mongo_client_injected=False
+_mongo_client_lock=threading.Lock()
 
 
-TARGET_COLUMN='class'
\ No newline at end of file
+def get_mongo_client():
+    """
+    Returns the process wide mongo client, it is created on first use so importing the
+    package never opens a connection. A forked worker creates its own client because a
+    client must not be shared across a fork
+    """
+    global _mongo_client,_mongo_client_pid
+    if _mongo_client is not None and (_mongo_client_injected or _mongo_client_pid==os.getpid()):
+        return _mongo_client
+    with _mongo_client_lock:
+        if _mongo_client is None or (not _mongo_client_injected and _mongo_client_pid!=os.getpid()):
+            import pymongo
+            if env_var.mongo_db_url is None:
+                raise Exception("MONGO_DB_URL environment variable is not set")
+            client_options=dict(maxPoolSize=env_var.mongo_max_pool_size,
+                                connectTimeoutMS=env_var.mongo_connect_timeout_ms,
+                                serverSelectionTimeoutMS=env_var.mongo_server_selection_timeout_ms)
+            if env_var.mongo_compressors:
+                client_options["compressors"]=env_var.mongo_compressors
+            _mongo_client=pymongo.MongoClient(env_var.mongo_db_url,**client_options)
+            _mongo_client_pid=os.getpid()
+            logging.info(f"Mongo client created with options {client_options}")
+    return _mongo_client
+
+
+def set_mongo_client(client)->None:
+    """
+    Injects the client returned by get_mongo_client, e.g. a local mongod client or an
+    in-process stand-in such as mongomock. Passing None restores lazy creation
+    """
+    global _mongo_client,_mongo_client_pid,_mongo_client_injected
+    with _mongo_client_lock:
+        _mongo_client=client
+        _mongo_client_pid=os.getpid()
+        _mongo_client_injected=client is not None
+
+
+
+TARGET_COLUMN='class'
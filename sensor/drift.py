@@ -0,0 +1,381 @@
+import os
+import sys
+import time
+import hashlib
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import List,Optional,Tuple
+
+from sensor.logger import logging
+from sensor.exception import SensorException
+from sensor.config import TARGET_COLUMN
+from sensor import utils
+
+# part of the sketch cache key, sketches saved by an older format are rebuilt
+SKETCH_FORMAT_VERSION=2
+
+def sort_columns(values:np.ndarray)->np.ndarray:
+    """
+    Sorts every column of a 2-D (rows, columns) array once. The result is laid out
+    column major as (columns, rows) so every sorted column is contiguous in memory,
+    missing values (NaN) end up last
+    """
+    try:
+        sorted_values=values.T.copy(order="C")
+        sorted_values.sort(axis=1)
+        return sorted_values
+    except Exception as e:
+        raise SensorException(e,sys)
+
+
+def ks_statistic_block(base_sorted:np.ndarray,current_sorted:np.ndarray)->Tuple[np.ndarray,np.ndarray,np.ndarray]:
+    """
+    Two sample KS statistic of every column pair of two presorted (columns, rows) blocks. Both
+    sorted runs are merged with one stable argsort over the block, which is linear for
+    presorted runs, and the empirical CDFs are compared at the end of every group of
+    tied values. Missing values are ignored
+    ==============================================================================================
+    returns KS statistic, non null base count and non null current count per column
+    """
+    n_base=base_sorted.shape[1]
+    base_counts=np.count_nonzero(~np.isnan(base_sorted),axis=1)
+    current_counts=np.count_nonzero(~np.isnan(current_sorted),axis=1)
+
+    combined=np.concatenate([base_sorted,current_sorted],axis=1)
+    order=np.argsort(combined,axis=1,kind="stable")
+    values=np.take_along_axis(combined,order,axis=1)
+    from_base=order<n_base
+    del combined,order
+
+    # CDF difference scaled by n_base*n_current, kept in integers
+    base_cdf=np.cumsum(from_base,axis=1,dtype=np.int64)
+    current_cdf=np.arange(1,values.shape[1]+1)-base_cdf
+    cdf_diff=base_cdf*current_counts[:,None]
+    cdf_diff-=current_cdf*base_counts[:,None]
+    np.abs(cdf_diff,out=cdf_diff)
+    del base_cdf,current_cdf
+
+    # evaluate only at the last element of every group of equal values and skip NaN
+    skip=np.isnan(values)
+    skip[:,:-1]|=values[:,1:]==values[:,:-1]
+    cdf_diff[skip]=0
+    with np.errstate(divide="ignore",invalid="ignore"):
+        statistics=cdf_diff.max(axis=1,initial=0)/(base_counts*current_counts)
+    statistics=np.where((base_counts>0)&(current_counts>0),statistics,np.nan)
+    return statistics,base_counts,current_counts
+
+
+def ks_2samp_sorted(base_sorted:np.ndarray,current_sorted:np.ndarray,
+                    n_jobs:Optional[int]=None,block_size:int=16)->Tuple[np.ndarray,np.ndarray]:
+    """
+    Column wise two sided two sample KS test on presorted (columns, rows) arrays (see sort_columns).
+    Blocks of block_size columns are processed in parallel on n_jobs threads. p-values
+    use the asymptotic distribution, the method scipy.stats.ks_2samp picks when one of
+    the samples has more than 10000 values
+    ==============================================================================================
+    returns KS statistic and p-value per column
+    """
+    try:
+        from scipy.stats import kstwo
+        n_columns=base_sorted.shape[0]
+        blocks=[slice(start,min(start+block_size,n_columns)) for start in range(0,n_columns,block_size)]
+        with ThreadPoolExecutor(max_workers=n_jobs or os.cpu_count()) as executor:
+            results=list(executor.map(lambda block:ks_statistic_block(base_sorted[block],current_sorted[block]),blocks))
+
+        statistics=np.concatenate([result[0] for result in results])
+        base_counts=np.concatenate([result[1] for result in results])
+        current_counts=np.concatenate([result[2] for result in results])
+
+        with np.errstate(divide="ignore",invalid="ignore"):
+            effective_n=np.round(base_counts*current_counts/(base_counts+current_counts))
+        pvalues=np.full(n_columns,np.nan)
+        is_valid=~np.isnan(statistics)
+        pvalues[is_valid]=np.clip(kstwo.sf(statistics[is_valid],effective_n[is_valid]),0,1)
+        return statistics,pvalues
+    except Exception as e:
+        raise SensorException(e,sys)
+
+
+def ks_2samp_columns(base:np.ndarray,current:np.ndarray,
+                     n_jobs:Optional[int]=None,block_size:int=16)->Tuple[np.ndarray,np.ndarray]:
+    """
+    Column wise two sample KS test of two 2-D (rows, columns) arrays with the same columns
+    """
+    try:
+        return ks_2samp_sorted(sort_columns(base),sort_columns(current),n_jobs=n_jobs,block_size=block_size)
+    except Exception as e:
+        raise SensorException(e,sys)
+
+
+class QuantileSketch:
+    """
+    Mergeable per column quantile sketch (KLL style hierarchy of compactors) together
+    with row and null counts. Level h holds values of weight 2**h as a (columns, width)
+    array padded with NaN. A level holding more than capacity values is sorted and
+    every other value, starting at a random offset, is promoted to the next level.
+    Every compaction moves the rank of a point by at most the weight of the level
+    either way at random, rank_variance sums these squared weights
+    """
+    def __init__(self,columns:List[str],capacity:int=2048,seed:int=42):
+        try:
+            self.columns=list(columns)
+            self.capacity=capacity
+            self.random_state=np.random.default_rng(seed)
+            self.levels=[]
+            self.n_rows=0
+            self.null_counts=np.zeros(len(self.columns),dtype=np.int64)
+            self.rank_variance=0.0
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def update(self,values:np.ndarray)->"QuantileSketch":
+        """
+        Adds a (rows, columns) chunk of values
+        """
+        try:
+            values=np.asarray(values,dtype=np.float64)
+            self.n_rows+=values.shape[0]
+            self.null_counts+=np.count_nonzero(np.isnan(values),axis=0)
+            self._add(0,values.T)
+            self._compact()
+            return self
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def merge(self,other:"QuantileSketch")->"QuantileSketch":
+        try:
+            if other.columns!=self.columns:
+                raise Exception("Sketches with different columns can not be merged")
+            self.n_rows+=other.n_rows
+            self.null_counts+=other.null_counts
+            self.rank_variance+=other.rank_variance
+            for level,values in enumerate(other.levels):
+                self._add(level,values)
+            self._compact()
+            return self
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def _add(self,level:int,values:np.ndarray)->None:
+        while len(self.levels)<=level:
+            self.levels.append(np.empty((len(self.columns),0)))
+        self.levels[level]=np.concatenate([self.levels[level],values],axis=1)
+
+    def _compact(self)->None:
+        level=0
+        while level<len(self.levels):
+            if self.levels[level].shape[1]>self.capacity:
+                values=np.sort(self.levels[level],axis=1)
+                # trailing positions which are NaN in every column carry no values
+                values=values[:,:np.count_nonzero(~np.isnan(values),axis=1).max(initial=0)]
+                if values.shape[1]>self.capacity:
+                    offset=int(self.random_state.integers(2))
+                    self.levels[level]=np.empty((len(self.columns),0))
+                    self._add(level+1,values[:,offset::2])
+                    self.rank_variance+=4.0**level
+                else:
+                    self.levels[level]=values
+            level+=1
+
+    @property
+    def non_null_counts(self)->np.ndarray:
+        return self.n_rows-self.null_counts
+
+    @property
+    def effective_counts(self)->np.ndarray:
+        """
+        Size per column of an exact sample whose CDF is as noisy as the sketch CDF : the
+        sampling variance (at most 1/4n) plus the compaction variance rank_variance/n**2
+        """
+        counts=self.non_null_counts.astype(np.float64)
+        with np.errstate(divide="ignore",invalid="ignore"):
+            return np.where(counts>0,1/(1/counts+4*self.rank_variance/counts**2),0.0)
+
+    def weighted_values(self,column_index:int)->Tuple[np.ndarray,np.ndarray]:
+        """
+        Sorted retained values of a column and the cumulative fraction of rows at or
+        below every value
+        """
+        try:
+            values=[]
+            weights=[]
+            for level,level_values in enumerate(self.levels):
+                column_values=level_values[column_index]
+                column_values=column_values[~np.isnan(column_values)]
+                values.append(column_values)
+                weights.append(np.full(len(column_values),2.0**level))
+            values=np.concatenate(values) if len(values)>0 else np.empty(0)
+            weights=np.concatenate(weights) if len(weights)>0 else np.empty(0)
+            order=np.argsort(values,kind="stable")
+            cumulative_weights=np.cumsum(weights[order])
+            if len(cumulative_weights)>0:
+                cumulative_weights/=cumulative_weights[-1]
+            return values[order],cumulative_weights
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def cdf(self,column_index:int,points:np.ndarray)->np.ndarray:
+        try:
+            values,cumulative_weights=self.weighted_values(column_index)
+            if len(values)==0:
+                return np.full(len(points),np.nan)
+            positions=np.searchsorted(values,points,side="right")
+            return np.where(positions>0,cumulative_weights[np.maximum(positions-1,0)],0.0)
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def quantiles(self,column_index:int,probabilities:np.ndarray)->np.ndarray:
+        try:
+            values,cumulative_weights=self.weighted_values(column_index)
+            if len(values)==0:
+                return np.full(len(probabilities),np.nan)
+            positions=np.searchsorted(cumulative_weights,probabilities,side="left")
+            return values[np.minimum(positions,len(values)-1)]
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def save(self,file_path:str)->None:
+        try:
+            os.makedirs(os.path.dirname(file_path),exist_ok=True)
+            with open(file_path,"wb") as file_obj:
+                np.savez(file_obj,columns=np.array(self.columns),capacity=self.capacity,n_rows=self.n_rows,
+                         null_counts=self.null_counts,rank_variance=self.rank_variance,**{f"level_{level}":values for level,values in enumerate(self.levels)})
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    @classmethod
+    def load(cls,file_path:str)->"QuantileSketch":
+        try:
+            with np.load(file_path) as data:
+                sketch=cls(columns=data["columns"].tolist(),capacity=int(data["capacity"]))
+                sketch.n_rows=int(data["n_rows"])
+                sketch.null_counts=data["null_counts"]
+                sketch.rank_variance=float(data["rank_variance"])
+                n_levels=len([key for key in data.files if key.startswith("level_")])
+                sketch.levels=[data[f"level_{level}"] for level in range(n_levels)]
+            return sketch
+        except Exception as e:
+            raise SensorException(e,sys)
+
+
+def get_partition_sketch(partition_path:str,capacity:int,batch_size:int,cache_dir:str)->QuantileSketch:
+    """
+    Sketch of the feature columns of one dataset file, built in a single chunked pass.
+    Sketches are cached by file path, size, modification time and capacity, the
+    modification time of a cached sketch is its last use (see evict_sketches)
+    """
+    try:
+        stat=os.stat(partition_path)
+        key=f"{os.path.abspath(partition_path)}:{stat.st_size}:{stat.st_mtime_ns}:{capacity}:{SKETCH_FORMAT_VERSION}"
+        cache_file_path=os.path.join(cache_dir,f"{hashlib.sha1(key.encode()).hexdigest()}.npz")
+        if os.path.exists(cache_file_path):
+            os.utime(cache_file_path)
+            return QuantileSketch.load(cache_file_path)
+
+        logging.info(f"Building sketch of {partition_path}")
+        sketch=None
+        for df in utils.iter_dataset_batches(partition_path,batch_size=batch_size):
+            feature_columns=[column for column in df.columns if column not in (TARGET_COLUMN,"_id")]
+            if sketch is None:
+                sketch=QuantileSketch(columns=feature_columns,capacity=capacity)
+            sketch.update(df[sketch.columns].to_numpy(dtype=np.float64))
+        if sketch is None:
+            raise Exception(f"{partition_path} is empty")
+        sketch.save(cache_file_path)
+        return sketch
+    except Exception as e:
+        raise SensorException(e,sys)
+
+
+def evict_sketches(cache_dir:str,max_age_days:float,max_size_mb:float,used_since:Optional[float]=None)->int:
+    """
+    Removes cached sketches not used for max_age_days, then the least recently used
+    ones until the cache fits in max_size_mb. Sketches used since the used_since
+    timestamp are kept
+    returns: the number of removed sketches
+    """
+    try:
+        if not os.path.isdir(cache_dir):
+            return 0
+        file_paths=[os.path.join(cache_dir,file_name) for file_name in os.listdir(cache_dir) if file_name.endswith(".npz")]
+        stats={file_path:os.stat(file_path) for file_path in file_paths}
+        file_paths.sort(key=lambda file_path:stats[file_path].st_mtime)
+        oldest_allowed=time.time()-max_age_days*86400
+        total_size=sum(stat.st_size for stat in stats.values())
+        n_removed=0
+        for file_path in file_paths:
+            last_used=stats[file_path].st_mtime
+            if used_since is not None and last_used>=used_since:
+                continue
+            if last_used<oldest_allowed or total_size>max_size_mb*2**20:
+                os.remove(file_path)
+                total_size-=stats[file_path].st_size
+                n_removed+=1
+        if n_removed>0:
+            logging.info(f"Removed {n_removed} cached sketches from {cache_dir}")
+        return n_removed
+    except Exception as e:
+        raise SensorException(e,sys)
+
+
+def get_dataset_sketch(partition_paths:List[str],capacity:int,batch_size:int,cache_dir:str)->QuantileSketch:
+    """
+    Merged sketch of several partitions, only partitions without a cached sketch are read
+    """
+    try:
+        sketch=None
+        for partition_path in partition_paths:
+            partition_sketch=get_partition_sketch(partition_path,capacity=capacity,batch_size=batch_size,cache_dir=cache_dir)
+            sketch=partition_sketch if sketch is None else sketch.merge(partition_sketch)
+        return sketch
+    except Exception as e:
+        raise SensorException(e,sys)
+
+
+def ks_2samp_sketches(base:QuantileSketch,current:QuantileSketch,columns:List[str])->Tuple[np.ndarray,np.ndarray]:
+    """
+    Approximate column wise KS statistic and asymptotic p-value from two sketches. The
+    p-value uses the effective counts of the sketches instead of the row counts, so
+    the compaction error is not taken for drift on large datasets
+    """
+    try:
+        from scipy.stats import kstwo
+        statistics=np.full(len(columns),np.nan)
+        for i,column in enumerate(columns):
+            base_index,current_index=base.columns.index(column),current.columns.index(column)
+            points=np.concatenate([base.weighted_values(base_index)[0],current.weighted_values(current_index)[0]])
+            if base.non_null_counts[base_index]>0 and current.non_null_counts[current_index]>0:
+                statistics[i]=np.max(np.abs(base.cdf(base_index,points)-current.cdf(current_index,points)))
+
+        base_counts=np.array([base.effective_counts[base.columns.index(column)] for column in columns])
+        current_counts=np.array([current.effective_counts[current.columns.index(column)] for column in columns])
+        pvalues=np.full(len(columns),np.nan)
+        is_valid=~np.isnan(statistics)
+        effective_n=np.round(base_counts[is_valid]*current_counts[is_valid]/(base_counts[is_valid]+current_counts[is_valid]))
+        pvalues[is_valid]=np.clip(kstwo.sf(statistics[is_valid],effective_n),0,1)
+        return statistics,pvalues
+    except Exception as e:
+        raise SensorException(e,sys)
+
+
+def psi_sketches(base:QuantileSketch,current:QuantileSketch,columns:List[str],n_bins:int=10)->np.ndarray:
+    """
+    Population stability index per column over n_bins bins whose edges are the base
+    quantiles, bin fractions are read from both sketches
+    """
+    try:
+        psi=np.full(len(columns),np.nan)
+        probabilities=np.arange(1,n_bins)/n_bins
+        for i,column in enumerate(columns):
+            base_index,current_index=base.columns.index(column),current.columns.index(column)
+            if base.non_null_counts[base_index]==0 or current.non_null_counts[current_index]==0:
+                continue
+            edges=np.unique(base.quantiles(base_index,probabilities))
+            base_fractions=np.diff(np.concatenate([[0.0],base.cdf(base_index,edges),[1.0]]))
+            current_fractions=np.diff(np.concatenate([[0.0],current.cdf(current_index,edges),[1.0]]))
+            base_fractions=np.clip(base_fractions,1e-4,None)
+            current_fractions=np.clip(current_fractions,1e-4,None)
+            psi[i]=np.sum((current_fractions-base_fractions)*np.log(current_fractions/base_fractions))
+        return psi
+    except Exception as e:
+        raise SensorException(e,sys)
@@ -1,10 +1,13 @@
 from dataclasses import dataclass
+from typing import Dict,Optional
 
 @dataclass
 class DataIngestionArtifact:
     feature_store_file_path:str
     train_file_path:str
     test_file_path:str
+    new_train_file_path:Optional[str]=None
+    new_test_file_path:Optional[str]=None
 
 @dataclass 
 class DataValidationArtifact:
@@ -14,9 +17,16 @@ class DataValidationArtifact:
 @dataclass
 class DataTransformationArtifact:
     transformer_obj_path:str
+    # single array with the label as last column, or the features file when the
+    # target file paths are set
     transformed_train_file_path:str
     transformed_test_file_path:str
     target_encoder_file_path:str
+    class_weights:Optional[Dict[int,float]]=None
+    transformed_train_features_file_path:Optional[str]=None
+    transformed_train_target_file_path:Optional[str]=None
+    transformed_test_features_file_path:Optional[str]=None
+    transformed_test_target_file_path:Optional[str]=None
 
 
 @dataclass
@@ -24,12 +34,19 @@ class ModelTrainingArtifact:
     model_file_path:str
     f1_train_score:float
     f1_test_score:float
+    training_rows_per_second:Optional[float]=None
 
 
 @dataclass
 class ModelEvaluationArtifact:
     is_model_accepted:bool
     improved_accuracy:float
+    champion_score:Optional[float]=None
+    challenger_score:Optional[float]=None
+    report_file_path:Optional[str]=None
+    # load_seconds, size_mb, p50_ms, p99_ms and rows_per_second by batch size
+    champion_performance:Optional[dict]=None
+    challenger_performance:Optional[dict]=None
 
 @dataclass
 class ModelPusherArtifact:
@@ -10,11 +10,27 @@ TEST_FILE_NAME='test.csv'
 TRANSFORMER_FILE_NAME='transformer.pkl'
 TARGET_ENCODER_OBJECT_FILE_NAME='target_encoder.pkl'
 MODEL_FILE_NAME='model.pkl'
+BUNDLE_FILE_NAME='model.bundle'
+WATERMARK_FILE_NAME='watermark.yaml'
+
+def get_file_name(file_name:str,file_format:str)->str:
+    return f"{os.path.splitext(file_name)[0]}.{file_format}"
 
 class TrainingPipelineConfig:
     def __init__(self):
         try:
             self.artifact_dir=os.path.join(os.getcwd(),"artifact",f"{datetime.now().strftime('%m-%d-%Y_%H-%M')}")
+            # stages whose inputs, config and code did not change reuse the artifact of
+            # a previous run, see sensor.stage_cache
+            self.stage_cache_dir=os.path.join(os.getcwd(),"stage_cache")
+            self.stage_cache_max_age_days=30
+            self.stage_cache_max_size_mb=10240
+            # run and registry files are hard links to content addressed objects stored once,
+            # see sensor.blob_store. Runs beyond the keep_runs most recent or older than
+            # max_run_age_days are pruned by prune.py, None disables a limit
+            self.blob_store_dir=os.path.join(os.getcwd(),"blob_store")
+            self.keep_runs=10
+            self.max_run_age_days=90
         except Exception as e:
             raise SensorException(e,sys)
         
@@ -24,10 +40,26 @@ class DataIngestionConfig:
             self.database_name='aps'
             self.collection_name='sensor'
             self.data_ingestion_dir=os.path.join(training_pipeline_config.artifact_dir,"data_ingestion")
-            self.feature_store_file_path=os.path.join(self.data_ingestion_dir,'feature_store',FILE_NAME)
-            self.train_file_path=os.path.join(self.data_ingestion_dir,'dataset',TRAIN_FILE_NAME)
-            self.test_file_path=os.path.join(self.data_ingestion_dir,'dataset',TEST_FILE_NAME)
+            # format of the feature store, train and test datasets : "parquet" or "csv"
+            self.file_format="parquet"
+            # also keep a csv copy of the feature store when file_format is not csv
+            self.export_csv=False
+            self.feature_store_file_path=os.path.join(self.data_ingestion_dir,'feature_store',get_file_name(FILE_NAME,self.file_format))
+            self.feature_store_csv_file_path=os.path.join(self.data_ingestion_dir,'feature_store',FILE_NAME)
+            self.train_file_path=os.path.join(self.data_ingestion_dir,'dataset',get_file_name(TRAIN_FILE_NAME,self.file_format))
+            self.test_file_path=os.path.join(self.data_ingestion_dir,'dataset',get_file_name(TEST_FILE_NAME,self.file_format))
             self.test_size=0.2
+            # "batch" loads the whole collection into one dataframe, "stream" writes the cursor in batches of batch_size,
+            # "incremental" streams only documents newer than the watermark into the persistent feature store,
+            # "parallel" reads n_workers _id ranges of the collection concurrently
+            self.ingestion_mode="batch"
+            self.batch_size=10000
+            self.n_workers=4
+            self.feature_store_dir=os.path.join("feature_store")
+            self.watermark_file_path=os.path.join(self.feature_store_dir,WATERMARK_FILE_NAME)
+            self.feature_store_partition_dir=os.path.join(self.feature_store_dir,"sensor")
+            self.train_partition_dir=os.path.join(self.feature_store_dir,"train")
+            self.test_partition_dir=os.path.join(self.feature_store_dir,"test")
         except Exception as e:
             SensorException(e,sys)
 
@@ -44,6 +76,25 @@ class DataValidationConfig:
         self.report_file_path=os.path.join(self.data_validation_dir,'report.yaml')
         self.missing_value_thresold=0.2
         self.base_file_path=os.path.join("./notebook/aps_failure_training_set1.csv")
+        self.reference_profile_dir=os.path.join("reference_profile")
+        # threads used by the drift engine, None uses every core
+        self.drift_n_jobs=None
+        # "exact" tests against the full base columns, "sketch" reads the datasets in
+        # chunks into mergeable quantile sketches and never holds them in memory
+        self.drift_mode="exact"
+        self.sketch_capacity=2048
+        self.sketch_batch_size=50000
+        self.sketch_cache_dir=os.path.join(self.reference_profile_dir,"sketches")
+        # cached sketches not used for this long, then the least recently used ones
+        # beyond this size, are removed after every sketch validation
+        self.sketch_cache_max_age_days=30
+        self.sketch_cache_max_size_mb=1024
+
+    def to_dict(self)->dict:
+        try:
+            return self.__dict__
+        except Exception  as e:
+            raise SensorException(e,sys)
 
 
 class DataTransformationConfig:
@@ -52,7 +103,42 @@ class DataTransformationConfig:
         self.transformer_object_path=os.path.join(self.data_transformation_dir,"Transformer",TRANSFORMER_FILE_NAME)
         self.transformed_train_path=os.path.join(self.data_transformation_dir,'transformed',TRAIN_FILE_NAME.replace('csv','npz'))
         self.transformed_test_path=os.path.join(self.data_transformation_dir,"transformed",TEST_FILE_NAME.replace('csv','npz'))
+        # low memory mode stores features and labels as separate .npy files which are
+        # opened memory mapped
+        self.transformed_train_features_path=os.path.join(self.data_transformation_dir,"transformed",TRAIN_FILE_NAME.replace('.csv','_features.npy'))
+        self.transformed_train_target_path=os.path.join(self.data_transformation_dir,"transformed",TRAIN_FILE_NAME.replace('.csv','_target.npy'))
+        self.transformed_test_features_path=os.path.join(self.data_transformation_dir,"transformed",TEST_FILE_NAME.replace('.csv','_features.npy'))
+        self.transformed_test_target_path=os.path.join(self.data_transformation_dir,"transformed",TEST_FILE_NAME.replace('.csv','_target.npy'))
         self.target_encoder_path=os.path.join(self.data_transformation_dir,"target_encoder",TARGET_ENCODER_OBJECT_FILE_NAME)
+        # float32 features transformed in place and uint8 labels stored in their own file
+        # instead of a float64 matrix with the label as its last column
+        self.low_memory=True
+        self.memory_report_file_path=os.path.join(self.data_transformation_dir,"memory_report.yaml")
+        # smote_tomek | approximate_smote_tomek | class_weight | none, see sensor.resampling
+        self.resampling_strategy="smote_tomek"
+        # cores used by the resampling neighbour searches, -1 uses every core
+        self.resampling_n_jobs=-1
+        # dimensions of the random projection used by approximate_smote_tomek
+        self.resampling_n_components=8
+        # the test set is only resampled when this is set, otherwise the model is
+        # evaluated on the real class balance. It stays on because the trainer's
+        # overfitting check compares against the f1 score of the resampled train set,
+        # scored on the real balance the test f1 drops far below it
+        self.resample_test=True
+        # new partition transformed with the production transformer for incremental training
+        self.incremental_transformation_dir=os.path.join(training_pipeline_config.artifact_dir,"Incremental_data_transformation")
+        self.incremental_transformer_object_path=os.path.join(self.incremental_transformation_dir,"Transformer",TRANSFORMER_FILE_NAME)
+        self.incremental_target_encoder_path=os.path.join(self.incremental_transformation_dir,"target_encoder",TARGET_ENCODER_OBJECT_FILE_NAME)
+        self.incremental_train_features_path=os.path.join(self.incremental_transformation_dir,"transformed",TRAIN_FILE_NAME.replace('.csv','_features.npy'))
+        self.incremental_train_target_path=os.path.join(self.incremental_transformation_dir,"transformed",TRAIN_FILE_NAME.replace('.csv','_target.npy'))
+        self.incremental_test_features_path=os.path.join(self.incremental_transformation_dir,"transformed",TEST_FILE_NAME.replace('.csv','_features.npy'))
+        self.incremental_test_target_path=os.path.join(self.incremental_transformation_dir,"transformed",TEST_FILE_NAME.replace('.csv','_target.npy'))
+
+    def to_dict(self)->dict:
+        try:
+            return self.__dict__
+        except Exception  as e:
+            raise SensorException(e,sys)
 
 
 
@@ -62,11 +148,83 @@ class ModelTrainingConfig:
         self.model_path=os.path.join(self.model_training_dir,"model",MODEL_FILE_NAME)
         self.expected_score=0.7
         self.overfitting_thresold=0.1
+        # hyperband search of the xgboost parameters, see sensor.tuning.HyperbandSearch
+        self.fine_tune=False
+        self.tuning_report_file_path=os.path.join(self.model_training_dir,"tuning","report.yaml")
+        # trials of every run are kept here to warm start the next search
+        self.tuning_history_dir=os.path.join(os.getcwd(),"tuning")
+        # budgets are ceilings, the search stops after tuning_max_passes passes over
+        # the hyperband brackets or as soon as a pass does not improve the best score
+        self.tuning_time_budget_seconds=600
+        self.tuning_cpu_budget_seconds=None
+        self.tuning_max_passes=1
+        self.tuning_n_workers=None
+        self.tuning_min_rounds=27
+        self.tuning_max_rounds=729
+        self.tuning_eta=3
+        self.tuning_early_stopping_rounds=20
+        self.tuning_validation_size=0.2
+        # xgboost training, see sensor.training.TrainingEngine (sklearn | quantile | external_memory)
+        self.training_engine="quantile"
+        self.tree_method="hist"
+        self.nthread=None
+        self.max_bin=256
+        self.external_memory_chunk_rows=65536
+        self.external_memory_cache_dir=os.path.join(self.model_training_dir,"xgb_cache")
+        self.training_report_file_path=os.path.join(self.model_training_dir,"training_report.yaml")
+        # "incremental" continues boosting the production model on the partition added by incremental
+        # ingestion and falls back to a full retrain when there is none or the update is rejected,
+        # "full" always retrains on the whole dataset
+        self.training_mode="incremental"
+        self.incremental_model_training_dir=os.path.join(training_pipeline_config.artifact_dir,"Incremental_model_training")
+        self.incremental_model_path=os.path.join(self.incremental_model_training_dir,"model",MODEL_FILE_NAME)
+        self.incremental_training_report_file_path=os.path.join(self.incremental_model_training_dir,"training_report.yaml")
+        # a few small steps, larger ones overfit the new partition
+        self.incremental_rounds=25
+        self.incremental_learning_rate=0.05
+        # guardrails, a full retrain runs instead when one of them is not met
+        self.incremental_min_rows=1000
+        self.incremental_max_updates=4
+        self.incremental_max_score_drop=0.05
+
+    def to_dict(self)->dict:
+        try:
+            return self.__dict__
+        except Exception  as e:
+            raise SensorException(e,sys)
 
         
 class ModelEvaluationConfig:
     def __init__(self,training_pipeline_config:TrainingPipelineConfig):
         self.change_thresold=0.01
+        self.model_evaluation_dir=os.path.join(training_pipeline_config.artifact_dir,"Model_evaluation")
+        self.report_file_path=os.path.join(self.model_evaluation_dir,"report.yaml")
+        # predictions of every model scored on every test set, keyed by model version and
+        # test data hash, see sensor.evaluation.ChampionChallenger
+        self.prediction_cache_dir=os.path.join(os.getcwd(),"evaluation_cache")
+        self.prediction_cache_max_entries=20
+        # processes scoring uncached models concurrently, None uses every core
+        self.n_workers=None
+        # serving performance gate : the challenger is rejected when its single row p50/p99 latency,
+        # throughput at any of latency_batch_sizes, load time or size regress beyond these ratios of
+        # the champion's. Timing differences below timing_tolerance_ms are ignored
+        self.performance_gate=True
+        self.latency_batch_sizes=[1000,10000,100000]
+        self.latency_n_single_rows=500
+        self.latency_n_repeats=3
+        self.max_latency_ratio=1.5
+        self.min_throughput_ratio=0.67
+        self.max_load_time_ratio=2.0
+        self.max_size_ratio=3.0
+        self.timing_tolerance_ms=2.0
+        # bundle of the challenger, benchmarked like batch prediction serves it
+        self.challenger_bundle_path=os.path.join(self.model_evaluation_dir,"challenger",BUNDLE_FILE_NAME)
+
+    def to_dict(self)->dict:
+        try:
+            return self.__dict__
+        except Exception  as e:
+            raise SensorException(e,sys)
 
 class ModelPusherConfig:
     def __init__(self,training_pipeline_config:TrainingPipelineConfig):
@@ -76,6 +234,9 @@ class ModelPusherConfig:
         self.pusher_model_path = os.path.join(self.pusher_model_dir,MODEL_FILE_NAME)
         self.pusher_transformer_path = os.path.join(self.pusher_model_dir,TRANSFORMER_FILE_NAME)
         self.pusher_target_encoder_path = os.path.join(self.pusher_model_dir,TARGET_ENCODER_OBJECT_FILE_NAME)
+        # booster, transformer parameters and label classes in one file, see sensor.bundle
+        self.pusher_bundle_path = os.path.join(self.pusher_model_dir,BUNDLE_FILE_NAME)
+        self.blob_store_dir=training_pipeline_config.blob_store_dir
         
     
         
@@ -0,0 +1,340 @@
+import os
+import sys
+import time
+import hashlib
+import multiprocessing
+import numpy as np
+from dataclasses import dataclass,asdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable,Dict,List,Optional
+
+from sensor.logger import logging
+from sensor.exception import SensorException
+from sensor.config import TARGET_COLUMN
+from sensor import utils
+
+PREDICTIONS_FILE_SUFFIX=".npz"
+
+
+@dataclass
+class Candidate:
+    name:str
+    model_path:str
+    transformer_path:str
+    target_encoder_path:str
+    # model bundle batch prediction serves from, None for models pushed before bundles
+    bundle_path:Optional[str]=None
+
+
+def get_files_hash(file_paths:List[str])->str:
+    try:
+        from sensor.reference_profile import get_file_hash
+        sha256=hashlib.sha256()
+        for file_path in file_paths:
+            sha256.update(get_file_hash(file_path).encode())
+        return sha256.hexdigest()
+    except Exception as e:
+        raise SensorException(e,sys)
+
+
+def get_candidate_key(candidate:Candidate)->str:
+    """
+    Version of a model : the content hash of its model, transformer and target encoder
+    """
+    return get_files_hash([candidate.model_path,candidate.transformer_path,candidate.target_encoder_path])
+
+
+def load_transform(transformer_path:str)->Callable[[np.ndarray,List[str]],np.ndarray]:
+    """
+    Transform function of a saved transformer : the fused transform of the
+    SimpleImputer + RobustScaler pipeline, any other transformer goes through its own
+    transform
+    """
+    try:
+        import pandas as pd
+        from sensor.inference import FastTransformer
+        transformer=utils.load_object(transformer_path)
+        try:
+            fast_transformer=FastTransformer.from_pipeline(transformer)
+        except SensorException:
+            feature_names=list(transformer.feature_names_in_)
+            return lambda X,columns:np.asarray(transformer.transform(pd.DataFrame(X,columns=columns)[feature_names]))
+        return lambda X,columns:fast_transformer.transform(X,columns=columns)
+    except Exception as e:
+        raise SensorException(e,sys)
+
+
+def transform_features(transformer_path:str,X:np.ndarray,columns:List[str])->np.ndarray:
+    try:
+        return load_transform(transformer_path)(X,columns)
+    except Exception as e:
+        raise SensorException(e,sys)
+
+
+def score_candidate(candidate:dict,features_file_path:str,labels_file_path:str,predictions_file_path:str,
+                    nthread:Optional[int]=None)->dict:
+    """
+    Predicts the transformed test features with the candidate's model and caches labels,
+    predictions and probabilities of the positive class in predictions_file_path. Runs
+    in the evaluation worker processes
+    """
+    try:
+        from sklearn.metrics import f1_score
+        start_time=time.perf_counter()
+        model=utils.load_object(candidate["model_path"])
+        target_encoder=utils.load_object(candidate["target_encoder_path"])
+        if nthread is not None and hasattr(model,"n_jobs"):
+            model.set_params(n_jobs=nthread)
+        X=np.load(features_file_path,mmap_mode="r")
+        y_true=target_encoder.transform(np.load(labels_file_path))
+        y_proba=model.predict_proba(X)
+        y_pred=y_proba.argmax(axis=1)
+        tmp_file_path=f"{predictions_file_path}.{os.getpid()}.tmp"
+        with open(tmp_file_path,"wb") as file_obj:
+            np.savez(file_obj,y_true=y_true.astype(np.int8),y_pred=y_pred.astype(np.int8),
+                     y_proba=y_proba[:,-1].astype(np.float32))
+        os.replace(tmp_file_path,predictions_file_path)
+        return {"name":candidate["name"],
+                "score":float(f1_score(y_true=y_true,y_pred=y_pred)),
+                "n_rows":len(y_true),
+                "seconds":time.perf_counter()-start_time,
+                "cached":False}
+    except Exception as e:
+        raise SensorException(e,sys)
+
+
+def benchmark_candidate(candidate:Candidate,X:np.ndarray,columns:List[str],batch_sizes:List[int],
+                        n_single_rows:int=500,n_repeats:int=3)->dict:
+    """
+    Serving performance of a candidate on raw test features, measured like batch
+    prediction runs it : load of its model bundle (of its three pickled objects when it
+    has none), then transform, predict and decode the labels. Every measure is the
+    best of n_repeats runs, the first load also pays for imports and
+    single row latencies catch scheduling noise. Latency percentiles are taken over
+    n_single_rows rows after a warm up, batch throughput on test rows repeated up to
+    batch size
+    returns: {"load_seconds","size_mb","p50_ms","p99_ms","rows_per_second":{batch size : rows/s}}
+    """
+    try:
+        if candidate.bundle_path is not None:
+            from sensor.bundle import ModelBundle
+            file_paths=[candidate.bundle_path]
+
+            def load()->Callable[[np.ndarray],np.ndarray]:
+                bundle=ModelBundle.load(candidate.bundle_path)
+                return lambda batch:bundle.inverse_transform(bundle.predict(batch,columns=columns))
+        else:
+            file_paths=[candidate.model_path,candidate.transformer_path,candidate.target_encoder_path]
+
+            def load()->Callable[[np.ndarray],np.ndarray]:
+                model=utils.load_object(candidate.model_path)
+                transform=load_transform(candidate.transformer_path)
+                target_encoder=utils.load_object(candidate.target_encoder_path)
+                return lambda batch:target_encoder.inverse_transform(model.predict(transform(batch,columns)))
+
+        load_seconds=[]
+        for _ in range(n_repeats):
+            start_time=time.perf_counter()
+            predict=load()
+            load_seconds.append(time.perf_counter()-start_time)
+
+        predict(X[:1])
+        latencies_ms=np.empty((n_repeats,n_single_rows))
+        for repeat in range(n_repeats):
+            for i in range(n_single_rows):
+                row=X[i%len(X)][None,:]
+                start_time=time.perf_counter()
+                predict(row)
+                latencies_ms[repeat,i]=(time.perf_counter()-start_time)*1000
+
+        rows_per_second=dict()
+        for batch_size in batch_sizes:
+            batch=np.ascontiguousarray(X[np.arange(batch_size)%len(X)])
+            seconds=[]
+            for _ in range(n_repeats):
+                start_time=time.perf_counter()
+                predict(batch)
+                seconds.append(time.perf_counter()-start_time)
+            rows_per_second[batch_size]=float(batch_size/min(seconds))
+        return {"load_seconds":float(min(load_seconds)),
+                "size_mb":sum(os.path.getsize(file_path) for file_path in file_paths)/2**20,
+                "p50_ms":float(np.percentile(latencies_ms,50,axis=1).min()),
+                "p99_ms":float(np.percentile(latencies_ms,99,axis=1).min()),
+                "rows_per_second":rows_per_second}
+    except Exception as e:
+        raise SensorException(e,sys)
+
+
+def get_performance_regressions(champion:dict,challenger:dict,max_latency_ratio:float,min_throughput_ratio:float,
+                                max_load_time_ratio:float,max_size_ratio:float,timing_tolerance_ms:float=2.0)->List[str]:
+    """
+    Budgets of benchmark_candidate results the challenger exceeds compared to the
+    champion. Timing differences below timing_tolerance_ms are noise and never count
+    """
+    regressions=[]
+    tolerance_seconds=timing_tolerance_ms/1000
+    for name,ratio,tolerance in [("p50_ms",max_latency_ratio,timing_tolerance_ms),
+                                 ("p99_ms",max_latency_ratio,timing_tolerance_ms),
+                                 ("load_seconds",max_load_time_ratio,tolerance_seconds),
+                                 ("size_mb",max_size_ratio,0.0)]:
+        if challenger[name]>champion[name]*ratio and challenger[name]-champion[name]>tolerance:
+            regressions.append(f"{name} {challenger[name]:.4g} > {ratio} x {champion[name]:.4g}")
+    for batch_size,rows_per_second in challenger["rows_per_second"].items():
+        champion_rows_per_second=champion["rows_per_second"].get(batch_size)
+        if champion_rows_per_second is None:
+            continue
+        # time per batch grows by less than the tolerance on small batches
+        if rows_per_second<champion_rows_per_second*min_throughput_ratio and \
+           batch_size/rows_per_second-batch_size/champion_rows_per_second>tolerance_seconds:
+            regressions.append(f"rows/s at batch size {batch_size} {rows_per_second:.0f} < {min_throughput_ratio} x {champion_rows_per_second:.0f}")
+    return regressions
+
+
+class ChampionChallenger:
+    """
+    Scores candidate models on one test set
+    =============================================================
+    cache_dir : predictions of every (model version, test data hash) pair already
+    scored, so the production model is not predicted again while the test set is
+    unchanged. The least recently used files beyond max_cache_entries are removed
+    work_dir : test features and labels, loaded once with the dataset schema and
+    transformed once per distinct transformer, stored as memory mapped .npy files
+    n_workers : processes predicting the uncached candidates concurrently, all cores
+    when None
+    benchmark measures their serving latency, throughput, load time and size
+    """
+    def __init__(self,cache_dir:str,work_dir:str,max_cache_entries:int=20,n_workers:Optional[int]=None):
+        try:
+            self.cache_dir=cache_dir
+            self.work_dir=work_dir
+            self.max_cache_entries=max_cache_entries
+            self.n_workers=n_workers or os.cpu_count() or 1
+            self.test_set=None
+            os.makedirs(self.cache_dir,exist_ok=True)
+            os.makedirs(self.work_dir,exist_ok=True)
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def get_predictions_file_path(self,candidate_key:str,data_key:str)->str:
+        return os.path.join(self.cache_dir,f"{candidate_key[:20]}_{data_key[:20]}{PREDICTIONS_FILE_SUFFIX}")
+
+    def read_predictions(self,predictions_file_path:str)->Dict[str,np.ndarray]:
+        with np.load(predictions_file_path) as predictions:
+            return {name:predictions[name] for name in predictions.files}
+
+    def evict(self)->None:
+        try:
+            file_paths=[os.path.join(self.cache_dir,file_name) for file_name in os.listdir(self.cache_dir)
+                        if file_name.endswith(PREDICTIONS_FILE_SUFFIX)]
+            file_paths.sort(key=os.path.getmtime,reverse=True)
+            for file_path in file_paths[self.max_cache_entries:]:
+                os.remove(file_path)
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def load_test_set(self,test_file_path:str)->tuple:
+        """
+        Reads the typed test set once and saves its raw features and labels for the
+        workers and the benchmark
+        returns: (raw features file path, labels file path, feature columns)
+        """
+        try:
+            if self.test_set is not None and self.test_set[0]==test_file_path:
+                return self.test_set[1]
+            test_df=utils.read_dataset(test_file_path)
+            columns=[column for column in test_df.columns if column!=TARGET_COLUMN]
+            features_file_path=os.path.join(self.work_dir,"test_features.npy")
+            labels_file_path=os.path.join(self.work_dir,"test_labels.npy")
+            utils.save_numpy_array_mmap(file_path=features_file_path,array=test_df[columns].to_numpy(dtype=np.float32))
+            utils.save_numpy_array_data(file_path=labels_file_path,array=test_df[TARGET_COLUMN].astype(str).to_numpy(dtype=str))
+            self.test_set=(test_file_path,(features_file_path,labels_file_path,columns))
+            return self.test_set[1]
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def score(self,candidates:List[Candidate],test_file_path:str)->Dict[str,dict]:
+        """
+        F1 score of every candidate on the test set, from the prediction cache when the
+        candidate already predicted this test set
+        returns: {candidate name : {"score","n_rows","seconds","cached","version","predictions_file_path"}}
+        """
+        try:
+            from sklearn.metrics import f1_score
+            data_key=get_files_hash(utils.get_partition_paths(test_file_path))
+            results=dict()
+            tasks=[]
+            for candidate in candidates:
+                candidate_key=get_candidate_key(candidate)
+                predictions_file_path=self.get_predictions_file_path(candidate_key,data_key)
+                if os.path.exists(predictions_file_path):
+                    start_time=time.perf_counter()
+                    predictions=self.read_predictions(predictions_file_path)
+                    os.utime(predictions_file_path)
+                    results[candidate.name]={"score":float(f1_score(y_true=predictions["y_true"],y_pred=predictions["y_pred"])),
+                                             "n_rows":len(predictions["y_true"]),
+                                             "seconds":time.perf_counter()-start_time,
+                                             "cached":True}
+                elif predictions_file_path not in [file_path for _,file_path in tasks]:
+                    tasks.append((candidate,predictions_file_path))
+                results[candidate.name]={**results.get(candidate.name,dict()),"version":candidate_key,
+                                         "predictions_file_path":predictions_file_path}
+
+            if len(tasks)>0:
+                raw_features_file_path,labels_file_path,columns=self.load_test_set(test_file_path)
+                raw_features=np.load(raw_features_file_path,mmap_mode="r")
+                # candidates sharing a transformer share its transformed features
+                features_file_paths=dict()
+                for candidate,_ in tasks:
+                    transformer_key=get_files_hash([candidate.transformer_path])
+                    if transformer_key not in features_file_paths:
+                        features_file_path=os.path.join(self.work_dir,f"test_features_{transformer_key[:20]}.npy")
+                        utils.save_numpy_array_mmap(file_path=features_file_path,
+                                                    array=transform_features(candidate.transformer_path,raw_features,columns))
+                        features_file_paths[transformer_key]=features_file_path
+                    features_file_paths[candidate.name]=features_file_paths[transformer_key]
+
+                n_workers=min(self.n_workers,len(tasks))
+                nthread=max(1,(os.cpu_count() or 1)//n_workers)
+                args=[(asdict(candidate),features_file_paths[candidate.name],labels_file_path,predictions_file_path,nthread)
+                      for candidate,predictions_file_path in tasks]
+                if n_workers==1:
+                    scores=[score_candidate(*task_args) for task_args in args]
+                else:
+                    mp_context=multiprocessing.get_context("spawn")
+                    with ProcessPoolExecutor(max_workers=n_workers,mp_context=mp_context) as executor:
+                        scores=list(executor.map(score_candidate,*zip(*args)))
+                # candidates of the same version are predicted once
+                scores={results[candidate_score["name"]]["predictions_file_path"]:candidate_score for candidate_score in scores}
+                for result in results.values():
+                    if result["predictions_file_path"] in scores:
+                        result.update({name:value for name,value in scores[result["predictions_file_path"]].items() if name!="name"})
+                self.evict()
+
+            logging.info(f"Candidate scores : {results}")
+            return results
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def benchmark(self,candidates:List[Candidate],test_file_path:str,batch_sizes:List[int],
+                  n_single_rows:int=500,n_repeats:int=3)->Dict[str,dict]:
+        """
+        benchmark_candidate results of every candidate, best of n_repeats passes. The
+        passes of the candidates are interleaved in this process so machine noise hits
+        them alike, the numbers depend on the machine and are not cached
+        """
+        try:
+            raw_features_file_path,_,columns=self.load_test_set(test_file_path)
+            X=np.load(raw_features_file_path,mmap_mode="r")
+            results=dict()
+            for _ in range(n_repeats):
+                for candidate in candidates:
+                    result=benchmark_candidate(candidate,X,columns,batch_sizes=batch_sizes,n_single_rows=n_single_rows,n_repeats=1)
+                    best=results.setdefault(candidate.name,result)
+                    for name in ("load_seconds","p50_ms","p99_ms"):
+                        best[name]=min(best[name],result[name])
+                    for batch_size,rows_per_second in result["rows_per_second"].items():
+                        best["rows_per_second"][batch_size]=max(best["rows_per_second"][batch_size],rows_per_second)
+            logging.info(f"Candidate serving performance : {results}")
+            return results
+        except Exception as e:
+            raise SensorException(e,sys)
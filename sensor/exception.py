@@ -15,4 +15,17 @@ class SensorException(Exception):
         self.error_message=error_message_details(error_message,error_detail)
 
     def __str__(self):
-        return self.error_message
\ No newline at end of file
+        return self.error_message
+
+
+class ModelRejected(Exception):
+    """
+    A quality gate rejected the trained model. The components raise it unwrapped so a
+    caller with a fallback can tell it from a failure, see run_incremental_training
+    """
+
+
+class IncrementalUpdateRejected(ModelRejected):
+    """
+    A guardrail of incremental training rejected the update, a full retrain is due
+    """
@@ -0,0 +1,109 @@
+import sys
+import numpy as np
+import pandas as pd
+from typing import TYPE_CHECKING,Dict,List,Optional,Sequence,Tuple,Union
+
+from sensor.exception import SensorException
+
+if TYPE_CHECKING:
+    from sklearn.pipeline import Pipeline
+
+
+class FastTransformer:
+    """
+    Inference only equivalent of the fitted SimpleImputer + RobustScaler pipeline. The
+    fill values, center_ and scale_ are extracted once into contiguous arrays and
+    applied in place on a float32 copy of the input, without sklearn's per call input
+    validation. The output is identical to pipeline.transform on float32 input
+    """
+    def __init__(self,feature_names:Sequence[str],fill_values:np.ndarray,
+                 center:Optional[np.ndarray],scale:Optional[np.ndarray],dtype:str="float32"):
+        self.feature_names=list(feature_names)
+        self.dtype=np.dtype(dtype)
+        self.fill_values=np.ascontiguousarray(fill_values,dtype=self.dtype)
+        # kept in the dtype sklearn fitted them in, so the in place arithmetic rounds
+        # exactly like RobustScaler.transform does
+        self.center=None if center is None else np.ascontiguousarray(center)
+        self.scale=None if scale is None else np.ascontiguousarray(scale)
+        self._column_indices:Dict[Tuple[str,...],np.ndarray]=dict()
+
+    @classmethod
+    def from_pipeline(cls,pipeline:"Pipeline",dtype:str="float32")->"FastTransformer":
+        """
+        Builds the transformer from a fitted pipeline of a SimpleImputer followed by a
+        RobustScaler, any other layout is rejected
+        """
+        try:
+            from sklearn.impute import SimpleImputer
+            from sklearn.preprocessing import RobustScaler
+            steps=[step for _,step in pipeline.steps]
+            if len(steps)!=2 or not isinstance(steps[0],SimpleImputer) or not isinstance(steps[1],RobustScaler):
+                raise Exception(f"Only SimpleImputer + RobustScaler pipelines can be compiled, got {pipeline.steps}")
+            imputer,scaler=steps
+            if imputer.add_indicator or not np.all(np.isnan(np.array([imputer.missing_values],dtype=float))):
+                raise Exception("Only SimpleImputer(missing_values=np.nan) without indicator can be compiled")
+            fill_values=np.asarray(imputer.statistics_,dtype=float)
+            if len(fill_values)!=imputer.n_features_in_ or np.any(np.isnan(fill_values)):
+                raise Exception("Imputer drops empty features, it can not be compiled")
+            return cls(feature_names=pipeline.feature_names_in_,
+                       fill_values=fill_values,
+                       center=scaler.center_ if scaler.with_centering else None,
+                       scale=scaler.scale_ if scaler.with_scaling else None,
+                       dtype=dtype)
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def get_column_indices(self,columns:Sequence[str])->np.ndarray:
+        """
+        Positions of the fitted features in an input with the given columns, resolved
+        once per column layout
+        """
+        key=tuple(columns)
+        column_indices=self._column_indices.get(key)
+        if column_indices is None:
+            positions={column:i for i,column in enumerate(key)}
+            missing_columns=[column for column in self.feature_names if column not in positions]
+            if len(missing_columns)>0:
+                raise Exception(f"Input is missing columns {missing_columns}")
+            column_indices=np.array([positions[column] for column in self.feature_names])
+            self._column_indices[key]=column_indices
+        return column_indices
+
+    def to_array(self,X:Union[pd.DataFrame,np.ndarray],columns:Optional[Sequence[str]]=None)->np.ndarray:
+        """
+        C ordered float32 copy of the fitted features of X. Array input is expected in
+        feature order unless its columns are given
+        """
+        if isinstance(X,pd.DataFrame):
+            columns=list(X.columns)
+            if columns==self.feature_names:
+                return np.array(X.to_numpy(dtype=self.dtype),dtype=self.dtype,order="C",copy=True)
+            X=X.to_numpy(dtype=self.dtype)
+        if columns is not None and list(columns)!=self.feature_names:
+            return np.ascontiguousarray(np.asarray(X,dtype=self.dtype)[:,self.get_column_indices(columns)])
+        return np.array(X,dtype=self.dtype,order="C",copy=True)
+
+    def transform(self,X:Union[pd.DataFrame,np.ndarray],columns:Optional[Sequence[str]]=None)->np.ndarray:
+        try:
+            X=self.to_array(X,columns=columns)
+            if X.ndim!=2 or X.shape[1]!=len(self.feature_names):
+                raise Exception(f"Expected {len(self.feature_names)} features, got shape {X.shape}")
+            return self.transform_inplace(X)
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def transform_inplace(self,X:np.ndarray)->np.ndarray:
+        """
+        Imputes and scales a C ordered float32 array of the fitted features in place
+        """
+        is_missing=np.isnan(X)
+        np.copyto(X,np.broadcast_to(self.fill_values,X.shape),where=is_missing)
+        if self.center is not None:
+            np.subtract(X,self.center,out=X,casting="same_kind")
+        if self.scale is not None:
+            np.divide(X,self.scale,out=X,casting="same_kind")
+        return X
+
+    def get_params(self)->dict:
+        return {"feature_names":self.feature_names,"fill_values":self.fill_values,
+                "center":self.center,"scale":self.scale,"dtype":self.dtype.name}
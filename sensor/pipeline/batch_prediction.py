@@ -1,9 +1,6 @@
 import os , sys
-import pandas as pd
-import numpy as np
 from sensor.logger import logging
 from sensor.exception import SensorException
-from sensor.utils import load_object
 from sensor.predictor import ModelResolver
 
 from datetime import datetime
@@ -11,26 +8,36 @@ PREDICTION_DIR="prediction"
 
 def start_batch_prediction(input_file_path):
     try:
+        # pandas and the model libraries are only loaded once a prediction actually runs
+        from sensor.utils import load_object
+        from sensor.schema import APS_SCHEMA
+        from sensor.inference import FastTransformer
+        from sensor.bundle import ModelBundle
         os.makedirs(PREDICTION_DIR,exist_ok=True)
         logging.info(f"Creating model resolver object")
         model_resolver=ModelResolver(model_registry='saved_models')
         logging.info(f"Reading input files : {input_file_path}")
-        df=pd.read_csv(input_file_path)
-        df.replace('na',np.NaN,inplace=True)
-
-        logging.info("Loading Transformer object ")
-        transformer=load_object(model_resolver.get_latest_transformer_path())
-
-        input_feature_names=list(transformer.feature_names_in)
-        input_arr=transformer.transform(df[input_feature_names])
-
-        logging.info("Loading model to make Prediction")
-        model=load_object(file_path=model_resolver.get_latest_model_path())
-        prediction=model.predict(input_arr)
-
-        logging.info("Loading target encoder object ")
-        target_encoder=load_object(file_path=model_resolver.get_latest_target_encoder_path())
-        cat_prediction=target_encoder.inverse_transform(prediction)
+        df=APS_SCHEMA.read_csv(input_file_path)
+
+        bundle_path=model_resolver.get_latest_bundle_path()
+        if bundle_path is not None:
+            logging.info(f"Loading model bundle {bundle_path}")
+            bundle=ModelBundle.load(bundle_path)
+            prediction=bundle.predict(df[bundle.transformer.feature_names])
+            cat_prediction=bundle.inverse_transform(prediction)
+        else:
+            logging.info("Loading Transformer object ")
+            # the fitted pipeline is compiled once into arrays applied in place on float32
+            transformer=FastTransformer.from_pipeline(load_object(model_resolver.get_latest_transformer_path()))
+            input_arr=transformer.transform(df[transformer.feature_names])
+
+            logging.info("Loading model to make Prediction")
+            model=load_object(file_path=model_resolver.get_latest_model_path())
+            prediction=model.predict(input_arr)
+
+            logging.info("Loading target encoder object ")
+            target_encoder=load_object(file_path=model_resolver.get_latest_target_encoder_path())
+            cat_prediction=target_encoder.inverse_transform(prediction)
 
         df['prediction']=prediction
         df['cat_pred']=cat_prediction
@@ -1,55 +1,175 @@
 import os , sys
+from typing import Optional
 from sensor.logger import logging
-from sensor.exception import SensorException
+from sensor.exception import SensorException,ModelRejected
 
 from sensor.entity import config_entity
-from sensor.components.data_ingestion import DataIngestion
-from sensor.components.data_validation import DataValidation
-from sensor.components.data_transformation import DataTransformation
-from sensor.components.model_trainer import Model_trainer
-from sensor.components.model_evaluation import ModelEvaluation
-from sensor.components.model_pusher import ModelPusher
-
-def start_training_pipeline():
-    try:
-        training_pipeline_config=config_entity.TrainingPipelineConfig()
-
-
-        #data ingestion 
-        data_ingestion_config=config_entity.DataIngestionConfig(training_pipeline_config)
-        print(data_ingestion_config.to_dict())
-        data_ingestion=DataIngestion(data_ingestion_config=data_ingestion_config)
-        data_ingestion_artifact=data_ingestion.initiate_data_ingestion()
-
-        #data validation
 
-        data_validation_config=config_entity.DataValidationConfig(training_pipeline_config=training_pipeline_config)
-        data_validation=DataValidation(data_validation_config=data_validation_config,data_ingestion_artifact=data_ingestion_artifact)
-        data_validation_artifact=data_validation.initiate_data_validation()
+def run_full_training(training_pipeline_config:config_entity.TrainingPipelineConfig,data_ingestion_artifact,
+                      model_trainer_config:config_entity.ModelTrainingConfig,
+                      model_evaluation_config:config_entity.ModelEvaluationConfig,stage_cache)->tuple:
+    """
+    Fits the transformer and trains the model on the whole dataset, then evaluates it
+    against the production model
+    returns: (data transformation artifact, model trainer artifact)
+    """
+    try:
+        from sensor.components.data_transformation import DataTransformation
+        from sensor.components.model_trainer import Model_trainer
+        from sensor.components.model_evaluation import ModelEvaluation
 
         #data transformtion
         data_transformation_config=config_entity.DataTransformationConfig(training_pipeline_config=training_pipeline_config)
         data_transformation=DataTransformation(data_transformation_config=data_transformation_config,
                                                data_ingestion_artifact=data_ingestion_artifact
                                                )
-        data_transformation_artifact=data_transformation.initiate_data_transformation()
+        data_transformation_artifact=stage_cache.run(stage_name="data_transformation",
+                                                     config=data_transformation_config,
+                                                     stage_dir=data_transformation_config.data_transformation_dir,
+                                                     run_stage=data_transformation.initiate_data_transformation,
+                                                     input_artifacts=[data_ingestion_artifact])
 
         #model trainer
-        model_trainer_config=config_entity.ModelTrainingConfig(training_pipeline_config=training_pipeline_config)
         model_trainer=Model_trainer(model_trainer_config=model_trainer_config,
                                     data_transformation_artifact=data_transformation_artifact
                                     )
-        model_trainer_artifact=model_trainer.initiate_model_training()
+        model_trainer_artifact=stage_cache.run(stage_name="model_training",
+                                               config=model_trainer_config,
+                                               stage_dir=model_trainer_config.model_training_dir,
+                                               run_stage=model_trainer.initiate_model_training,
+                                               input_artifacts=[data_transformation_artifact])
 
         #model evaluation
-        model_evaluation_config=config_entity.ModelEvaluationConfig(training_pipeline_config=training_pipeline_config)
         model_evaluation=ModelEvaluation(model_eval_config=model_evaluation_config,
                                          data_ingestion_artifact=data_ingestion_artifact,
                                          data_transformation_artifact=data_transformation_artifact,
                                          model_trainer_artifact=model_trainer_artifact
                                          )
-        model_evaluation_artifact=model_evaluation.initiate_model_evaluation()
+        model_evaluation.initiate_model_evaluation()
+        return data_transformation_artifact,model_trainer_artifact
+    except Exception as e:
+        raise SensorException(e,sys)
+
+
+def run_incremental_training(training_pipeline_config:config_entity.TrainingPipelineConfig,data_ingestion_artifact,
+                             model_trainer_config:config_entity.ModelTrainingConfig,
+                             model_evaluation_config:config_entity.ModelEvaluationConfig)->Optional[tuple]:
+    """
+    Continues boosting the production model on the partition added by incremental
+    ingestion, transformed with the production transformer. Returns None, and the
+    caller retrains on the whole dataset, when there is no new partition or production
+    model, or when a guardrail of the trainer or the evaluation gate rejects the update
+    (ModelRejected). Any other error fails the run
+    returns: (data transformation artifact, model trainer artifact) or None
+    """
+    try:
+        from sensor.components.data_transformation import DataTransformation
+        from sensor.components.model_trainer import Model_trainer
+        from sensor.components.model_evaluation import ModelEvaluation
+        from sensor.predictor import ModelResolver
+
+        model_resolver=ModelResolver()
+        if data_ingestion_artifact.new_train_file_path is None:
+            logging.info("No new partition was ingested, retraining on the whole dataset")
+            return None
+        if model_resolver.get_latest_dir_path() is None:
+            logging.info("There is no production model to continue, retraining on the whole dataset")
+            return None
+
+        try:
+            data_transformation_config=config_entity.DataTransformationConfig(training_pipeline_config=training_pipeline_config)
+            data_transformation=DataTransformation(data_transformation_config=data_transformation_config,
+                                                   data_ingestion_artifact=data_ingestion_artifact)
+            data_transformation_artifact=data_transformation.initiate_incremental_data_transformation(
+                transformer_path=model_resolver.get_latest_transformer_path(),
+                target_encoder_path=model_resolver.get_latest_target_encoder_path())
+
+            model_trainer=Model_trainer(model_trainer_config=model_trainer_config,
+                                        data_transformation_artifact=data_transformation_artifact)
+            model_trainer_artifact=model_trainer.initiate_incremental_model_training(
+                base_model_path=model_resolver.get_latest_model_path())
 
+            model_evaluation=ModelEvaluation(model_eval_config=model_evaluation_config,
+                                             data_ingestion_artifact=data_ingestion_artifact,
+                                             data_transformation_artifact=data_transformation_artifact,
+                                             model_trainer_artifact=model_trainer_artifact)
+            model_evaluation.initiate_model_evaluation()
+        except ModelRejected as e:
+            logging.info(f"Incremental update rejected, retraining on the whole dataset : {e}")
+            return None
+        return data_transformation_artifact,model_trainer_artifact
+    except Exception as e:
+        raise SensorException(e,sys)
+
+
+def start_training_pipeline(force:bool=False):
+    """
+    Runs the training pipeline. Ingestion, validation, transformation and training are
+    skipped when their inputs, config and code match a cached run, force re-runs them.
+    In the incremental training mode the production model is first updated on the new
+    partition only, see run_incremental_training
+    """
+    training_pipeline_config,blob_store=None,None
+    try:
+        # components are imported here so importing the pipeline stays cheap
+        from sensor.components.data_ingestion import DataIngestion
+        from sensor.components.data_validation import DataValidation
+        from sensor.components.model_pusher import ModelPusher
+
+        from sensor import utils
+        from sensor.stage_cache import StageCache
+        from sensor.blob_store import BlobStore
+
+        training_pipeline_config=config_entity.TrainingPipelineConfig()
+        blob_store=BlobStore(store_dir=training_pipeline_config.blob_store_dir)
+        stage_cache=StageCache(cache_dir=training_pipeline_config.stage_cache_dir,
+                               artifact_dir=training_pipeline_config.artifact_dir,
+                               max_age_days=training_pipeline_config.stage_cache_max_age_days,
+                               max_size_mb=training_pipeline_config.stage_cache_max_size_mb,
+                               force=force)
+
+
+        #data ingestion 
+        data_ingestion_config=config_entity.DataIngestionConfig(training_pipeline_config)
+        print(data_ingestion_config.to_dict())
+        data_ingestion=DataIngestion(data_ingestion_config=data_ingestion_config)
+        if data_ingestion_config.ingestion_mode=="incremental":
+            # incremental ingestion appends to the persistent feature store on every run
+            data_ingestion_artifact=data_ingestion.initiate_data_ingestion()
+        else:
+            collection_fingerprint=utils.get_collection_fingerprint(database_name=data_ingestion_config.database_name,
+                                                                    collection_name=data_ingestion_config.collection_name)
+            data_ingestion_artifact=stage_cache.run(stage_name="data_ingestion",
+                                                    config=data_ingestion_config,
+                                                    stage_dir=data_ingestion_config.data_ingestion_dir,
+                                                    run_stage=data_ingestion.initiate_data_ingestion,
+                                                    extra=collection_fingerprint)
+
+        #data validation
+
+        data_validation_config=config_entity.DataValidationConfig(training_pipeline_config=training_pipeline_config)
+        data_validation=DataValidation(data_validation_config=data_validation_config,data_ingestion_artifact=data_ingestion_artifact)
+        data_validation_artifact=stage_cache.run(stage_name="data_validation",
+                                                 config=data_validation_config,
+                                                 stage_dir=data_validation_config.data_validation_dir,
+                                                 run_stage=data_validation.initiate_data_validation,
+                                                 input_artifacts=[data_ingestion_artifact])
+
+        model_trainer_config=config_entity.ModelTrainingConfig(training_pipeline_config=training_pipeline_config)
+        model_evaluation_config=config_entity.ModelEvaluationConfig(training_pipeline_config=training_pipeline_config)
+        artifacts=None
+        if model_trainer_config.training_mode=="incremental":
+            artifacts=run_incremental_training(training_pipeline_config=training_pipeline_config,
+                                               data_ingestion_artifact=data_ingestion_artifact,
+                                               model_trainer_config=model_trainer_config,
+                                               model_evaluation_config=model_evaluation_config)
+        if artifacts is None:
+            artifacts=run_full_training(training_pipeline_config=training_pipeline_config,
+                                        data_ingestion_artifact=data_ingestion_artifact,
+                                        model_trainer_config=model_trainer_config,
+                                        model_evaluation_config=model_evaluation_config,
+                                        stage_cache=stage_cache)
+        data_transformation_artifact,model_trainer_artifact=artifacts
 
         #model pusher 
         model_pusher_config=config_entity.ModelPusherConfig(training_pipeline_config=training_pipeline_config)
@@ -58,8 +178,14 @@ def start_training_pipeline():
                                  model_trainer_artifact=model_trainer_artifact
                                  )
         model_pusher_artifact=model_pusher.initiate_model_pusher()
-        
-
 
     except Exception as e:
         raise SensorException(e,sys)
+    finally:
+        # files identical to those of earlier runs are stored once, rejected runs included.
+        # The run dir stays valid when storing fails, which must not hide the error of the run
+        if blob_store is not None and os.path.isdir(training_pipeline_config.artifact_dir):
+            try:
+                blob_store.put_dir(training_pipeline_config.artifact_dir)
+            except Exception as e:
+                logging.info(f"Storing {training_pipeline_config.artifact_dir} in the blob store failed : {e}")
@@ -1,9 +1,73 @@
 import os 
-from sensor.entity.config_entity import MODEL_FILE_NAME,TRANSFORMER_FILE_NAME,TARGET_ENCODER_OBJECT_FILE_NAME
+import json
+import uuid
+import shutil
+import hashlib
+from contextlib import contextmanager
+from datetime import datetime
+from sensor.entity.config_entity import MODEL_FILE_NAME,TRANSFORMER_FILE_NAME,TARGET_ENCODER_OBJECT_FILE_NAME,BUNDLE_FILE_NAME
 from glob import glob
-from typing import Optional
+from typing import Dict,Iterator,List,Optional,Tuple
+try:
+    import fcntl
+except ImportError:
+    # windows
+    fcntl=None
+    import msvcrt
+
+MANIFEST_FILE_NAME="manifest.json"
+LOCK_FILE_NAME=".manifest.lock"
+# manifests already read by this process, by registry path : ((mtime_ns, size), manifest)
+_manifest_cache:Dict[str,Tuple[tuple,dict]]=dict()
+
+
+def get_file_checksum(file_path:str)->str:
+    sha256=hashlib.sha256()
+    with open(file_path,"rb") as file_obj:
+        for block in iter(lambda:file_obj.read(2**20),b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+@contextmanager
+def lock_file(file_path:str)->Iterator[None]:
+    """
+    Exclusive lock on file_path held while the block runs, released by the OS if the
+    process dies
+    """
+    with open(file_path,"a+") as file_obj:
+        if fcntl is not None:
+            fcntl.flock(file_obj.fileno(),fcntl.LOCK_EX)
+        else:
+            file_obj.seek(0)
+            # LK_LOCK gives up after 10 seconds, retried until the lock is taken
+            while True:
+                try:
+                    msvcrt.locking(file_obj.fileno(),msvcrt.LK_LOCK,1)
+                    break
+                except OSError:
+                    pass
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(file_obj.fileno(),fcntl.LOCK_UN)
+            else:
+                file_obj.seek(0)
+                msvcrt.locking(file_obj.fileno(),msvcrt.LK_UNLCK,1)
+
 
 class ModelResolver:
+    """
+    Versions of the model registry live in <model_registry>/<n> and are listed in
+    manifest.json with the checksum and size of every file and the metrics they were
+    pushed with. The manifest is read again only when its mtime changes, so resolving
+    the latest version does not list the registry. publish writes a version in a
+    temporary directory renamed into place before the manifest names it, readers
+    never see a partial version, and updates the manifest under a lock on
+    .manifest.lock so concurrent publishers do not drop each other's versions.
+    Registries written before the manifest existed are indexed on first use
+    """
     def __init__(self,
                  model_registry:str="saved_models",
                  transformer_dir_name="transformer",
@@ -15,15 +79,128 @@ class ModelResolver:
         self.transformer_dir_name=transformer_dir_name
         self.target_endcoder_dir_name=target_endcoder_dir_name
         self.model_dir=model_dir
+        self.manifest_file_path=os.path.join(self.model_registry,MANIFEST_FILE_NAME)
+
+    def get_dir_versions(self)->List[int]:
+        """
+        Version directories found by listing the registry, temporary directories of
+        publish are skipped
+        """
+        return sorted(int(dir_name) for dir_name in os.listdir(self.model_registry)
+                      if dir_name.isdigit() and os.path.isdir(os.path.join(self.model_registry,dir_name)))
+
+    def get_files_info(self,dir_path:str)->Dict[str,dict]:
+        files=dict()
+        for root,_,file_names in os.walk(dir_path):
+            for file_name in file_names:
+                file_path=os.path.join(root,file_name)
+                files[os.path.relpath(file_path,dir_path)]={"sha256":get_file_checksum(file_path),
+                                                            "size":os.path.getsize(file_path)}
+        return files
+
+    def get_dir_version_info(self,version:int)->dict:
+        """
+        Manifest entry of a version directory the manifest does not list
+        """
+        dir_path=os.path.join(self.model_registry,f"{version}")
+        return {"created_at":datetime.fromtimestamp(os.path.getmtime(dir_path)).isoformat(),
+                "files":self.get_files_info(dir_path),
+                "metrics":dict()}
+
+    def build_manifest(self)->dict:
+        """
+        Manifest of the version directories of a registry without one
+        """
+        versions={f"{version}":self.get_dir_version_info(version) for version in self.get_dir_versions()}
+        return {"latest":max(map(int,versions),default=None),"versions":versions}
+
+    def write_manifest(self,manifest:dict)->None:
+        tmp_file_path=f"{self.manifest_file_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_file_path,"w") as file_obj:
+            json.dump(manifest,file_obj,indent=2)
+        os.replace(tmp_file_path,self.manifest_file_path)
+
+    def read_manifest(self,use_cache:bool=True)->dict:
+        """
+        Manifest of the registry, from the in process cache while the file is unchanged
+        """
+        try:
+            try:
+                stat=os.stat(self.manifest_file_path)
+            except FileNotFoundError:
+                if len(self.get_dir_versions())==0:
+                    return {"latest":None,"versions":dict()}
+                with lock_file(os.path.join(self.model_registry,LOCK_FILE_NAME)):
+                    # a concurrent publish or reader may have written it meanwhile
+                    if not os.path.exists(self.manifest_file_path):
+                        self.write_manifest(self.build_manifest())
+                stat=os.stat(self.manifest_file_path)
+            key=os.path.abspath(self.model_registry)
+            file_state=(stat.st_mtime_ns,stat.st_size)
+            cached=_manifest_cache.get(key)
+            if use_cache and cached is not None and cached[0]==file_state:
+                return cached[1]
+            with open(self.manifest_file_path) as file_obj:
+                manifest=json.load(file_obj)
+            _manifest_cache[key]=(file_state,manifest)
+            return manifest
+        except Exception as e:
+            raise e
+
+    def get_version_info(self,version:Optional[int]=None)->Optional[dict]:
+        """
+        Manifest entry of a version, the latest one by default
+        """
+        manifest=self.read_manifest()
+        version=manifest["latest"] if version is None else version
+        return None if version is None else manifest["versions"].get(f"{version}")
+
+    def publish(self,file_paths:Dict[str,str],metrics:Optional[dict]=None,blob_store=None)->str:
+        """
+        Copies files into a new version of the registry
+        =============================================================
+        file_paths : {path inside the version directory : source file path}
+        metrics : recorded in the manifest with the checksum and size of every file
+        blob_store : sensor.blob_store.BlobStore, the version links the stored files
+        instead of copying them
+        returns: the version directory
+        """
+        try:
+            tmp_dir_path=os.path.join(self.model_registry,f".tmp-{uuid.uuid4().hex}")
+            for relative_path,file_path in file_paths.items():
+                os.makedirs(os.path.dirname(os.path.join(tmp_dir_path,relative_path)),exist_ok=True)
+                if blob_store is None:
+                    shutil.copyfile(file_path,os.path.join(tmp_dir_path,relative_path))
+                else:
+                    blob_store.link(blob_store.put(file_path),os.path.join(tmp_dir_path,relative_path))
+            files=self.get_files_info(tmp_dir_path)
+
+            with lock_file(os.path.join(self.model_registry,LOCK_FILE_NAME)):
+                # read from the file, another process may have published since the cached read
+                versions=dict(self.read_manifest(use_cache=False)["versions"])
+                # a publisher which died between its rename and its manifest write left
+                # a version directory the manifest does not list
+                for dir_version in self.get_dir_versions():
+                    if f"{dir_version}" not in versions:
+                        versions[f"{dir_version}"]=self.get_dir_version_info(dir_version)
+                version=max(map(int,versions),default=-1)+1
+                dir_path=os.path.join(self.model_registry,f"{version}")
+                os.rename(tmp_dir_path,dir_path)
+                versions[f"{version}"]={"created_at":datetime.now().isoformat(),
+                                        "files":files,
+                                        "metrics":metrics or dict()}
+                self.write_manifest({"latest":version,"versions":versions})
+            return dir_path
+        except Exception as e:
+            shutil.rmtree(tmp_dir_path,ignore_errors=True)
+            raise e
 
     def get_latest_dir_path(self)->Optional[str]:
         try:
-            dir_names=os.listdir(self.model_registry)
-            if len(dir_names)==0:
+            latest=self.read_manifest()["latest"]
+            if latest is None:
                 return None
-            dir_names=list(map(int,dir_names))
-            latest_dir_name=max(dir_names)
-            return os.path.join(self.model_registry,f"{latest_dir_name}")
+            return os.path.join(self.model_registry,f"{latest}")
         except Exception as e :
             raise e  
 
@@ -50,16 +227,30 @@ class ModelResolver:
             latest_dir = self.get_latest_dir_path()
             if latest_dir is None:
                 raise Exception(f"Target encoder is not available")
-            return os.path.join(latest_dir,self.target_encoder_dir_name,TARGET_ENCODER_OBJECT_FILE_NAME)
+            return os.path.join(latest_dir,self.target_endcoder_dir_name,TARGET_ENCODER_OBJECT_FILE_NAME)
         except Exception as e:
             raise e
         
+    def get_latest_bundle_path(self)->Optional[str]:
+        """
+        Model bundle of the latest version, None for versions pushed before bundles
+        """
+        try:
+            latest_dir=self.get_latest_dir_path()
+            if latest_dir is None:
+                raise Exception(f"Model bundle is not available")
+            if BUNDLE_FILE_NAME not in self.get_version_info()["files"]:
+                return None
+            return os.path.join(latest_dir,BUNDLE_FILE_NAME)
+        except Exception as e:
+            raise e
+
     def get_latest_save_dir_path(self)->str:
         try:
             latest_dir=self.get_latest_dir_path()
             if latest_dir==None:
                 return os.path.join(self.model_registry,f"{0}")
-            latest_dir_name=int(os.path.basename(self.get_latest_dir_path))
+            latest_dir_name=int(os.path.basename(latest_dir))
             return os.path.join(self.model_registry,f"{latest_dir_name+1}")
         except Exception as e:
             raise e
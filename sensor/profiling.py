@@ -0,0 +1,91 @@
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict,Iterator
+
+from sensor.logger import logging
+from sensor.exception import SensorException
+
+
+def _read_proc_status(field:str)->float:
+    """
+    Memory field of /proc/self/status in MB, -1 when /proc is not available
+    """
+    try:
+        with open("/proc/self/status") as file_obj:
+            for line in file_obj:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1])/1024
+    except OSError:
+        pass
+    return -1.0
+
+
+def get_rss_mb()->float:
+    return _read_proc_status("VmRSS")
+
+
+def get_peak_rss_mb()->float:
+    """
+    Peak resident set size of the process, since the last reset_peak_rss on linux
+    """
+    peak=_read_proc_status("VmHWM")
+    if peak<0:
+        import resource
+        peak=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+        # ru_maxrss is in bytes on macOS and in kB elsewhere
+        if sys.platform=="darwin":
+            peak/=1024
+    return peak
+
+
+def reset_peak_rss()->bool:
+    """
+    Resets the peak resident set size to the current one, only supported on linux
+    """
+    try:
+        with open("/proc/self/clear_refs","w") as file_obj:
+            file_obj.write("5")
+        return True
+    except OSError:
+        return False
+
+
+# stages open in this process, of any profiler
+_open_stages=0
+
+
+class StageProfiler:
+    """
+    Records wall time, resident memory at the end and peak resident memory of named
+    stages. Only the outermost open stage resets the peak, a stage inside another one
+    (e.g. a component's own stages inside a benchmark stage) reports the peak since
+    the outer stage started and must not clear it. When the peak can not be reset
+    (non linux) peaks are process wide
+    """
+    def __init__(self):
+        self.stages:Dict[str,dict]=dict()
+
+    @contextmanager
+    def stage(self,name:str)->Iterator[None]:
+        global _open_stages
+        is_reset=reset_peak_rss() if _open_stages==0 else False
+        _open_stages+=1
+        start=time.perf_counter()
+        try:
+            yield
+        finally:
+            _open_stages-=1
+        self.stages[name]={"seconds":round(time.perf_counter()-start,3),
+                           "rss_mb":round(get_rss_mb(),1),
+                           "peak_rss_mb":round(get_peak_rss_mb(),1),
+                           "peak_is_per_stage":is_reset}
+        logging.info(f"Stage {name} : {self.stages[name]}")
+
+    def write_report(self,file_path:str)->None:
+        try:
+            from sensor import utils
+            utils.write_yaml_file(file_path=file_path,data=self.stages)
+        except Exception as e:
+            raise SensorException(e,sys)
@@ -0,0 +1,133 @@
+import os
+import sys
+import hashlib
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+from typing import Dict,List
+
+from sensor.logger import logging
+from sensor.exception import SensorException
+from sensor.config import TARGET_COLUMN
+from sensor import utils,drift
+from sensor.schema import APS_SCHEMA
+
+PROFILE_FILE_NAME="profile.yaml"
+SORTED_VALUES_FILE_NAME="sorted_values.npy"
+HASH_INDEX_FILE_NAME="hash_index.yaml"
+
+
+@dataclass
+class ReferenceProfile:
+    """
+    Everything data validation needs from the base dataset : the columns left after
+    dropping columns with too many missing values, per column null fractions and
+    dtypes, and the sorted values of every feature column as a (columns, rows) array
+    """
+    content_hash:str
+    missing_value_thresold:float
+    n_rows:int
+    columns:List[str]
+    feature_columns:List[str]
+    dropped_columns:List[str]
+    null_fractions:Dict[str,float]
+    dtypes:Dict[str,str]
+    sorted_values:np.ndarray
+
+
+def get_file_hash(file_path:str)->str:
+    try:
+        sha256=hashlib.sha256()
+        with open(file_path,"rb") as file_obj:
+            for block in iter(lambda:file_obj.read(2**20),b""):
+                sha256.update(block)
+        return sha256.hexdigest()
+    except Exception as e:
+        raise SensorException(e,sys)
+
+
+def get_base_file_hash(base_file_path:str,reference_profile_dir:str)->str:
+    """
+    Content hash of the base file, remembered per (path, size, mtime) so an unchanged
+    base file is not read again
+    """
+    try:
+        index_file_path=os.path.join(reference_profile_dir,HASH_INDEX_FILE_NAME)
+        index=utils.read_yaml_file(index_file_path) if os.path.exists(index_file_path) else dict()
+        stat=os.stat(base_file_path)
+        key=os.path.abspath(base_file_path)
+        entry=index.get(key)
+        if entry is not None and entry["size"]==stat.st_size and entry["mtime_ns"]==stat.st_mtime_ns:
+            return entry["content_hash"]
+        content_hash=get_file_hash(base_file_path)
+        index[key]={"size":stat.st_size,"mtime_ns":stat.st_mtime_ns,"content_hash":content_hash}
+        utils.write_yaml_file(file_path=index_file_path,data=index)
+        return content_hash
+    except Exception as e:
+        raise SensorException(e,sys)
+
+
+def build_reference_profile(base_file_path:str,content_hash:str,missing_value_thresold:float)->ReferenceProfile:
+    try:
+        logging.info(f"Building reference profile from {base_file_path}")
+        base_df=APS_SCHEMA.read_csv(base_file_path)
+        null_fractions=base_df.isna().sum()/base_df.shape[0]
+        dropped_columns=list(null_fractions[null_fractions>missing_value_thresold].index)
+        base_df.drop(dropped_columns,axis=1,inplace=True)
+        feature_columns=[column for column in base_df.columns if column!=TARGET_COLUMN]
+        return ReferenceProfile(content_hash=content_hash,
+                                missing_value_thresold=missing_value_thresold,
+                                n_rows=base_df.shape[0],
+                                columns=list(base_df.columns),
+                                feature_columns=feature_columns,
+                                dropped_columns=dropped_columns,
+                                null_fractions={column:float(fraction) for column,fraction in null_fractions.items()},
+                                dtypes={column:str(dtype) for column,dtype in base_df.dtypes.items()},
+                                sorted_values=drift.sort_columns(base_df[feature_columns].to_numpy(dtype=np.float64)))
+    except Exception as e:
+        raise SensorException(e,sys)
+
+
+def save_reference_profile(profile:ReferenceProfile,profile_dir:str)->None:
+    try:
+        os.makedirs(profile_dir,exist_ok=True)
+        metadata={key:value for key,value in profile.__dict__.items() if key!="sorted_values"}
+        utils.save_numpy_array_data(file_path=os.path.join(profile_dir,SORTED_VALUES_FILE_NAME),array=profile.sorted_values)
+        # the yaml file is written last, a profile without it is incomplete
+        utils.write_yaml_file(file_path=os.path.join(profile_dir,PROFILE_FILE_NAME),data=metadata)
+    except Exception as e:
+        raise SensorException(e,sys)
+
+
+def load_reference_profile(profile_dir:str)->ReferenceProfile:
+    try:
+        metadata=utils.read_yaml_file(os.path.join(profile_dir,PROFILE_FILE_NAME))
+        sorted_values=np.load(os.path.join(profile_dir,SORTED_VALUES_FILE_NAME),mmap_mode="r")
+        return ReferenceProfile(sorted_values=sorted_values,**metadata)
+    except Exception as e:
+        raise SensorException(e,sys)
+
+
+def get_reference_profile(base_file_path:str,reference_profile_dir:str,missing_value_thresold:float)->ReferenceProfile:
+    """
+    Returns the reference profile of the base dataset. Profiles are stored under
+    reference_profile_dir in one directory per base file content hash, so a profile is
+    built once per version of the base file and then loaded from disk
+    """
+    try:
+        content_hash=get_base_file_hash(base_file_path=base_file_path,reference_profile_dir=reference_profile_dir)
+        profile_dir=os.path.join(reference_profile_dir,content_hash)
+        if os.path.exists(os.path.join(profile_dir,PROFILE_FILE_NAME)):
+            profile=load_reference_profile(profile_dir)
+            if profile.missing_value_thresold==missing_value_thresold:
+                logging.info(f"Loaded reference profile {profile_dir}")
+                return profile
+
+        profile=build_reference_profile(base_file_path=base_file_path,
+                                        content_hash=content_hash,
+                                        missing_value_thresold=missing_value_thresold)
+        save_reference_profile(profile=profile,profile_dir=profile_dir)
+        logging.info(f"Saved reference profile {profile_dir}")
+        return profile
+    except Exception as e:
+        raise SensorException(e,sys)
@@ -0,0 +1,141 @@
+import sys
+import numpy as np
+from typing import Callable,Dict,Optional,Tuple
+
+from sensor.logger import logging
+from sensor.exception import SensorException
+
+# resampled features, labels and per class weights the model has to apply (None when
+# the classes were balanced by resampling)
+ResamplingResult=Tuple[np.ndarray,np.ndarray,Optional[Dict[int,float]]]
+
+
+def get_projection(n_features:int,n_components:int,random_state:int)->np.ndarray:
+    """
+    Gaussian random projection matrix, distances between projected rows approximate
+    distances between the original rows
+    """
+    random_generator=np.random.default_rng(random_state)
+    return (random_generator.standard_normal((n_features,n_components))/np.sqrt(n_components)).astype(np.float32)
+
+
+def _get_projected_neighbors_class():
+    from sklearn.base import BaseEstimator
+    from sklearn.neighbors import NearestNeighbors
+
+    class ProjectedNeighbors(BaseEstimator):
+        """
+        Approximate k nearest neighbours : rows are projected on n_components random
+        directions and searched with a tree index in the projected space. Usable as
+        the k_neighbors object of imblearn samplers
+        """
+        def __init__(self,n_neighbors:int=6,n_components:int=8,random_state:int=42,n_jobs:Optional[int]=None):
+            self.n_neighbors=n_neighbors
+            self.n_components=n_components
+            self.random_state=random_state
+            self.n_jobs=n_jobs
+
+        def fit(self,X,y=None):
+            self.projection_=get_projection(X.shape[1],self.n_components,self.random_state)
+            self.nearest_neighbors_=NearestNeighbors(n_neighbors=self.n_neighbors,algorithm="kd_tree",n_jobs=self.n_jobs)
+            self.nearest_neighbors_.fit(np.asarray(X,dtype=np.float32)@self.projection_)
+            return self
+
+        def kneighbors(self,X=None,n_neighbors=None,return_distance=True):
+            if X is not None:
+                X=np.asarray(X,dtype=np.float32)@self.projection_
+            return self.nearest_neighbors_.kneighbors(X,n_neighbors=n_neighbors,return_distance=return_distance)
+
+        def kneighbors_graph(self,X=None,n_neighbors=None,mode="connectivity"):
+            if X is not None:
+                X=np.asarray(X,dtype=np.float32)@self.projection_
+            return self.nearest_neighbors_.kneighbors_graph(X,n_neighbors=n_neighbors,mode=mode)
+
+    return ProjectedNeighbors
+
+
+def remove_tomek_links(X:np.ndarray,y:np.ndarray,nearest_neighbors)->Tuple[np.ndarray,np.ndarray]:
+    """
+    Drops both rows of every Tomek link (mutual nearest neighbours of different
+    classes) like SMOTETomek does, neighbours come from the given fitted index
+    """
+    nearest=nearest_neighbors.kneighbors(X,n_neighbors=2,return_distance=False)[:,1]
+    is_link=(nearest[nearest]==np.arange(len(y)))&(y[nearest]!=y)
+    logging.info(f"Removing {np.count_nonzero(is_link)} rows of tomek links")
+    return X[~is_link],y[~is_link]
+
+
+def smote_tomek(X:np.ndarray,y:np.ndarray,random_state:int,n_jobs:Optional[int],n_components:int)->ResamplingResult:
+    """
+    Exact SMOTETomek, the tomek link neighbour search runs on n_jobs cores
+    """
+    from imblearn.combine import SMOTETomek
+    X,y=SMOTETomek(random_state=random_state,n_jobs=n_jobs).fit_resample(X,y)
+    return X,y,None
+
+
+def approximate_smote_tomek(X:np.ndarray,y:np.ndarray,random_state:int,n_jobs:Optional[int],n_components:int)->ResamplingResult:
+    """
+    SMOTE followed by tomek link removal with both neighbour searches done in an
+    n_components dimensional random projection instead of the full feature space
+    """
+    from imblearn.over_sampling import SMOTE
+    ProjectedNeighbors=_get_projected_neighbors_class()
+    k_neighbors=ProjectedNeighbors(n_neighbors=6,n_components=n_components,random_state=random_state,n_jobs=n_jobs)
+    X,y=SMOTE(random_state=random_state,k_neighbors=k_neighbors).fit_resample(X,y)
+    nearest_neighbors=ProjectedNeighbors(n_neighbors=2,n_components=n_components,random_state=random_state,n_jobs=n_jobs).fit(X)
+    X,y=remove_tomek_links(X,y,nearest_neighbors)
+    return X,y,None
+
+
+def class_weight(X:np.ndarray,y:np.ndarray,random_state:int,n_jobs:Optional[int],n_components:int)->ResamplingResult:
+    """
+    No resampling, every class gets the weight n_samples/(n_classes*class_count)
+    """
+    classes,counts=np.unique(y,return_counts=True)
+    weights=len(y)/(len(classes)*counts)
+    return X,y,{int(label):float(weight) for label,weight in zip(classes,weights)}
+
+
+def no_resampling(X:np.ndarray,y:np.ndarray,random_state:int,n_jobs:Optional[int],n_components:int)->ResamplingResult:
+    return X,y,None
+
+
+def get_sample_weight(y:np.ndarray,class_weights:Optional[Dict[int,float]])->Optional[np.ndarray]:
+    """
+    Per row weights for a model trained on labels y, None when the classes were
+    balanced by resampling
+    """
+    if class_weights is None:
+        return None
+    return np.array([class_weights[label] for label in range(len(class_weights))])[y.astype(int)]
+
+
+RESAMPLING_STRATEGIES:Dict[str,Callable[...,ResamplingResult]]={
+    "smote_tomek":smote_tomek,
+    "approximate_smote_tomek":approximate_smote_tomek,
+    "class_weight":class_weight,
+    "none":no_resampling,
+}
+
+
+def resample(X:np.ndarray,y:np.ndarray,strategy:str="smote_tomek",random_state:int=42,
+             n_jobs:Optional[int]=None,n_components:int=8)->ResamplingResult:
+    """
+    Balances the classes of X, y with one of RESAMPLING_STRATEGIES
+    =============================================================
+    strategy : smote_tomek | approximate_smote_tomek | class_weight | none
+    n_jobs : cores used by the neighbour searches
+    n_components : dimensions of the projection used by approximate_smote_tomek
+    =============================================================
+    returns features, labels and class weights (None unless strategy is class_weight)
+    """
+    try:
+        if strategy not in RESAMPLING_STRATEGIES:
+            raise Exception(f"Unknown resampling strategy [{strategy}], expected one of {list(RESAMPLING_STRATEGIES)}")
+        logging.info(f"Before resampling with {strategy} Input: {X.shape} Target:{y.shape}")
+        X,y,class_weights=RESAMPLING_STRATEGIES[strategy](X,y,random_state=random_state,n_jobs=n_jobs,n_components=n_components)
+        logging.info(f"After resampling Input: {X.shape} Target:{y.shape}")
+        return X,y,class_weights
+    except Exception as e:
+        raise SensorException(e,sys)
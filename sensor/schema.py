@@ -0,0 +1,121 @@
+import sys
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+from typing import Dict,List,Tuple
+
+from sensor.exception import SensorException
+from sensor.config import TARGET_COLUMN
+
+# sensor columns of the APS failure dataset in file order, the names are anonymized by
+# Scania and am_0 / ec_00 are spelled like this in the source data
+APS_FEATURE_COLUMNS=(
+    "aa_000","ab_000","ac_000","ad_000","ae_000","af_000","ag_000","ag_001","ag_002",
+    "ag_003","ag_004","ag_005","ag_006","ag_007","ag_008","ag_009","ah_000","ai_000",
+    "aj_000","ak_000","al_000","am_0","an_000","ao_000","ap_000","aq_000","ar_000",
+    "as_000","at_000","au_000","av_000","ax_000","ay_000","ay_001","ay_002","ay_003",
+    "ay_004","ay_005","ay_006","ay_007","ay_008","ay_009","az_000","az_001","az_002",
+    "az_003","az_004","az_005","az_006","az_007","az_008","az_009","ba_000","ba_001",
+    "ba_002","ba_003","ba_004","ba_005","ba_006","ba_007","ba_008","ba_009","bb_000",
+    "bc_000","bd_000","be_000","bf_000","bg_000","bh_000","bi_000","bj_000","bk_000",
+    "bl_000","bm_000","bn_000","bo_000","bp_000","bq_000","br_000","bs_000","bt_000",
+    "bu_000","bv_000","bx_000","by_000","bz_000","ca_000","cb_000","cc_000","cd_000",
+    "ce_000","cf_000","cg_000","ch_000","ci_000","cj_000","ck_000","cl_000","cm_000",
+    "cn_000","cn_001","cn_002","cn_003","cn_004","cn_005","cn_006","cn_007","cn_008",
+    "cn_009","co_000","cp_000","cq_000","cr_000","cs_000","cs_001","cs_002","cs_003",
+    "cs_004","cs_005","cs_006","cs_007","cs_008","cs_009","ct_000","cu_000","cv_000",
+    "cx_000","cy_000","cz_000","da_000","db_000","dc_000","dd_000","de_000","df_000",
+    "dg_000","dh_000","di_000","dj_000","dk_000","dl_000","dm_000","dn_000","do_000",
+    "dp_000","dq_000","dr_000","ds_000","dt_000","du_000","dv_000","dx_000","dy_000",
+    "dz_000","ea_000","eb_000","ec_00","ed_000","ee_000","ee_001","ee_002","ee_003",
+    "ee_004","ee_005","ee_006","ee_007","ee_008","ee_009","ef_000","eg_000",
+)
+
+
+@dataclass(frozen=True)
+class DatasetSchema:
+    """
+    Declared layout of a dataset : column names, the dtype every feature column is
+    parsed into, the target column with its classes and the strings which mean a
+    missing value. Readers use it to parse files directly into the final dtypes
+    """
+    name:str
+    feature_columns:Tuple[str,...]
+    target_column:str
+    target_classes:Tuple[str,...]
+    feature_dtype:str="float32"
+    na_values:Tuple[str,...]=("na",)
+
+    @property
+    def columns(self)->List[str]:
+        return [self.target_column,*self.feature_columns]
+
+    def get_dtypes(self)->Dict[str,object]:
+        dtypes={column:np.dtype(self.feature_dtype) for column in self.feature_columns}
+        dtypes[self.target_column]=pd.CategoricalDtype(list(self.target_classes))
+        return dtypes
+
+    def read_csv(self,file_path:str,**kwargs)->pd.DataFrame:
+        """
+        Reads a csv file in one pass with the declared dtypes, kwargs are passed to
+        pd.read_csv (e.g. chunksize). Columns which are not declared keep the dtype
+        inferred by pandas
+        """
+        try:
+            return pd.read_csv(file_path,dtype=self.get_dtypes(),na_values=list(self.na_values),**kwargs)
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def cast(self,df:pd.DataFrame)->pd.DataFrame:
+        """
+        Casts the declared columns of an already loaded dataframe (e.g. mongo documents
+        or a parquet file written before the schema existed). The feature columns which
+        do not have the declared dtype yet are cast as one block, na_values become
+        NaN and any other value which is not a number raises, corrupt data is never
+        silently turned into missing values
+        """
+        try:
+            dtypes=self.get_dtypes()
+            feature_columns=[column for column in df.columns
+                             if column in dtypes and column!=self.target_column and df[column].dtype!=dtypes[column]]
+            if len(feature_columns)>0:
+                block=df[feature_columns].replace(list(self.na_values),np.nan)
+                try:
+                    df[feature_columns]=block.astype(self.feature_dtype)
+                except (ValueError,TypeError):
+                    raise Exception(f"Values which are not numbers nor {list(self.na_values)} : {self.get_invalid_values(block)}")
+            target_dtype=dtypes[self.target_column]
+            if self.target_column in df.columns and df[self.target_column].dtype!=target_dtype:
+                df[self.target_column]=df[self.target_column].astype(target_dtype)
+            return df
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def get_invalid_values(self,block:pd.DataFrame,n_examples:int=3)->Dict[str,dict]:
+        """
+        Number and examples of the values of every column which do not parse as numbers
+        """
+        invalid_values=dict()
+        for column in block.columns:
+            is_invalid=pd.to_numeric(block[column],errors="coerce").isna()&block[column].notna()
+            if is_invalid.any():
+                invalid_values[column]={"count":int(is_invalid.sum()),
+                                        "examples":block[column][is_invalid].unique()[:n_examples].tolist()}
+        return invalid_values
+
+
+APS_SCHEMA=DatasetSchema(name="aps",
+                         feature_columns=APS_FEATURE_COLUMNS,
+                         target_column=TARGET_COLUMN,
+                         target_classes=("neg","pos"))
+
+SCHEMAS={APS_SCHEMA.name:APS_SCHEMA}
+
+
+def get_schema(name:str="aps")->DatasetSchema:
+    try:
+        if name not in SCHEMAS:
+            raise Exception(f"Unknown schema [{name}], expected one of {list(SCHEMAS)}")
+        return SCHEMAS[name]
+    except Exception as e:
+        raise SensorException(e,sys)
@@ -0,0 +1,254 @@
+import os
+import sys
+import json
+import time
+import glob
+import shutil
+import hashlib
+import dataclasses
+from typing import Any,Callable,Dict,List,Optional
+
+from sensor.logger import logging
+from sensor.exception import SensorException
+from sensor.entity import artifact_entity
+from sensor import utils
+
+INDEX_FILE_NAME="index.yaml"
+
+
+def get_code_version()->str:
+    """
+    Hash of the source of the sensor package, a change to any module invalidates
+    every cached stage
+    """
+    try:
+        package_dir=os.path.dirname(os.path.abspath(__file__))
+        sha256=hashlib.sha256()
+        for file_path in sorted(glob.glob(os.path.join(package_dir,"**","*.py"),recursive=True)):
+            sha256.update(os.path.relpath(file_path,package_dir).encode())
+            with open(file_path,"rb") as file_obj:
+                sha256.update(file_obj.read())
+        return sha256.hexdigest()
+    except Exception as e:
+        raise SensorException(e,sys)
+
+
+def get_dir_size(dir_path:str)->int:
+    size=0
+    for root,_,file_names in os.walk(dir_path):
+        for file_name in file_names:
+            size+=os.path.getsize(os.path.join(root,file_name))
+    return size
+
+
+class StageCache:
+    """
+    Memoizes pipeline stages. The fingerprint of a stage is the hash of its name, its
+    config (paths inside the run's artifact dir made relative), the content of its
+    input artifacts and of files named by its config, and the code version. A stage
+    whose fingerprint is in the index returns the artifact of the run that computed
+    it instead of running again.
+
+    The index lives in cache_dir and also remembers file content hashes by
+    (path, size, mtime) so unchanged files are hashed once. Entries not used for
+    max_age_days are evicted, then least recently used ones until the cached stage
+    directories fit in max_size_mb; evicting an entry deletes its stage directory
+    """
+    def __init__(self,cache_dir:str,artifact_dir:str,max_age_days:float=30,max_size_mb:float=10240,force:bool=False):
+        try:
+            self.cache_dir=cache_dir
+            self.artifact_dir=artifact_dir
+            self.max_age_days=max_age_days
+            self.max_size_mb=max_size_mb
+            self.force=force
+            self.index_file_path=os.path.join(cache_dir,INDEX_FILE_NAME)
+            self.code_version=get_code_version()
+            self.used_fingerprints=set()
+            self.index=self.read_index()
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def read_index(self)->dict:
+        try:
+            if os.path.exists(self.index_file_path):
+                return utils.read_yaml_file(self.index_file_path)
+            return {"entries":dict(),"file_hashes":dict()}
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def write_index(self)->None:
+        try:
+            tmp_file_path=f"{self.index_file_path}.tmp"
+            utils.write_yaml_file(file_path=tmp_file_path,data=self.index)
+            os.replace(tmp_file_path,self.index_file_path)
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def get_file_hash(self,file_path:str)->str:
+        try:
+            file_path=os.path.abspath(file_path)
+            stat=os.stat(file_path)
+            entry=self.index["file_hashes"].get(file_path)
+            if entry is not None and entry["size"]==stat.st_size and entry["mtime_ns"]==stat.st_mtime_ns:
+                return entry["content_hash"]
+            sha256=hashlib.sha256()
+            with open(file_path,"rb") as file_obj:
+                for block in iter(lambda:file_obj.read(2**20),b""):
+                    sha256.update(block)
+            self.index["file_hashes"][file_path]={"size":stat.st_size,"mtime_ns":stat.st_mtime_ns,"content_hash":sha256.hexdigest()}
+            return sha256.hexdigest()
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def get_path_hash(self,path:str)->str:
+        """
+        Content hash of a file, or of every file of a directory with its relative name
+        """
+        try:
+            if not os.path.isdir(path):
+                return self.get_file_hash(path)
+            sha256=hashlib.sha256()
+            for root,_,file_names in sorted(os.walk(path)):
+                for file_name in sorted(file_names):
+                    file_path=os.path.join(root,file_name)
+                    sha256.update(os.path.relpath(file_path,path).encode())
+                    sha256.update(self.get_file_hash(file_path).encode())
+            return sha256.hexdigest()
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def get_artifact_hash(self,artifact:Any)->str:
+        """
+        Hash of an artifact : paths are replaced by the content they point to, other
+        fields by their value
+        """
+        try:
+            values=dict()
+            for field in dataclasses.fields(artifact):
+                value=getattr(artifact,field.name)
+                if isinstance(value,str) and os.path.exists(value):
+                    value=self.get_path_hash(value)
+                values[field.name]=value
+            return hashlib.sha256(json.dumps(values,sort_keys=True,default=str).encode()).hexdigest()
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def get_config_values(self,config:Any)->dict:
+        """
+        Config values with the run's artifact dir taken out of paths, files named by the
+        config (e.g. the base dataset) are represented by their content hash
+        """
+        try:
+            values=dict()
+            for key,value in config.to_dict().items():
+                if isinstance(value,str) and value.startswith(self.artifact_dir):
+                    value=os.path.relpath(value,self.artifact_dir)
+                elif isinstance(value,str) and os.path.isfile(value):
+                    value={"path":value,"content_hash":self.get_file_hash(value)}
+                values[key]=value
+            return values
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def get_fingerprint(self,stage_name:str,config:Any,input_artifacts:List[Any],extra:Optional[dict]=None)->str:
+        try:
+            fingerprint={"stage_name":stage_name,
+                         "config":self.get_config_values(config),
+                         "input_artifacts":[self.get_artifact_hash(artifact) for artifact in input_artifacts],
+                         "extra":extra,
+                         "code_version":self.code_version}
+            return hashlib.sha256(json.dumps(fingerprint,sort_keys=True,default=str).encode()).hexdigest()
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def get_cached_artifact(self,fingerprint:str)->Optional[Any]:
+        try:
+            entry=self.index["entries"].get(fingerprint)
+            if entry is None:
+                return None
+            artifact_class=getattr(artifact_entity,entry["artifact_class"])
+            artifact=artifact_class(**entry["artifact"])
+            # an entry whose files were removed outside of the cache is dropped
+            paths=[value for value in entry["artifact"].values() if isinstance(value,str) and value.startswith(entry["stage_dir"])]
+            if not os.path.isdir(entry["stage_dir"]) or not all(os.path.exists(path) for path in paths):
+                logging.info(f"Cached files of {entry['stage_name']} are missing, dropping entry {fingerprint}")
+                del self.index["entries"][fingerprint]
+                return None
+            entry["last_used_at"]=time.time()
+            return artifact
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def run(self,stage_name:str,config:Any,stage_dir:str,run_stage:Callable[[],Any],
+            input_artifacts:Optional[List[Any]]=None,extra:Optional[dict]=None)->Any:
+        """
+        Returns the cached artifact of the stage when its fingerprint is known, runs
+        run_stage otherwise (always when force is set) and records its artifact
+        =============================================================
+        stage_dir : directory holding every file the stage writes
+        run_stage : callable returning the stage artifact
+        input_artifacts : artifacts of the stages this stage reads
+        extra : any other input of the stage, e.g. a fingerprint of the source collection
+        """
+        try:
+            fingerprint=self.get_fingerprint(stage_name,config,input_artifacts or [],extra)
+            self.used_fingerprints.add(fingerprint)
+            if not self.force:
+                artifact=self.get_cached_artifact(fingerprint)
+                if artifact is not None:
+                    logging.info(f"Stage {stage_name} is unchanged, reusing artifact {artifact}")
+                    self.write_index()
+                    return artifact
+
+            # entries being recomputed or stored in the directory the stage is about to
+            # overwrite (runs started within the same minute share an artifact dir)
+            stage_dir=os.path.abspath(stage_dir)
+            for other_fingerprint in [other_fingerprint for other_fingerprint,entry in self.index["entries"].items()
+                                      if other_fingerprint==fingerprint or entry["stage_dir"]==stage_dir]:
+                self.remove_entry(other_fingerprint)
+            artifact=run_stage()
+            now=time.time()
+            self.index["entries"][fingerprint]={"stage_name":stage_name,
+                                                "stage_dir":stage_dir,
+                                                "artifact_class":type(artifact).__name__,
+                                                "artifact":dataclasses.asdict(artifact),
+                                                "size":get_dir_size(stage_dir),
+                                                "created_at":now,
+                                                "last_used_at":now}
+            self.evict()
+            self.write_index()
+            return artifact
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def remove_entry(self,fingerprint:str)->None:
+        try:
+            entry=self.index["entries"].pop(fingerprint)
+            logging.info(f"Removing cached {entry['stage_name']} {entry['stage_dir']}")
+            # another entry may point to the same directory after a forced re-run
+            if not any(other["stage_dir"]==entry["stage_dir"] for other in self.index["entries"].values()):
+                shutil.rmtree(entry["stage_dir"],ignore_errors=True)
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def evict(self)->None:
+        try:
+            entries=self.index["entries"]
+            oldest_allowed=time.time()-self.max_age_days*86400
+            for fingerprint in [fingerprint for fingerprint,entry in entries.items()
+                                if entry["last_used_at"]<oldest_allowed and fingerprint not in self.used_fingerprints]:
+                self.remove_entry(fingerprint)
+
+            total_size=sum(entry["size"] for entry in entries.values())
+            for fingerprint in sorted(entries,key=lambda fingerprint:entries[fingerprint]["last_used_at"]):
+                if total_size<=self.max_size_mb*2**20:
+                    break
+                if fingerprint in self.used_fingerprints:
+                    continue
+                total_size-=entries[fingerprint]["size"]
+                self.remove_entry(fingerprint)
+
+            # forget content hashes of files which no longer exist
+            self.index["file_hashes"]={file_path:entry for file_path,entry in self.index["file_hashes"].items() if os.path.exists(file_path)}
+        except Exception as e:
+            raise SensorException(e,sys)
@@ -0,0 +1,173 @@
+import os
+import sys
+import json
+import time
+import tempfile
+import numpy as np
+from typing import Optional,Tuple
+
+from sensor.logger import logging
+from sensor.exception import SensorException
+
+# ways TrainingEngine can feed data to xgboost
+ENGINES=("sklearn","quantile","external_memory")
+# booster attributes, saved with the model
+TRAINING_PARAMS_ATTR="training_params"
+INCREMENTAL_UPDATES_ATTR="incremental_updates"
+
+
+def get_training_params(model)->dict:
+    """
+    XGBClassifier style parameters (without n_estimators) a saved model was trained
+    with, so it can be trained further the same way
+    """
+    try:
+        training_params=model.get_booster().attr(TRAINING_PARAMS_ATTR)
+        if training_params is not None:
+            return json.loads(training_params)
+        # models fitted through XGBClassifier keep their parameters on the estimator
+        from sensor.tuning import SEARCH_SPACE
+        return {name:value for name,value in model.get_params().items() if name in SEARCH_SPACE and value is not None}
+    except Exception as e:
+        raise SensorException(e,sys)
+
+
+def get_incremental_updates(model)->int:
+    """
+    Number of incremental updates since the model was last trained on the whole dataset
+    """
+    return int(model.get_booster().attr(INCREMENTAL_UPDATES_ATTR) or 0)
+
+
+def _get_chunk_iter_class():
+    import xgboost as xgb
+
+    class ChunkIter(xgb.DataIter):
+        """
+        Feeds xgboost consecutive row chunks of (memory mapped) arrays, only one chunk
+        is read from disk at a time
+        """
+        def __init__(self,X:np.ndarray,y:Optional[np.ndarray],weight:Optional[np.ndarray],chunk_rows:int,cache_prefix:str):
+            self.X=X
+            self.y=y
+            self.weight=weight
+            self.chunk_rows=chunk_rows
+            self.start=0
+            super().__init__(cache_prefix=cache_prefix)
+
+        def next(self,input_data)->int:
+            if self.start>=len(self.X):
+                return 0
+            end=self.start+self.chunk_rows
+            input_data(data=np.ascontiguousarray(self.X[self.start:end]),
+                       label=None if self.y is None else np.asarray(self.y[self.start:end]),
+                       weight=None if self.weight is None else self.weight[self.start:end])
+            self.start=end
+            return 1
+
+        def reset(self)->None:
+            self.start=0
+
+    return ChunkIter
+
+
+class TrainingEngine:
+    """
+    Builds xgboost matrices and trains boosters the way ModelTrainingConfig asks for
+    =============================================================
+    engine : sklearn | quantile | external_memory
+        sklearn : XGBClassifier.fit on the arrays as before, done by Model_trainer.train_model
+        quantile : QuantileDMatrix quantised once, trained on and predicted from
+        external_memory : DMatrix paged to cache_dir from chunk_rows row chunks of the
+        on-disk arrays, for data which does not fit in memory
+    tree_method : histogram building method, hist unless told otherwise
+    nthread : threads of matrix construction and training, all cores when None
+    """
+    def __init__(self,engine:str="quantile",tree_method:str="hist",nthread:Optional[int]=None,max_bin:int=256,
+                 chunk_rows:int=65536,cache_dir:Optional[str]=None):
+        try:
+            if engine not in ENGINES:
+                raise Exception(f"Unknown training engine [{engine}], expected one of {list(ENGINES)}")
+            self.engine=engine
+            self.tree_method=tree_method
+            self.nthread=nthread or os.cpu_count() or 1
+            self.max_bin=max_bin
+            self.chunk_rows=chunk_rows
+            self.cache_dir=cache_dir or tempfile.gettempdir()
+            self.stats=dict()
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def get_params(self,params:Optional[dict]=None)->Tuple[dict,int]:
+        """
+        Booster parameters and number of rounds from XGBClassifier style params
+        """
+        params=dict(params or dict())
+        n_rounds=int(params.pop("n_estimators",None) or 100)
+        params.update({"objective":"binary:logistic","eval_metric":"logloss","tree_method":self.tree_method,
+                       "max_bin":self.max_bin,"nthread":self.nthread,"verbosity":0})
+        return params,n_rounds
+
+    def get_matrix(self,X:np.ndarray,y:Optional[np.ndarray],weight:Optional[np.ndarray]=None,name:str="train",training:bool=True):
+        """
+        Matrix of X, y for the engine. Matrices only predicted on (training=False) are
+        plain DMatrix in memory, predicting on a QuantileDMatrix is slower
+        """
+        try:
+            import xgboost as xgb
+            start_time=time.perf_counter()
+            if self.engine=="external_memory":
+                cache_prefix=os.path.join(self.cache_dir,f"xgb_{name}_{os.getpid()}")
+                os.makedirs(self.cache_dir,exist_ok=True)
+                matrix=xgb.DMatrix(_get_chunk_iter_class()(X,y,weight,self.chunk_rows,cache_prefix),nthread=self.nthread)
+            elif training:
+                matrix=xgb.QuantileDMatrix(X,label=y,weight=weight,max_bin=self.max_bin,nthread=self.nthread)
+            else:
+                matrix=xgb.DMatrix(X,label=y,weight=weight,nthread=self.nthread)
+            self.stats[f"{name}_matrix_seconds"]=time.perf_counter()-start_time
+            return matrix
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def train(self,params:Optional[dict],train_matrix,xgb_model=None):
+        """
+        Trains a booster on train_matrix, or n_estimators more rounds of xgb_model, and
+        records the training throughput in stats. Predicting train_matrix afterwards is
+        served from the booster's prediction cache
+        """
+        try:
+            import xgboost as xgb
+            booster_params,n_rounds=self.get_params(params)
+            start_time=time.perf_counter()
+            booster=xgb.train(booster_params,train_matrix,num_boost_round=n_rounds,verbose_eval=False,xgb_model=xgb_model)
+            train_seconds=time.perf_counter()-start_time
+            booster.set_attr(**{TRAINING_PARAMS_ATTR:json.dumps({name:value for name,value in (params or dict()).items()
+                                                                 if name!="n_estimators"})})
+            n_rows=train_matrix.num_row()
+            self.stats.update({"engine":self.engine,
+                               "n_rows":n_rows,
+                               "n_rounds":n_rounds,
+                               "train_seconds":train_seconds,
+                               "rows_per_second":n_rows/(train_seconds+self.stats.get("train_matrix_seconds",0.0)),
+                               "row_rounds_per_second":n_rows*n_rounds/train_seconds})
+            logging.info(f"Trained {n_rounds} rounds on {n_rows} rows : {self.stats}")
+            return booster
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    @staticmethod
+    def predict_labels(booster,matrix)->np.ndarray:
+        return (booster.predict(matrix)>0.5).astype(int)
+
+    @staticmethod
+    def to_classifier(booster):
+        """
+        XGBClassifier holding the booster, so saved models keep their predict api
+        """
+        try:
+            from xgboost import XGBClassifier
+            model=XGBClassifier()
+            model.load_model(bytearray(booster.save_raw("ubj")))
+            return model
+        except Exception as e:
+            raise SensorException(e,sys)
@@ -0,0 +1,299 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor,as_completed
+from typing import Dict,List,Optional,Tuple
+
+from sensor.logger import logging
+from sensor.exception import SensorException
+from sensor import utils
+
+HISTORY_FILE_NAME="trials.yaml"
+MAX_HISTORY_SIZE=2000
+
+# name : (kind, low, high), log kinds are sampled uniformly in log space
+SEARCH_SPACE:Dict[str,Tuple[str,float,float]]={
+    "max_depth":("int",3,10),
+    "learning_rate":("log",0.01,0.3),
+    "min_child_weight":("log",1,32),
+    "subsample":("float",0.5,1.0),
+    "colsample_bytree":("float",0.4,1.0),
+    "gamma":("float",0,5),
+    "reg_lambda":("log",1e-3,10),
+}
+
+
+def sample_params(random_generator:np.random.Generator,search_space:Dict[str,Tuple[str,float,float]])->dict:
+    params=dict()
+    for name,(kind,low,high) in search_space.items():
+        if kind=="int":
+            params[name]=int(random_generator.integers(low,high+1))
+        elif kind=="log":
+            params[name]=float(np.exp(random_generator.uniform(np.log(low),np.log(high))))
+        else:
+            params[name]=float(random_generator.uniform(low,high))
+    return params
+
+
+def get_validation_split(y:np.ndarray,validation_size:float,random_state:int)->Tuple[np.ndarray,np.ndarray]:
+    """
+    Stratified train / validation row indices, identical in every process
+    """
+    from sklearn.model_selection import train_test_split
+    return train_test_split(np.arange(len(y)),test_size=validation_size,stratify=y,random_state=random_state)
+
+
+_DEADLINE_CALLBACK_CLASS=None
+
+def _get_deadline_callback_class():
+    global _DEADLINE_CALLBACK_CLASS
+    if _DEADLINE_CALLBACK_CLASS is None:
+        from xgboost.callback import TrainingCallback
+
+        class DeadlineCallback(TrainingCallback):
+            """
+            Stops boosting once the search deadline has passed
+            """
+            def __init__(self,deadline:float):
+                super().__init__()
+                self.deadline=deadline
+
+            def after_iteration(self,model,epoch,evals_log)->bool:
+                return time.time()>self.deadline
+
+        _DEADLINE_CALLBACK_CLASS=DeadlineCallback
+    return _DEADLINE_CALLBACK_CLASS
+
+
+# train and validation matrices of a worker process, built once by _init_worker
+_worker_data=dict()
+
+def _init_worker(features_file_path:str,target_file_path:Optional[str],validation_size:float,
+                 random_state:int,class_weights:Optional[Dict[int,float]],base_params:dict)->None:
+    import xgboost as xgb
+    from sensor.resampling import get_sample_weight
+    X,y=utils.load_feature_target_arrays(file_path=features_file_path,target_file_path=target_file_path)
+    train_indices,validation_indices=get_validation_split(y,validation_size,random_state)
+    y_train=y[train_indices]
+    weight=get_sample_weight(y_train,class_weights)
+    if base_params.get("tree_method")=="hist":
+        # quantised once, the validation matrix reuses the bins of the train one
+        max_bin=base_params.get("max_bin",256)
+        _worker_data["train"]=xgb.QuantileDMatrix(X[train_indices],label=y_train,weight=weight,max_bin=max_bin)
+        _worker_data["validation"]=xgb.QuantileDMatrix(X[validation_indices],label=y[validation_indices],
+                                                       max_bin=max_bin,ref=_worker_data["train"])
+    else:
+        _worker_data["train"]=xgb.DMatrix(X[train_indices],label=y_train,weight=weight)
+        _worker_data["validation"]=xgb.DMatrix(X[validation_indices],label=y[validation_indices])
+    _worker_data["y_validation"]=y[validation_indices]
+    _worker_data["base_params"]=base_params
+
+
+def run_trial(params:dict,n_rounds:int,early_stopping_rounds:int,nthread:int,deadline:float)->dict:
+    """
+    Trains params for up to n_rounds on the worker's train fold with early stopping on
+    its validation fold, the score is the validation f1 at the best iteration
+    """
+    import xgboost as xgb
+    from sklearn.metrics import f1_score
+    start_time,start_cpu_time=time.time(),time.process_time()
+    booster=xgb.train({**params,**_worker_data["base_params"],"objective":"binary:logistic","eval_metric":"logloss",
+                       "nthread":nthread,"verbosity":0},
+                      _worker_data["train"],num_boost_round=n_rounds,
+                      evals=[(_worker_data["validation"],"validation")],
+                      early_stopping_rounds=early_stopping_rounds,
+                      callbacks=[_get_deadline_callback_class()(deadline)],verbose_eval=False)
+    n_boosted_rounds=booster.num_boosted_rounds()
+    best_iteration=int(getattr(booster,"best_iteration",n_boosted_rounds-1))
+    timed_out=time.time()>deadline and n_boosted_rounds<n_rounds
+    probability=booster.predict(_worker_data["validation"],iteration_range=(0,best_iteration+1))
+    return {"params":params,
+            "n_rounds":n_rounds,
+            "best_iteration":best_iteration,
+            "score":float(f1_score(_worker_data["y_validation"],(probability>0.5).astype(int),zero_division=0)),
+            "stopped_early":n_boosted_rounds<n_rounds and not timed_out,
+            "timed_out":bool(timed_out),
+            "reused":False,
+            "seconds":time.time()-start_time,
+            "cpu_seconds":time.process_time()-start_cpu_time}
+
+
+class HyperbandSearch:
+    """
+    Hyperband search over XGBoost parameters with boosting rounds as the budget : each
+    bracket samples configurations and runs successive halving on them, training all
+    at min_rounds*eta**i rounds and keeping the best 1/eta for the next rung. A pass
+    runs every bracket once, another pass (up to max_passes) only runs when the last
+    one improved the best score. The wall clock and CPU budgets are ceilings which cut
+    a pass short, not a time the search tries to fill.
+
+    Trials run in a pool of n_workers processes, each holding the train and validation
+    folds and using cpu_count/n_workers threads. A trial which early stopped before
+    its rung's rounds is promoted without training again. Trials are appended to a
+    history file in history_dir, the best configurations of earlier searches over the
+    same space start the next search
+    """
+    def __init__(self,history_dir:str,search_space:Dict[str,Tuple[str,float,float]]=SEARCH_SPACE,
+                 min_rounds:int=27,max_rounds:int=729,eta:int=3,early_stopping_rounds:int=20,
+                 time_budget_seconds:float=600,cpu_budget_seconds:Optional[float]=None,max_passes:int=1,
+                 n_workers:Optional[int]=None,random_state:int=42,base_params:Optional[dict]=None):
+        try:
+            self.history_file_path=os.path.join(history_dir,HISTORY_FILE_NAME)
+            self.search_space=search_space
+            self.min_rounds=min_rounds
+            self.max_rounds=max_rounds
+            self.eta=eta
+            self.early_stopping_rounds=early_stopping_rounds
+            self.time_budget_seconds=time_budget_seconds
+            self.cpu_budget_seconds=cpu_budget_seconds
+            self.max_passes=max_passes
+            cpu_count=os.cpu_count() or 1
+            self.n_workers=n_workers or max(1,cpu_count//2)
+            self.nthread=max(1,cpu_count//self.n_workers)
+            self.random_generator=np.random.default_rng(random_state)
+            self.random_state=random_state
+            # fixed booster parameters of every trial, e.g. the tree method of the final model
+            self.base_params=dict(base_params or dict())
+            self.search_space_key=hashlib.sha1(json.dumps(search_space,sort_keys=True).encode()).hexdigest()
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def get_brackets(self)->List[Tuple[int,int]]:
+        """
+        (number of configurations, rounds of the first rung) of every bracket, from the
+        most exploratory one to plain training of a few configurations at max_rounds
+        """
+        s_max=0
+        while self.min_rounds*self.eta**(s_max+1)<=self.max_rounds:
+            s_max+=1
+        return [(int(np.ceil((s_max+1)/(s+1)*self.eta**s)),self.max_rounds//self.eta**s) for s in range(s_max,-1,-1)]
+
+    def read_history(self)->List[dict]:
+        try:
+            if not os.path.exists(self.history_file_path):
+                return []
+            return utils.read_yaml_file(self.history_file_path) or []
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def write_history(self,trials:List[dict])->None:
+        try:
+            history=(self.read_history()+trials)[-MAX_HISTORY_SIZE:]
+            tmp_file_path=f"{self.history_file_path}.tmp"
+            utils.write_yaml_file(file_path=tmp_file_path,data=history)
+            os.replace(tmp_file_path,self.history_file_path)
+        except Exception as e:
+            raise SensorException(e,sys)
+
+    def get_warm_start_params(self,n_params:int)->List[dict]:
+        """
+        Best distinct configurations found by earlier searches over the same space
+        """
+        trials=[trial for trial in self.read_history() if trial.get("search_space_key")==self.search_space_key]
+        trials.sort(key=lambda trial:(trial["score"],trial["n_rounds"]),reverse=True)
+        params,keys=[],set()
+        for trial in trials:
+            key=json.dumps(trial["params"],sort_keys=True)
+            if key not in keys:
+                keys.add(key)
+                params.append(trial["params"])
+            if len(params)==n_params:
+                break
+        return params
+
+    def is_budget_spent(self)->bool:
+        if time.time()>=self.deadline:
+            return True
+        return self.cpu_budget_seconds is not None and self.cpu_seconds>=self.cpu_budget_seconds
+
+    def run_rung(self,executor:ProcessPoolExecutor,candidates:List[dict],n_rounds:int)->List[dict]:
+        """
+        Runs the candidates (params and result of the previous rung) for n_rounds,
+        returns the trials which finished within the budget
+        """
+        trials,futures=[],dict()
+        for candidate in candidates:
+            previous=candidate.get("trial")
+            if previous is not None and previous["stopped_early"]:
+                trials.append({**previous,"n_rounds":n_rounds,"reused":True,"seconds":0.0,"cpu_seconds":0.0})
+                continue
+            future=executor.submit(run_trial,candidate["params"],n_rounds,self.early_stopping_rounds,self.nthread,self.deadline)
+            futures[future]=candidate
+        for future in as_completed(futures):
+            if future.cancelled():
+                continue
+            trial=future.result()
+            self.cpu_seconds+=trial["cpu_seconds"]
+            trials.append(trial)
+            if self.is_budget_spent():
+                # trials not started yet are dropped, running ones stop at the deadline
+                for other in futures:
+                    other.cancel()
+        return trials
+
+    def search(self,features_file_path:str,target_file_path:Optional[str]=None,validation_size:float=0.2,
+               class_weights:Optional[Dict[int,float]]=None)->dict:
+        """
+        Runs the search on the transformed train arrays and returns a report with the
+        best parameters, the rounds to train them for and every trial
+        =============================================================
+        features_file_path : features .npy, or the combined array when target_file_path is None
+        target_file_path : labels .npy
+        class_weights : per class weights applied to the train fold
+        """
+        try:
+            start_time=time.time()
+            self.deadline=start_time+self.time_budget_seconds
+            self.cpu_seconds=0.0
+            brackets=self.get_brackets()
+            warm_start_params=self.get_warm_start_params(brackets[0][0]//self.eta)
+            logging.info(f"Hyperband brackets {brackets}, {self.n_workers} workers x {self.nthread} threads, "
+                         f"{len(warm_start_params)} warm start configurations")
+
+            trials=[]
+            mp_context=multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=self.n_workers,mp_context=mp_context,initializer=_init_worker,
+                                     initargs=(features_file_path,target_file_path,validation_size,
+                                               self.random_state,class_weights,self.base_params)) as executor:
+                best_score=None
+                for n_pass in range(self.max_passes):
+                    pass_trials=[]
+                    for n_configs,n_rounds in brackets:
+                        candidates=[{"params":warm_start_params.pop(0) if warm_start_params else sample_params(self.random_generator,self.search_space)}
+                                    for _ in range(n_configs)]
+                        while len(candidates)>0 and n_rounds<=self.max_rounds and not self.is_budget_spent():
+                            rung_trials=self.run_rung(executor,candidates,n_rounds)
+                            pass_trials.extend(rung_trials)
+                            logging.info(f"Rung of {len(candidates)} configurations at {n_rounds} rounds, "
+                                         f"best score {max([trial['score'] for trial in rung_trials],default=None)}")
+                            rung_trials.sort(key=lambda trial:trial["score"],reverse=True)
+                            candidates=[{"params":trial["params"],"trial":trial} for trial in rung_trials[:len(candidates)//self.eta]]
+                            n_rounds*=self.eta
+                        if self.is_budget_spent():
+                            break
+                    trials.extend(pass_trials)
+                    pass_best_score=max([trial["score"] for trial in pass_trials],default=None)
+                    if self.is_budget_spent() or pass_best_score is None or (best_score is not None and pass_best_score<=best_score):
+                        break
+                    best_score=pass_best_score
+
+            for trial in trials:
+                trial["search_space_key"]=self.search_space_key
+            self.write_history(trials)
+
+            best_trial=max(trials,key=lambda trial:(trial["score"],trial["n_rounds"]),default=None)
+            report={"best_params":None if best_trial is None else best_trial["params"],
+                    "best_n_rounds":None if best_trial is None else best_trial["best_iteration"]+1,
+                    "best_score":None if best_trial is None else best_trial["score"],
+                    "n_trials":len(trials),
+                    "seconds":time.time()-start_time,
+                    "cpu_seconds":self.cpu_seconds,
+                    "trials":trials}
+            logging.info(f"Search ran {len(trials)} trials in {report['seconds']:.1f}s, best : {best_trial}")
+            return report
+        except Exception as e:
+            raise SensorException(e,sys)
@@ -1,46 +1,414 @@
 import os
 import sys
+import uuid
 import yaml
 import dill
+import glob
+import itertools
 import numpy as np
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable,Iterator,List,Optional
 from sensor.exception import SensorException
 from sensor.logger import logging
-from sensor.config import mongo_client
+from sensor.config import get_mongo_client
+from sensor.schema import DatasetSchema,APS_SCHEMA
 
-def get_collection_as_dataframe(database_name:str,collection_name:str)->pd.DataFrame:
+def get_collection_as_dataframe(database_name:str,collection_name:str,batch_size:int=10000,
+                                schema:DatasetSchema=APS_SCHEMA)->pd.DataFrame:
     '''
     Description : This function returns collections as dataframe 
     ===================================================================
     Params : 
     Database name : database_name
     Collection_name : collection_name 
+    batch_size : number of documents fetched and cast per batch
+    schema : declared dtypes the dataframe is cast to
     ===================================================================
-    return Pandas dataframe of the collection  
+    return typed Pandas dataframe of the collection without the _id column
     '''
     try:
         logging.info(f"Reading data from database_name {database_name} and collection {collection_name}")
-        print("reading data from mongo db")
-        df=pd.DataFrame(list(mongo_client[database_name][collection_name].find()))
-        print("Data frame created ")
+        batches=list(iter_collection_batches(database_name=database_name,collection_name=collection_name,
+                                             batch_size=batch_size,schema=schema))
+        if len(batches)==0:
+            return pd.DataFrame()
+        df=pd.concat(batches,ignore_index=True)
         logging.info(f"Columns present are {df.columns}")
-        if "_id"in df.columns:
-            logging.info("Removing id column from dataframe ")
-            df.drop('_id',axis=1,inplace=True)
         logging.info(f"The shape of the data is {df.shape}")
         return df
     except Exception as e:
         raise SensorException(e,sys)
+
+def iter_collection_batches(database_name:str,collection_name:str,batch_size:int,
+                            query:Optional[dict]=None,keep_id:bool=False,
+                            schema:DatasetSchema=APS_SCHEMA)->Iterator[pd.DataFrame]:
+    '''
+    Description : Streams a collection as typed dataframes of at most batch_size rows
+    ===================================================================
+    Params :
+    database_name : database_name
+    collection_name : collection_name
+    batch_size : number of documents fetched per round trip and per dataframe
+    query : optional filter applied on the server
+    keep_id : keep the _id column (documents are then returned in _id order)
+    schema : declared dtypes every batch is cast to
+    ===================================================================
+    yields typed pandas dataframes, the _id field is excluded by the server unless keep_id is set
+    '''
+    try:
+        logging.info(f"Streaming data from database_name {database_name} and collection {collection_name} in batches of {batch_size}")
+        collection=get_mongo_client()[database_name][collection_name]
+        if keep_id:
+            cursor=collection.find(query or {},batch_size=batch_size).sort("_id",1)
+        else:
+            cursor=collection.find(query or {},{"_id":0},batch_size=batch_size)
+        try:
+            while True:
+                records=list(itertools.islice(cursor,batch_size))
+                if len(records)==0:
+                    break
+                yield schema.cast(pd.DataFrame.from_records(records))
+        finally:
+            cursor.close()
+    except Exception as e:
+        raise SensorException(e,sys)
     
+def get_collection_fingerprint(database_name:str,collection_name:str)->dict:
+    '''
+    Description : Cheap fingerprint of an append only collection, the number of
+    documents and the largest _id, both answered from the _id index
+    ===================================================================
+    Params :
+    database_name : database_name
+    collection_name : collection_name
+    ===================================================================
+    return dict with n_documents and last_id
+    '''
+    try:
+        collection=get_mongo_client()[database_name][collection_name]
+        last_document=collection.find_one({},{"_id":1},sort=[("_id",-1)])
+        return {"n_documents":collection.count_documents({}),
+                "last_id":None if last_document is None else str(last_document["_id"])}
+    except Exception as e:
+        raise SensorException(e, sys)
+
+def get_id_ranges(database_name:str,collection_name:str,n_partitions:int)->List[dict]:
+    '''
+    Description : Splits a collection into contiguous _id ranges of (almost) equal size.
+    Split points are read from the _id index, the last range is closed at the current
+    largest _id so documents inserted during the export are not picked up
+    ===================================================================
+    Params :
+    database_name : database_name
+    collection_name : collection_name
+    n_partitions : number of ranges
+    ===================================================================
+    return list of _id filters, one per non empty range
+    '''
+    try:
+        collection=get_mongo_client()[database_name][collection_name]
+        last_document=collection.find_one({},{"_id":1},sort=[("_id",-1)])
+        if last_document is None:
+            return []
+        n_rows=collection.count_documents({"_id":{"$lte":last_document["_id"]}})
+        n_partitions=max(1,min(n_partitions,n_rows))
+
+        split_ids=[]
+        for partition in range(1,n_partitions):
+            document=collection.find_one({},{"_id":1},sort=[("_id",1)],skip=partition*n_rows//n_partitions)
+            split_ids.append(document["_id"])
+
+        lower_bounds=[None]+split_ids
+        upper_bounds=split_ids+[None]
+        id_ranges=[]
+        for lower_bound,upper_bound in zip(lower_bounds,upper_bounds):
+            id_filter={"$lte":last_document["_id"]} if upper_bound is None else {"$lt":upper_bound}
+            if lower_bound is not None:
+                id_filter["$gte"]=lower_bound
+            id_ranges.append({"_id":id_filter})
+        return id_ranges
+    except Exception as e:
+        raise SensorException(e,sys)
+
+def get_collection_as_dataframe_parallel(database_name:str,collection_name:str,n_workers:int,batch_size:int,
+                                        schema:DatasetSchema=APS_SCHEMA)->pd.DataFrame:
+    '''
+    Description : Exports a collection with n_workers threads, each reading one _id range
+    through the shared mongo client. Workers write their batches straight into one
+    preallocated float32 block so partitions are concatenated without extra copies
+    ===================================================================
+    Params :
+    database_name : database_name
+    collection_name : collection_name
+    n_workers : number of concurrent range readers
+    batch_size : number of documents fetched per round trip
+    schema : declared dtypes every batch is cast to
+    ===================================================================
+    return typed pandas dataframe of the collection (float32 sensor columns, category target)
+    '''
+    try:
+        logging.info(f"Reading data from database_name {database_name} and collection {collection_name} with {n_workers} workers")
+        collection=get_mongo_client()[database_name][collection_name]
+        id_ranges=get_id_ranges(database_name=database_name,collection_name=collection_name,n_partitions=n_workers)
+        if len(id_ranges)==0:
+            raise Exception(f"No records found in collection {collection_name}")
+
+        first_document=collection.find_one({},{"_id":0})
+        feature_columns=[column for column in first_document if column!=schema.target_column]
+        range_sizes=[collection.count_documents(id_range) for id_range in id_ranges]
+        offsets=np.concatenate([[0],np.cumsum(range_sizes)])
+        features=np.empty((offsets[-1],len(feature_columns)),dtype=schema.feature_dtype)
+        target=np.empty(offsets[-1],dtype=object)
+
+        def read_range(partition:int)->int:
+            n_filled=0
+            offset=offsets[partition]
+            cursor=collection.find(id_ranges[partition],{"_id":0},batch_size=batch_size).limit(range_sizes[partition])
+            try:
+                while True:
+                    records=list(itertools.islice(cursor,batch_size))
+                    if len(records)==0:
+                        return n_filled
+                    df=schema.cast(pd.DataFrame.from_records(records,columns=[schema.target_column]+feature_columns))
+                    features[offset+n_filled:offset+n_filled+len(df)]=df[feature_columns].to_numpy()
+                    target[offset+n_filled:offset+n_filled+len(df)]=df[schema.target_column].to_numpy()
+                    n_filled+=len(df)
+            finally:
+                cursor.close()
+
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            n_filled=list(executor.map(read_range,range(len(id_ranges))))
+
+        if n_filled!=range_sizes:
+            # documents were deleted while exporting, keep only the rows that were read
+            logging.info(f"Expected {range_sizes} rows per range but read {n_filled}")
+            keep=np.concatenate([np.arange(offsets[i],offsets[i]+n_filled[i]) for i in range(len(id_ranges))])
+            features,target=features[keep],target[keep]
+
+        df=pd.DataFrame(features,columns=feature_columns,copy=False)
+        df.insert(0,schema.target_column,pd.Series(target).astype(schema.get_dtypes()[schema.target_column]))
+        logging.info(f"The shape of the data is {df.shape}")
+        return df
+    except Exception as e:
+        raise SensorException(e,sys)
+
+def replace_file(file_path:str,write:Callable[[str],None])->None:
+    '''
+    Description : Writes a file through a temporary file renamed over it. Artifact files
+    may be hard links to blob store objects (see sensor.blob_store), they must be
+    replaced and never rewritten in place
+    ===================================================================
+    Params :
+    file_path : destination file
+    write : writes the content to the path it is given
+    ===================================================================
+    '''
+    tmp_file_path=f"{file_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        write(tmp_file_path)
+        os.replace(tmp_file_path,file_path)
+    except BaseException:
+        if os.path.exists(tmp_file_path):
+            os.remove(tmp_file_path)
+        raise
+
 def write_yaml_file(file_path,data:dict):
     try:
         file_dir = os.path.dirname(file_path)
         os.makedirs(file_dir,exist_ok=True)
-        with open(file_path,"w") as file_writer:
-            yaml.dump(data,file_writer)
+        def write(tmp_file_path:str)->None:
+            with open(tmp_file_path,"w") as file_writer:
+                yaml.dump(data,file_writer)
+        replace_file(file_path,write)
+    except Exception as e:
+        raise SensorException(e, sys)
+
+def read_yaml_file(file_path)->dict:
+    try:
+        with open(file_path,"r") as file_reader:
+            return yaml.safe_load(file_reader)
+    except Exception as e:
+        raise SensorException(e, sys)
+
+def get_file_format(file_path:str)->str:
+    file_format=os.path.splitext(file_path)[1].lstrip(".")
+    if file_format not in FILE_FORMATS:
+        raise Exception(f"Unsupported file format [{file_format}] for {file_path}, expected one of {list(FILE_FORMATS)}")
+    return file_format
+
+def _read_csv(file_path:str,schema:DatasetSchema)->pd.DataFrame:
+    return schema.read_csv(file_path)
+
+def _read_parquet(file_path:str,schema:DatasetSchema)->pd.DataFrame:
+    return schema.cast(pd.read_parquet(file_path))
+
+def _write_parquet(df:pd.DataFrame,file_path:str)->None:
+    df.to_parquet(file_path,index=False)
+
+def _write_csv(df:pd.DataFrame,file_path:str)->None:
+    df.to_csv(file_path,index=False,header=True)
+
+# reader and writer for every supported feature store format, picked by file extension
+FILE_FORMATS={
+    "csv":(_read_csv,_write_csv),
+    "parquet":(_read_parquet,_write_parquet),
+}
+
+def write_dataset(df:pd.DataFrame,file_path:str)->None:
+    '''
+    Description : Writes a dataframe in the format given by the file extension (csv or parquet)
+    ===================================================================
+    Params :
+    df : dataframe to write
+    file_path : destination file
+    ===================================================================
+    '''
+    try:
+        os.makedirs(os.path.dirname(file_path),exist_ok=True)
+        _,writer=FILE_FORMATS[get_file_format(file_path)]
+        replace_file(file_path,lambda tmp_file_path:writer(df,tmp_file_path))
+    except Exception as e:
+        raise SensorException(e, sys)
+
+def read_dataset(file_path:str,schema:DatasetSchema=APS_SCHEMA)->pd.DataFrame:
+    '''
+    Description : Reads a dataset stored either as a single file or as a directory
+    of partitions which are read as one logical dataset. The format of every file
+    is given by its extension (csv or parquet) and columns are parsed into the
+    dtypes declared by the schema
+    ===================================================================
+    Params :
+    file_path : dataset file or partition directory
+    schema : declared columns, dtypes and missing value strings
+    ===================================================================
+    return Pandas dataframe
+    '''
+    try:
+        if not os.path.isdir(file_path):
+            reader,_=FILE_FORMATS[get_file_format(file_path)]
+            return reader(file_path,schema)
+        partition_paths=get_partition_paths(file_path)
+        logging.info(f"Reading {len(partition_paths)} partitions from {file_path}")
+        return pd.concat([read_dataset(partition_path,schema) for partition_path in partition_paths],ignore_index=True)
+    except Exception as e:
+        raise SensorException(e, sys)
+
+def get_partition_paths(file_path:str)->List[str]:
+    '''
+    Description : Lists the files of a dataset, a single file is its own partition
+    ===================================================================
+    Params :
+    file_path : dataset file or partition directory
+    ===================================================================
+    return sorted list of partition file paths
+    '''
+    try:
+        if not os.path.isdir(file_path):
+            return [file_path]
+        partition_paths=sorted(glob.glob(os.path.join(file_path,"part-*.*")))
+        if len(partition_paths)==0:
+            raise Exception(f"No partitions found in {file_path}")
+        return partition_paths
+    except Exception as e:
+        raise SensorException(e, sys)
+
+def iter_dataset_batches(file_path:str,batch_size:int,schema:DatasetSchema=APS_SCHEMA)->Iterator[pd.DataFrame]:
+    '''
+    Description : Reads a dataset file or partition directory in chunks of at most
+    batch_size rows parsed into the dtypes declared by the schema
+    ===================================================================
+    Params :
+    file_path : dataset file or partition directory
+    batch_size : number of rows per chunk
+    schema : declared columns, dtypes and missing value strings
+    ===================================================================
+    yields pandas dataframes
+    '''
+    try:
+        for partition_path in get_partition_paths(file_path):
+            if get_file_format(partition_path)=="csv":
+                with schema.read_csv(partition_path,chunksize=batch_size) as reader:
+                    yield from reader
+            else:
+                import pyarrow.parquet as pq
+                for batch in pq.ParquetFile(partition_path).iter_batches(batch_size=batch_size):
+                    yield schema.cast(batch.to_pandas())
     except Exception as e:
         raise SensorException(e, sys)
 
+def export_dataset_to_csv(file_path:str,csv_file_path:str)->None:
+    '''
+    Description : Exports a parquet dataset to csv one row group at a time
+    ===================================================================
+    Params :
+    file_path : parquet file
+    csv_file_path : destination csv file
+    ===================================================================
+    '''
+    try:
+        import pyarrow.parquet as pq
+        with DatasetWriter(csv_file_path) as writer:
+            for batch in pq.ParquetFile(file_path).iter_batches():
+                writer.write(batch.to_pandas())
+    except Exception as e:
+        raise SensorException(e, sys)
+
+class DatasetWriter:
+    """
+    Appends dataframes batch by batch to a csv or parquet file, parquet batches are
+    written as row groups of a single file. Batches go to a temporary file which
+    replaces file_path when the writer is closed, and is removed when the block
+    writing it fails
+    """
+    def __init__(self,file_path:str):
+        try:
+            self.file_path=file_path
+            self.file_format=get_file_format(file_path)
+            self.tmp_file_path=f"{file_path}.{uuid.uuid4().hex}.tmp"
+            self.n_rows=0
+            self.parquet_writer=None
+            os.makedirs(os.path.dirname(file_path),exist_ok=True)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def write(self,df:pd.DataFrame)->None:
+        try:
+            if self.file_format=="csv":
+                df.to_csv(self.tmp_file_path,mode='w' if self.n_rows==0 else 'a',index=False,header=self.n_rows==0)
+            else:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+                if self.parquet_writer is None:
+                    table=pa.Table.from_pandas(df,preserve_index=False)
+                    self.parquet_writer=pq.ParquetWriter(self.tmp_file_path,table.schema)
+                else:
+                    table=pa.Table.from_pandas(df,schema=self.parquet_writer.schema,preserve_index=False)
+                self.parquet_writer.write_table(table)
+            self.n_rows+=len(df)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def close(self)->None:
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+            self.parquet_writer=None
+        if os.path.exists(self.tmp_file_path):
+            os.replace(self.tmp_file_path,self.file_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        if exc_type is None:
+            self.close()
+            return
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+            self.parquet_writer=None
+        if os.path.exists(self.tmp_file_path):
+            os.remove(self.tmp_file_path)
+
 def convert_columns_float(df:pd.DataFrame,exclude_columns:list)->pd.DataFrame:
     try:
         for column in df.columns:
@@ -54,8 +422,10 @@ def save_object(file_path: str, obj: object) -> None:
     try:
         logging.info("Entered the save_object method of utils")
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        with open(file_path, "wb") as file_obj:
-            dill.dump(obj, file_obj)
+        def write(tmp_file_path:str)->None:
+            with open(tmp_file_path, "wb") as file_obj:
+                dill.dump(obj, file_obj)
+        replace_file(file_path,write)
         logging.info("Exited the save_object method of utils")
     except Exception as e:
         raise SensorException(e, sys) from e
@@ -79,8 +449,10 @@ def save_numpy_array_data(file_path: str, array: np.array):
     try:
         dir_path = os.path.dirname(file_path)
         os.makedirs(dir_path, exist_ok=True)
-        with open(file_path, "wb") as file_obj:
-            np.save(file_obj, array)
+        def write(tmp_file_path:str)->None:
+            with open(tmp_file_path, "wb") as file_obj:
+                np.save(file_obj, array)
+        replace_file(file_path,write)
     except Exception as e:
         raise SensorException(e, sys) from e
     
@@ -96,4 +468,48 @@ def load_numpy_array_data(file_path: str) -> np.array:
         with open(file_path, "rb") as file_obj:
             return np.load(file_obj)
     except Exception as e:
-        raise SensorException(e, sys) from e
\ No newline at end of file
+        raise SensorException(e, sys) from e
+
+def save_numpy_array_mmap(file_path:str,array:np.ndarray)->None:
+    """
+    Save an array as a C ordered .npy file which np.load can memory map. The data is
+    written through a memory map, so no C ordered copy is made in memory
+    file_path: str location of file to save
+    array: np.array data to save
+    """
+    try:
+        os.makedirs(os.path.dirname(file_path),exist_ok=True)
+        def write(tmp_file_path:str)->None:
+            mmap_array=np.lib.format.open_memmap(tmp_file_path,mode="w+",dtype=array.dtype,shape=array.shape)
+            mmap_array[...]=array
+            mmap_array.flush()
+            del mmap_array
+        replace_file(file_path,write)
+    except Exception as e:
+        raise SensorException(e, sys) from e
+
+def load_numpy_array_mmap(file_path:str)->np.ndarray:
+    """
+    Read only memory map of a .npy file, pages are read from disk on first access
+    file_path: str location of file to load
+    """
+    try:
+        return np.load(file_path,mmap_mode="r")
+    except Exception as e:
+        raise SensorException(e, sys) from e
+
+def load_feature_target_arrays(file_path:str,target_file_path:Optional[str]=None)->tuple:
+    """
+    Load features and labels. With target_file_path both are memory mapped .npy
+    files, otherwise file_path holds a single matrix with the label as last column
+    file_path: str features file or combined file
+    target_file_path: str labels file
+    return: (features, target)
+    """
+    try:
+        if target_file_path is not None:
+            return load_numpy_array_mmap(file_path),load_numpy_array_mmap(target_file_path)
+        data=load_numpy_array_data(file_path)
+        return data[:,:-1],data[:,-1].astype(np.uint8)
+    except Exception as e:
+        raise SensorException(e, sys) from e
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+from scipy.stats import ks_2samp
+
+from sensor import drift
+
+
+def get_samples(seed:int=0):
+    random_state=np.random.default_rng(seed)
+    base=np.column_stack([random_state.normal(0,1,3000),
+                          random_state.exponential(2,3000),
+                          np.round(random_state.normal(0,1,3000),1),
+                          random_state.integers(0,5,3000).astype(float)])
+    current=np.column_stack([random_state.normal(0.1,1,2000),
+                             random_state.exponential(2.2,2000),
+                             np.round(random_state.normal(0,1.1,2000),1),
+                             random_state.integers(0,6,2000).astype(float)])
+    return base,current
+
+
+def test_ks_2samp_columns_matches_scipy():
+    base,current=get_samples()
+    statistics,pvalues=drift.ks_2samp_columns(base,current,block_size=3)
+    for i in range(base.shape[1]):
+        expected=ks_2samp(base[:,i],current[:,i],method="asymp")
+        assert statistics[i]==pytest.approx(expected.statistic,abs=1e-12)
+        assert pvalues[i]==pytest.approx(expected.pvalue,rel=1e-9,abs=1e-300)
+
+
+def test_ks_2samp_columns_ignores_missing_values():
+    base,current=get_samples(seed=1)
+    base[::7,0]=np.nan
+    current[::5,0]=np.nan
+    current[:,1]=np.nan
+    statistics,pvalues=drift.ks_2samp_columns(base,current)
+    expected=ks_2samp(base[~np.isnan(base[:,0]),0],current[~np.isnan(current[:,0]),0],method="asymp")
+    assert statistics[0]==pytest.approx(expected.statistic,abs=1e-12)
+    assert pvalues[0]==pytest.approx(expected.pvalue,rel=1e-9,abs=1e-300)
+    assert np.isnan(statistics[1]) and np.isnan(pvalues[1])
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+from sensor.inference import FastTransformer
+from sensor.components.data_transformation import DataTransformation
+
+
+def get_fitted_pipeline(seed:int=0):
+    random_state=np.random.default_rng(seed)
+    values=random_state.lognormal(2,1.5,(500,6)).astype(np.float32)
+    values[random_state.random(values.shape)<0.2]=np.nan
+    df=pd.DataFrame(values,columns=[f"s_{i}" for i in range(values.shape[1])])
+    pipeline=DataTransformation.get_data_transformer_object()
+    pipeline.fit(df)
+    return pipeline,df
+
+
+def test_fast_transformer_matches_pipeline():
+    pipeline,df=get_fitted_pipeline()
+    expected=pipeline.transform(df)
+    actual=FastTransformer.from_pipeline(pipeline).transform(df)
+    assert actual.shape==expected.shape
+    assert np.array_equal(actual,expected,equal_nan=True)
+
+
+def test_fast_transformer_reorders_columns():
+    pipeline,df=get_fitted_pipeline(seed=1)
+    expected=pipeline.transform(df)
+    shuffled=df[list(reversed(df.columns))]
+    transformer=FastTransformer.from_pipeline(pipeline)
+    assert np.array_equal(transformer.transform(shuffled),expected,equal_nan=True)
+    assert np.array_equal(transformer.transform(shuffled.to_numpy(),columns=list(shuffled.columns)),expected,equal_nan=True)
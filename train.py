@@ -1,3 +1,4 @@
+import argparse
 
 from sensor.pipeline.training_pipeline import start_training_pipeline
 
@@ -5,7 +6,10 @@ from sensor.pipeline.training_pipeline import start_training_pipeline
 file_path="/config/workspace/aps_failure_training_set1.csv"
 print(__name__)
 if __name__=="__main__":
+    parser=argparse.ArgumentParser()
+    parser.add_argument("--force",action="store_true",help="re-run every stage instead of reusing cached artifacts")
+    args=parser.parse_args()
     try:
-        start_training_pipeline()
+        start_training_pipeline(force=args.force)
     except Exception as e:
         print(e)
\ No newline at end of file